@@ -0,0 +1,154 @@
+"""
+Microbenchmark del costo por petición del gateway (sin llamar a ningún servicio).
+
+Mide una petición GET /api/reservas servida desde la caché de respuestas con
+el token ya verificado, llamando directamente a la aplicación WSGI: todo el
+tiempo medido es overhead del gateway (hooks, autenticación, caché, CORS y
+logging). También compara las piezas individuales con su versión anterior.
+
+Ejecutar desde api_gateway/:
+    python benchmarks/bench_middleware.py
+
+Para comparar con otra versión del gateway (p. ej. un checkout anterior):
+    BENCH_GATEWAY_DIR=/ruta/al/checkout/api_gateway python benchmarks/bench_middleware.py
+
+Referencia (petición completa, 8 corridas intercaladas, mínimo / mediana):
+    antes de las tablas precompiladas y el log muestreado   151.4 / 181.7 µs
+    con las tablas precompiladas y el log muestreado        137.4 / 151.7 µs
+"""
+import logging
+import os
+import sys
+import timeit
+
+GATEWAY_DIR = os.getenv('BENCH_GATEWAY_DIR', os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, GATEWAY_DIR)
+
+os.environ.setdefault('HEALTH_REFRESH_INTERVAL', '0')
+os.environ.setdefault('RESPONSE_CACHE_TTLS', '/api/reservas=3600')
+
+import gateway  # noqa: E402
+from werkzeug.datastructures import Headers  # noqa: E402
+from werkzeug.test import EnvironBuilder  # noqa: E402
+
+# Los logs van a /dev/null: se mide su costo de formateo, no la terminal
+_handlers = list(logging.getLogger().handlers)
+if getattr(gateway, '_log_listener', None) is not None:
+    _handlers += list(gateway._log_listener.handlers)
+for handler in _handlers:
+    if isinstance(handler, logging.StreamHandler):
+        handler.setStream(open(os.devnull, 'w'))
+
+N = int(os.getenv('BENCH_ITERATIONS', 20000))
+TOKEN = 'bench-token'
+AUTH = f'Bearer {TOKEN}'
+
+# ------------------------------------------
+# Implementaciones anteriores (referencia)
+# ------------------------------------------
+
+LEGACY_PUBLIC_ROUTES = ['/api/auth/login', '/api/auth/register', '/health', '/api/health']
+LEGACY_IDENTITY_HEADERS = {'x-user-id', 'x-user-email', 'x-user-role'}
+
+
+def legacy_is_public(path):
+    return any(path.startswith(route) for route in LEGACY_PUBLIC_ROUTES)
+
+
+def legacy_filter_headers(items):
+    return {
+        key: value for key, value in items
+        if key.lower() not in ['host', 'connection', 'content-length']
+        and key.lower() not in LEGACY_IDENTITY_HEADERS
+    }
+
+
+def legacy_prefix_rule(rules, path):
+    for prefix, value in rules:
+        if path == prefix or path.startswith(prefix + '/'):
+            return prefix, value
+    return None, None
+
+
+LEGACY_RATE_RULES = [
+    ('/api/notifications/send_reservation_notification', (1, 5)),
+    ('/api/reports', (2, 10)),
+    ('/api', (50, 100)),
+]
+
+# ------------------------------------------
+# Medición
+# ------------------------------------------
+
+def bench(label, fn, number=N):
+    seconds = min(timeit.repeat(fn, number=number, repeat=5))
+    print(f'{label:<48} {seconds / number * 1e6:9.2f} µs')
+
+
+def warm_caches():
+    gateway.TOKEN_CACHE.put(TOKEN, {'id': 1, 'email': 'bench@example.com', 'role': 'usuario'})
+    prefix, ttl = gateway.RESPONSE_CACHE.route_rule('/api/reservas')
+    key = gateway.RESPONSE_CACHE.key(prefix, '/api/reservas', '', AUTH)
+    gateway.RESPONSE_CACHE.store(key, gateway.CachedResponse(
+        200, {'Content-Type': 'application/json'}, b'{"data": []}', ttl
+    ))
+
+
+def full_request(environ):
+    status = []
+
+    def start_response(s, headers, exc_info=None):
+        status.append(s)
+
+    body = gateway.app(dict(environ), start_response)
+    b''.join(body)
+    if hasattr(body, 'close'):
+        body.close()
+    return status[0]
+
+
+def record_metrics(registry):
+    registry.start_request()
+    registry.observe_upstream('reservations', 0.004)
+    registry.observe_request('/api/reservas', 'GET', 200, 0, 512)
+
+
+def main():
+    warm_caches()
+    environ = EnvironBuilder(
+        path='/api/reservas',
+        headers={'Authorization': AUTH, 'Accept': 'application/json', 'User-Agent': 'bench'}
+    ).get_environ()
+    assert full_request(environ).startswith('200')
+
+    request_items = [
+        ('Host', 'localhost:3000'), ('Connection', 'keep-alive'), ('Content-Length', '0'),
+        ('Authorization', AUTH), ('Accept', 'application/json'), ('User-Agent', 'bench'),
+        ('Accept-Encoding', 'gzip, deflate'), ('Accept-Language', 'es-CO'),
+    ]
+
+    print(f'Gateway: {os.path.abspath(gateway.__file__)}')
+    print(f'Iteraciones: {N}')
+    bench('Petición completa WSGI (GET /api/reservas, HIT)', lambda: full_request(environ), N // 4)
+
+    # Las piezas nuevas solo existen desde la versión con tablas precompiladas
+    if not hasattr(gateway, 'PrefixTable'):
+        return
+
+    bench('Rutas públicas: any(startswith)', lambda: legacy_is_public('/api/reservas/15'))
+    bench('Rutas públicas: startswith(tupla)', lambda: gateway.is_public_route('/api/reservas/15'))
+    bench('Filtro de headers: listas', lambda: legacy_filter_headers(request_items))
+    bench('Filtro de headers: frozenset', lambda: gateway.forward_headers(request_items))
+    bench('CORS: Headers.update', lambda: Headers().update(gateway.CORS_HEADERS))
+    bench('CORS: asignación por clave (apply_cors)', lambda: gateway.apply_cors(Headers()))
+    bench('Regla de rate limit: lista ordenada', lambda: legacy_prefix_rule(LEGACY_RATE_RULES, '/api/reports/excel/'))
+    bench('Regla de rate limit: PrefixTable', lambda: gateway.RATE_LIMITER.rule_for('/api/reports/excel/'))
+
+    if hasattr(gateway, 'MetricsRegistry'):
+        # Un registro ya poblado, como en producción: no se mide la creación de histogramas
+        registry = gateway.MetricsRegistry(gateway.METRICS_LATENCY_BUCKETS)
+        bench('Métricas: registro completo de una petición', lambda: record_metrics(registry))
+
+
+if __name__ == '__main__':
+    main()
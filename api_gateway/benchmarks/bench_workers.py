@@ -0,0 +1,182 @@
+"""
+Throughput del gateway bajo gunicorn según el número de workers.
+
+Levanta un servicio de prueba local (auth + reservas), arranca gunicorn con
+gunicorn.conf.py para cada número de workers de BENCH_WORKERS y lo carga con
+BENCH_CLIENTS procesos cliente con conexiones keep-alive durante
+BENCH_DURATION segundos. Las peticiones son GET /api/reservas servidas desde
+la caché del gateway, así que se mide el costo del gateway y no el del servicio.
+
+Ejecutar desde api_gateway/ (requiere gunicorn):
+    python benchmarks/bench_workers.py
+    BENCH_WORKERS=1,2,4,8 BENCH_CLIENTS=8 python benchmarks/bench_workers.py
+
+Los clientes compiten por la CPU con el gateway: en una máquina de N núcleos
+la escala deja de crecer antes de N workers. Para medir solo el servidor,
+ejecute los clientes desde otra máquina (BENCH_TARGET=http://host:puerto).
+"""
+import http.client
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+GATEWAY_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+WORKER_COUNTS = [int(n) for n in os.getenv('BENCH_WORKERS', '1,2,4').split(',')]
+THREADS = int(os.getenv('BENCH_THREADS', 4))
+CLIENTS = int(os.getenv('BENCH_CLIENTS', max(multiprocessing.cpu_count(), 2)))
+DURATION = float(os.getenv('BENCH_DURATION', 5))
+TARGET = os.getenv('BENCH_TARGET')
+AUTH = 'Bearer bench-token'
+
+# ------------------------------------------
+# Servicio de prueba
+# ------------------------------------------
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        if self.path.startswith('/api/me'):
+            body = json.dumps({'success': True, 'data': {'user': {'id': 1, 'email': 'bench@example.com', 'role': 'usuario'}}})
+        elif self.path == '/health':
+            body = json.dumps({'status': 'healthy'})
+        else:
+            body = json.dumps({'data': [{'id': i, 'estado': 'confirmada'} for i in range(20)]})
+        payload = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_upstream():
+    server = ThreadingHTTPServer(('127.0.0.1', free_port()), UpstreamHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'http://127.0.0.1:{server.server_address[1]}'
+
+# ------------------------------------------
+# Gateway bajo gunicorn
+# ------------------------------------------
+
+def start_gateway(workers, upstream_url):
+    port = free_port()
+    env = dict(
+        os.environ,
+        PORT=str(port),
+        GUNICORN_WORKERS=str(workers),
+        GUNICORN_THREADS=str(THREADS),
+        ACCESS_LOG_SAMPLE_RATE='0',
+        HEALTH_REFRESH_INTERVAL='0',
+        RATE_LIMIT_ENABLED='False',
+        RESPONSE_CACHE_TTLS='/api/reservas=3600',
+        AUTH_SERVICE_URL=upstream_url,
+        RESERVATION_SERVICE_URL=upstream_url,
+        NOTIFICATIONS_SERVICE_URL=upstream_url,
+        REPORTS_SERVICE_URL=upstream_url,
+        AUDIT_SERVICE_URL=upstream_url
+    )
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{port}', 'gateway:app'],
+        cwd=GATEWAY_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.2):
+                return process, f'http://127.0.0.1:{port}'
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError('gunicorn no arrancó')
+
+
+def stop_gateway(process):
+    process.terminate()
+    process.wait(timeout=30)
+
+# ------------------------------------------
+# Carga
+# ------------------------------------------
+
+def client_loop(target, duration, results):
+    parts = urlsplit(target)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=10)
+    headers = {'Authorization': AUTH}
+    count = errors = 0
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        try:
+            conn.request('GET', '/api/reservas', headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status == 200:
+                count += 1
+            else:
+                errors += 1
+        except (OSError, http.client.HTTPException):
+            errors += 1
+            conn.close()
+            conn = http.client.HTTPConnection(parts.hostname, parts.port, timeout=10)
+    conn.close()
+    results.put((count, errors))
+
+
+def run_load(target):
+    # Calentamiento: cada worker verifica el token y llena su caché
+    client_loop(target, 1.0, multiprocessing.Queue())
+
+    results = multiprocessing.Queue()
+    clients = [
+        multiprocessing.Process(target=client_loop, args=(target, DURATION, results))
+        for _ in range(CLIENTS)
+    ]
+    for client in clients:
+        client.start()
+    totals = [results.get() for _ in clients]
+    for client in clients:
+        client.join()
+    return sum(count for count, _ in totals) / DURATION, sum(errors for _, errors in totals)
+
+
+def main():
+    print(f'Núcleos: {multiprocessing.cpu_count()}  clientes: {CLIENTS}  hilos por worker: {THREADS}  duración: {DURATION}s')
+
+    if TARGET:
+        throughput, errors = run_load(TARGET)
+        print(f'{TARGET}: {throughput:10.0f} req/s  errores: {errors}')
+        return
+
+    upstream_url = start_upstream()
+    print(f'{"workers":>8} {"req/s":>10} {"escala":>8} {"eficiencia":>11} {"errores":>8}')
+    baseline = None
+    for workers in WORKER_COUNTS:
+        process, target = start_gateway(workers, upstream_url)
+        try:
+            throughput, errors = run_load(target)
+        finally:
+            stop_gateway(process)
+        baseline = baseline or throughput
+        speedup = throughput / baseline if baseline else 0
+        print(f'{workers:>8} {throughput:>10.0f} {speedup:>7.2f}x {speedup / workers * WORKER_COUNTS[0]:>10.0%} {errors:>8}')
+
+
+if __name__ == '__main__':
+    main()
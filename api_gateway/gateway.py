@@ -1,9 +1,23 @@
-from flask import Flask, request, jsonify, Response
+from flask import Flask, request, jsonify, Response, g
 import requests
+from requests.adapters import HTTPAdapter
+from requests.structures import CaseInsensitiveDict
 import os
+import threading
+import time
+import bisect
+import gzip
+import hashlib
+import json
+import math
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 from functools import wraps
 import logging
+import logging.handlers
+import queue
+import random
 from werkzeug.exceptions import HTTPException
 
 # ==========================================
@@ -16,6 +30,35 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Fracción de peticiones que generan línea de acceso (1.0 = todas); los 5xx se registran siempre
+ACCESS_LOG_SAMPLE_RATE = float(os.getenv('ACCESS_LOG_SAMPLE_RATE', 0.1))
+ACCESS_LOG_ASYNC = os.getenv('ACCESS_LOG_ASYNC', 'True') == 'True'
+
+_log_listener = None
+_log_listener_pid = None
+
+
+def start_log_listener():
+    """Escribe los logs desde un hilo aparte para no bloquear las peticiones (una vez por proceso)"""
+    global _log_listener, _log_listener_pid
+    if not ACCESS_LOG_ASYNC or _log_listener_pid == os.getpid():
+        return
+
+    root = logging.getLogger()
+    if _log_listener is None:
+        handlers = list(root.handlers)
+    else:
+        # Proceso hijo tras fork: el hilo del padre no existe, se reutilizan sus handlers
+        handlers = list(_log_listener.handlers)
+    log_queue = queue.SimpleQueue()
+    root.handlers = [logging.handlers.QueueHandler(log_queue)]
+    _log_listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _log_listener.start()
+    _log_listener_pid = os.getpid()
+
+
+start_log_listener()
+
 app = Flask(__name__)
 
 # ==========================================
@@ -39,83 +82,1647 @@ PUBLIC_ROUTES = [
     '/api/health'
 ]
 
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization',
+    'Access-Control-Allow-Methods': 'GET, POST, PUT, DELETE, PATCH, OPTIONS'
+}
+
+# ==========================================
+# TABLAS DE RUTAS PRECOMPILADAS
+# ==========================================
+
+# str.startswith con tupla: una sola llamada en C en vez de un any() en Python
+PUBLIC_ROUTE_PREFIXES = tuple(PUBLIC_ROUTES)
+
+
+class PrefixTable:
+    """Reglas por prefijo de ruta compiladas en un dict: la más específica se encuentra
+    con una consulta por segmento de la ruta y se memoriza para las siguientes peticiones"""
+
+    MEMO_SIZE = 4096
+    MISSING = (None, None)
+
+    def __init__(self, rules):
+        self.rules = {prefix.rstrip('/'): value for prefix, value in rules.items()}
+        self._memo = {}
+
+    def lookup(self, path):
+        """Devuelve (prefijo, valor) de la regla más larga que cubre la ruta, o (None, None)"""
+        found = self._memo.get(path)
+        if found is not None:
+            return found
+
+        found = self.MISSING
+        rules = self.rules
+        if path in rules:
+            found = (path, rules[path])
+        else:
+            end = len(path)
+            while end > 0:
+                end = path.rfind('/', 0, end)
+                prefix = path[:end]
+                if prefix in rules:
+                    found = (prefix, rules[prefix])
+                    break
+
+        # Rutas con ids no tienen límite: la memoria se vacía al llenarse
+        if len(self._memo) >= self.MEMO_SIZE:
+            self._memo.clear()
+        self._memo[path] = found
+        return found
+
+    def items(self):
+        return self.rules.items()
+
+# ==========================================
+# MÉTRICAS (FORMATO PROMETHEUS)
+# ==========================================
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'True') == 'True'
+# Límites superiores (segundos) de los buckets de latencia
+METRICS_LATENCY_BUCKETS = tuple(sorted(
+    float(bound) for bound in os.getenv(
+        'METRICS_LATENCY_BUCKETS', '0.0005,0.001,0.0025,0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30'
+    ).split(',') if bound.strip()
+))
+# Directorio compartido por los workers de gunicorn: /metrics suma los contadores de todos
+METRICS_MULTIPROC_DIR = os.getenv('METRICS_MULTIPROC_DIR', '')
+# Cada cuánto vuelca cada worker sus contadores al directorio (s)
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 5))
+
+
+class Histogram:
+    """Histograma de buckets fijos; el bucket se encuentra con bisect"""
+
+    __slots__ = ('bounds', 'counts', 'sum', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self):
+        """(límite, conteo acumulado) por bucket, terminando en +Inf"""
+        total = 0
+        for bound, count in zip(self.bounds + (math.inf,), self.counts):
+            total += count
+            yield bound, total
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{name}="{label_value(value)}"' for name, value in labels) + '}'
+
+
+def format_number(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsRegistry:
+    """Contadores e histogramas en memoria del proceso; un solo lock corto por observación"""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._timing = threading.local()
+        self.in_flight = 0
+        self.requests = {}          # (ruta, método, status) -> peticiones
+        self.request_bytes = {}     # ruta -> bytes recibidos
+        self.response_bytes = {}    # ruta -> bytes enviados
+        self.request_latency = {}   # ruta -> Histogram (tiempo total)
+        self.overhead_latency = {}  # ruta -> Histogram (tiempo propio del gateway)
+        self.upstream_latency = {}  # servicio -> Histogram
+        self.upstream_errors = {}   # servicio -> llamadas sin respuesta
+        self.compressed = {}        # codificación -> (respuestas, bytes originales, bytes enviados)
+
+    def _histogram(self, table, key):
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram(self.buckets)
+        return histogram
+
+    def start_request(self):
+        timing = self._timing
+        timing.start = time.perf_counter()
+        timing.upstream = 0.0
+        with self._lock:
+            self.in_flight += 1
+
+    def add_upstream_time(self, seconds):
+        """Suma tiempo de espera al servicio a la petición en curso de este hilo"""
+        timing = self._timing
+        timing.upstream = getattr(timing, 'upstream', 0.0) + seconds
+
+    def observe_upstream(self, service_name, seconds, failed=False):
+        self.add_upstream_time(seconds)
+        with self._lock:
+            if failed:
+                self.upstream_errors[service_name] = self.upstream_errors.get(service_name, 0) + 1
+            else:
+                self._histogram(self.upstream_latency, service_name).observe(seconds)
+
+    def observe_compression(self, encoding, original, compressed):
+        with self._lock:
+            count, before, after = self.compressed.get(encoding, (0, 0, 0))
+            self.compressed[encoding] = (count + 1, before + original, after + compressed)
+
+    def observe_request(self, route, method, status, request_bytes, response_bytes):
+        timing = self._timing
+        start = getattr(timing, 'start', None)
+        if start is None:
+            return
+        total = time.perf_counter() - start
+        overhead = max(total - timing.upstream, 0.0)
+        timing.start = None
+
+        key = (route, method, status)
+        with self._lock:
+            self.in_flight -= 1
+            self.requests[key] = self.requests.get(key, 0) + 1
+            self.request_bytes[route] = self.request_bytes.get(route, 0) + request_bytes
+            self.response_bytes[route] = self.response_bytes.get(route, 0) + response_bytes
+            self._histogram(self.request_latency, route).observe(total)
+            self._histogram(self.overhead_latency, route).observe(overhead)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'in_flight': self.in_flight,
+                'requests': dict(self.requests),
+                'request_bytes': dict(self.request_bytes),
+                'response_bytes': dict(self.response_bytes),
+                'upstream_errors': dict(self.upstream_errors),
+                'compressed': dict(self.compressed),
+                'histograms': {
+                    name: {key: (tuple(h.cumulative()), h.sum, h.count) for key, h in table.items()}
+                    for name, table in (
+                        ('request', self.request_latency),
+                        ('overhead', self.overhead_latency),
+                        ('upstream', self.upstream_latency)
+                    )
+                }
+            }
+
+
+class MetricsWriter:
+    """Acumula líneas en formato de exposición de texto de Prometheus"""
+
+    def __init__(self):
+        self.lines = []
+
+    def family(self, name, kind, help_text):
+        self.lines.append(f'# HELP {name} {help_text}')
+        self.lines.append(f'# TYPE {name} {kind}')
+
+    def sample(self, name, value, labels=()):
+        self.lines.append(f'{name}{format_labels(labels)} {format_number(value)}')
+
+    def metric(self, name, kind, help_text, samples):
+        """samples: iterable de (labels, valor)"""
+        self.family(name, kind, help_text)
+        for labels, value in samples:
+            self.sample(name, value, labels)
+
+    def histogram(self, name, help_text, label_name, histograms):
+        self.family(name, 'histogram', help_text)
+        for key, (buckets, total, count) in sorted(histograms.items()):
+            labels = ((label_name, key),)
+            for bound, cumulative in buckets:
+                self.sample(f'{name}_bucket', cumulative, labels + (('le', format_number(bound)),))
+            self.sample(f'{name}_sum', total, labels)
+            self.sample(f'{name}_count', count, labels)
+
+    def render(self):
+        return '\n'.join(self.lines) + '\n'
+
+
+METRICS = MetricsRegistry(METRICS_LATENCY_BUCKETS)
+
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+class MetricsFiles:
+    """Snapshot de METRICS por worker en un directorio compartido; /metrics los suma.
+
+    Cada worker vuelca sus contadores cada METRICS_FLUSH_INTERVAL y el que atiende
+    el scrape escribe el suyo al momento. Los archivos de workers terminados se
+    conservan para que los contadores no retrocedan (gunicorn.conf.py vacía el
+    directorio al arrancar el master); su in_flight ya no se suma.
+    """
+
+    def __init__(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        self.path = None
+        self._flusher = None
+
+    def start(self):
+        """Se llama en cada worker tras el fork (ver gunicorn.conf.py)"""
+        if not self.directory or (self._flusher is not None and self._flusher.is_alive()):
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        # pid + instante de arranque: un pid reutilizado no pisa los contadores de un worker anterior
+        self.path = os.path.join(self.directory, f'{os.getpid()}-{time.time_ns()}.json')
+        self.write()
+        self._flusher = threading.Thread(target=self._flush_loop, name='metrics-flusher', daemon=True)
+        self._flusher.start()
+
+    def _flush_loop(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.write()
+            except Exception as e:
+                logger.error(f"Error volcando métricas: {e}")
+
+    def write(self):
+        if self.path is None:
+            return
+        snap = METRICS.snapshot()
+        data = {
+            'pid': os.getpid(),
+            'in_flight': snap['in_flight'],
+            'requests': [[route, method, status, count] for (route, method, status), count in snap['requests'].items()],
+            'request_bytes': snap['request_bytes'],
+            'response_bytes': snap['response_bytes'],
+            'upstream_errors': snap['upstream_errors'],
+            'compressed': snap['compressed'],
+            'histograms': {
+                name: [[key, buckets, total, count] for key, (buckets, total, count) in table.items()]
+                for name, table in snap['histograms'].items()
+            }
+        }
+        # Escritura atómica: quien lee nunca ve un archivo a medias
+        tmp = f'{self.path}.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp, self.path)
+
+    def snapshot(self):
+        """Suma de todos los workers, con la misma forma que MetricsRegistry.snapshot()"""
+        if self.path is None:
+            return METRICS.snapshot()
+        self.write()
+
+        merged = {
+            'in_flight': 0, 'requests': {}, 'request_bytes': {}, 'response_bytes': {},
+            'upstream_errors': {}, 'compressed': {},
+            'histograms': {'request': {}, 'overhead': {}, 'upstream': {}}
+        }
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.directory, name)) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+
+            if process_alive(data['pid']):
+                merged['in_flight'] += data['in_flight']
+            for route, method, status, count in data['requests']:
+                key = (route, method, status)
+                merged['requests'][key] = merged['requests'].get(key, 0) + count
+            for field in ('request_bytes', 'response_bytes', 'upstream_errors'):
+                table = merged[field]
+                for key, value in data[field].items():
+                    table[key] = table.get(key, 0) + value
+            for encoding, values in data['compressed'].items():
+                current = merged['compressed'].get(encoding, (0, 0, 0))
+                merged['compressed'][encoding] = tuple(a + b for a, b in zip(current, values))
+            for histogram, rows in data['histograms'].items():
+                table = merged['histograms'][histogram]
+                for key, buckets, total, count in rows:
+                    if key in table:
+                        current, current_total, current_count = table[key]
+                        buckets = [(bound, a + b) for (bound, a), (_, b) in zip(current, buckets)]
+                        total, count = current_total + total, current_count + count
+                    table[key] = (buckets, total, count)
+        return merged
+
+
+METRICS_FILES = MetricsFiles(METRICS_MULTIPROC_DIR, METRICS_FLUSH_INTERVAL)
+
+
+def metrics_route():
+    """Plantilla de la regla de Flask (cardinalidad acotada) en vez de la ruta concreta"""
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+
+if METRICS_ENABLED:
+    # Se registra antes que los demás hooks para medir también las respuestas que ellos cortan;
+    # la observación y el fin de la petición se registran en finish_response
+    @app.before_request
+    def metrics_start():
+        METRICS.start_request()
+
+
+# ==========================================
+# CIRCUIT BREAKER
+# ==========================================
+
+BREAKER_ENABLED = os.getenv('BREAKER_ENABLED', 'True') == 'True'
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 30))
+BREAKER_HALF_OPEN_MAX_CALLS = int(os.getenv('BREAKER_HALF_OPEN_MAX_CALLS', 1))
+# Respuestas del servicio que cuentan como fallo (además de timeouts y errores de conexión)
+BREAKER_FAILURE_STATUSES = {502, 503, 504}
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """El circuito del servicio está abierto: se responde sin llamar al servicio"""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f'Circuito abierto para {name}')
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """Abre el circuito tras N fallos seguidos y lo prueba de nuevo pasado BREAKER_RESET_TIMEOUT"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name):
+        self.name = name
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+        self.times_opened = 0
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def retry_after(self):
+        return max(0.0, BREAKER_RESET_TIMEOUT - (time.monotonic() - self.opened_at))
+
+    def allow_request(self):
+        if not BREAKER_ENABLED:
+            return True
+        with self._lock:
+            if self.state == self.OPEN:
+                if time.monotonic() - self.opened_at < BREAKER_RESET_TIMEOUT:
+                    self.rejected += 1
+                    return False
+                self.state = self.HALF_OPEN
+                self.half_open_calls = 0
+                logger.info(f"Circuito de {self.name} semiabierto: probando el servicio")
+
+            if self.state == self.HALF_OPEN:
+                if self.half_open_calls >= BREAKER_HALF_OPEN_MAX_CALLS:
+                    self.rejected += 1
+                    return False
+                self.half_open_calls += 1
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            if self.state != self.CLOSED:
+                logger.info(f"Circuito de {self.name} cerrado")
+                self.state = self.CLOSED
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= BREAKER_FAILURE_THRESHOLD:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuito de {self.name} abierto tras {self.failures} fallos")
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """Libera el turno de prueba de una llamada que no fue ni éxito ni fallo"""
+        with self._lock:
+            if self.state == self.HALF_OPEN and self.half_open_calls > 0:
+                self.half_open_calls -= 1
+
+    def record_status(self, status_code):
+        if status_code in BREAKER_FAILURE_STATUSES:
+            self.record_failure()
+        else:
+            self.record_success()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'times_opened': self.times_opened,
+                'rejected': self.rejected,
+                'retry_after': round(self.retry_after(), 1) if self.state == self.OPEN else 0
+            }
+
+# ==========================================
+# POOLS DE CONEXIÓN A SERVICIOS
+# ==========================================
+
+UPSTREAM_POOL_SIZE = int(os.getenv('UPSTREAM_POOL_SIZE', 20))
+UPSTREAM_POOL_BLOCK = os.getenv('UPSTREAM_POOL_BLOCK', 'False') == 'True'
+UPSTREAM_KEEPALIVE = os.getenv('UPSTREAM_KEEPALIVE', 'True') == 'True'
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv('UPSTREAM_CONNECT_TIMEOUT', 5))
+UPSTREAM_READ_TIMEOUT = float(os.getenv('UPSTREAM_READ_TIMEOUT', 30))
+# Peticiones simultáneas máximas por servicio (0 = sin límite) y espera máxima en cola
+BACKEND_MAX_CONCURRENCY = int(os.getenv('BACKEND_MAX_CONCURRENCY', 0))
+BACKEND_QUEUE_TIMEOUT = float(os.getenv('BACKEND_QUEUE_TIMEOUT', 0.5))
+
+
+def service_max_concurrency(service_name):
+    """Límite de concurrencia del servicio, p. ej. REPORTS_MAX_CONCURRENCY=10"""
+    return int(os.getenv(f'{service_name.upper()}_MAX_CONCURRENCY', BACKEND_MAX_CONCURRENCY))
+
+
+def service_timeout(service_name):
+    """Timeouts (connect, read) del servicio, p. ej. REPORTS_READ_TIMEOUT=120"""
+    prefix = service_name.upper()
+    return (
+        float(os.getenv(f'{prefix}_CONNECT_TIMEOUT', UPSTREAM_CONNECT_TIMEOUT)),
+        float(os.getenv(f'{prefix}_READ_TIMEOUT', UPSTREAM_READ_TIMEOUT))
+    )
+
+
+# ==========================================
+# BALANCEO ENTRE INSTANCIAS
+# ==========================================
+
+# round_robin | least_outstanding | ewma (por servicio: RESERVATIONS_LB_STRATEGY=ewma)
+LB_STRATEGY = os.getenv('LB_STRATEGY', 'round_robin')
+# Fallos seguidos que expulsan una instancia y tiempo que queda fuera (s)
+LB_EJECT_FAILURES = int(os.getenv('LB_EJECT_FAILURES', 3))
+LB_EJECT_SECONDS = float(os.getenv('LB_EJECT_SECONDS', 30))
+# Peso de la última latencia en la media móvil exponencial
+LB_EWMA_ALPHA = float(os.getenv('LB_EWMA_ALPHA', 0.3))
+
+LB_STRATEGIES = ('round_robin', 'least_outstanding', 'ewma')
+
+
+def parse_instances(value):
+    """URLs de las instancias de un servicio: "http://a:8002,http://b:8002\""""
+    return [url.strip().rstrip('/') for url in value.split(',') if url.strip()]
+
+
+def service_strategy(service_name):
+    strategy = os.getenv(f'{service_name.upper()}_LB_STRATEGY', LB_STRATEGY)
+    if strategy not in LB_STRATEGIES:
+        logger.warning(f"Estrategia de balanceo desconocida para {service_name}: {strategy}, se usa round_robin")
+        return 'round_robin'
+    return strategy
+
+
+class UpstreamInstance:
+    __slots__ = ('url', 'in_flight', 'requests', 'failures', 'consecutive_failures',
+                 'ewma', 'ejected_until', 'ejections')
+
+    def __init__(self, url):
+        self.url = url
+        self.in_flight = 0
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.ewma = 0.0
+        self.ejected_until = 0.0
+        self.ejections = 0
+
+    def is_ejected(self, now):
+        return now < self.ejected_until
+
+
+class Balancer:
+    """Elige la instancia de un servicio y expulsa temporalmente las que fallan seguido"""
+
+    def __init__(self, name, urls, strategy):
+        self.name = name
+        self.instances = [UpstreamInstance(url) for url in urls]
+        self.strategy = strategy
+        self._lock = threading.Lock()
+        self._next = 0
+        self.panics = 0
+
+    def acquire(self):
+        """Instancia para la próxima llamada; la llamada debe terminar con release()"""
+        with self._lock:
+            instances = self.instances
+            if len(instances) > 1:
+                now = time.monotonic()
+                available = [instance for instance in instances if not instance.is_ejected(now)]
+                if not available:
+                    # Todas expulsadas: mejor intentar con alguna que rechazar la petición
+                    available = instances
+                    self.panics += 1
+                instance = self._choose(available)
+            else:
+                instance = instances[0]
+            instance.in_flight += 1
+            instance.requests += 1
+            return instance
+
+    def _choose(self, available):
+        self._next += 1
+        start = self._next % len(available)
+        if self.strategy == 'round_robin':
+            return available[start]
+        # Se empieza en una posición rotativa para repartir los empates
+        rotated = available[start:] + available[:start]
+        if self.strategy == 'least_outstanding':
+            return min(rotated, key=lambda instance: instance.in_flight)
+        # ewma: latencia esperada penalizada por las llamadas que ya tiene en curso
+        return min(rotated, key=lambda instance: instance.ewma * (instance.in_flight + 1))
+
+    def release(self, instance, seconds, failed):
+        with self._lock:
+            instance.in_flight -= 1
+            if failed:
+                instance.failures += 1
+                instance.consecutive_failures += 1
+                if instance.consecutive_failures >= LB_EJECT_FAILURES and len(self.instances) > 1:
+                    self._eject(instance)
+            else:
+                instance.consecutive_failures = 0
+                instance.ewma = seconds if instance.ewma == 0.0 else (
+                    LB_EWMA_ALPHA * seconds + (1 - LB_EWMA_ALPHA) * instance.ewma
+                )
+
+    def _eject(self, instance):
+        now = time.monotonic()
+        if not instance.is_ejected(now):
+            instance.ejections += 1
+            logger.warning(f"Instancia expulsada de {self.name}: {instance.url}")
+        instance.ejected_until = now + LB_EJECT_SECONDS
+        instance.consecutive_failures = 0
+
+    def record_probe(self, instance, healthy):
+        """El sondeo activo de /health readmite una instancia expulsada o expulsa una caída"""
+        with self._lock:
+            if healthy:
+                if instance.is_ejected(time.monotonic()):
+                    logger.info(f"Instancia readmitida en {self.name}: {instance.url}")
+                instance.ejected_until = 0.0
+                instance.consecutive_failures = 0
+            elif len(self.instances) > 1:
+                self._eject(instance)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                'url': instance.url,
+                'state': 'ejected' if instance.is_ejected(now) else 'active',
+                'in_flight': instance.in_flight,
+                'requests': instance.requests,
+                'failures': instance.failures,
+                'ejections': instance.ejections,
+                'ewma_ms': round(instance.ewma * 1000, 3),
+                'ejected_for': round(instance.ejected_until - now, 1) if instance.is_ejected(now) else 0
+            } for instance in self.instances]
+
+
+class UpstreamPool:
+    """Sesión HTTP con conexiones keep-alive reutilizables hacia las instancias de un servicio"""
+
+    def __init__(self, name, urls):
+        self.name = name
+        self.balancer = Balancer(name, parse_instances(urls), service_strategy(name))
+        self.timeout = service_timeout(name)
+        self.session = requests.Session()
+        self.adapter = HTTPAdapter(
+            pool_connections=len(self.balancer.instances),
+            pool_maxsize=UPSTREAM_POOL_SIZE,
+            pool_block=UPSTREAM_POOL_BLOCK,
+            max_retries=0
+        )
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+        if not UPSTREAM_KEEPALIVE:
+            self.session.headers['Connection'] = 'close'
+        self.breaker = CircuitBreaker(name)
+        self.max_concurrency = service_max_concurrency(name)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency) if self.max_concurrency > 0 else None
+        self.queue_rejected = 0
+        self._lock = threading.Lock()
+        self.in_use = 0
+        self.max_in_use = 0
+
+    def acquire_slot(self, timeout=BACKEND_QUEUE_TIMEOUT):
+        """Reserva un turno de concurrencia esperando como máximo `timeout` segundos"""
+        if self._slots is None:
+            return True
+        if self._slots.acquire(timeout=timeout):
+            return True
+        self.record_queue_rejected()
+        return False
+
+    def record_queue_rejected(self):
+        # Lo incrementan los hilos de peticiones (y el modo ASGI): bajo el mismo lock que in_use
+        with self._lock:
+            self.queue_rejected += 1
+
+    def release_slot(self):
+        if self._slots is not None:
+            self._slots.release()
+
+    def request(self, method, path, use_breaker=True, instance=None, **kwargs):
+        """Llama a `path` en la instancia elegida por el balanceador (o en `instance`)"""
+        kwargs.setdefault('timeout', self.timeout)
+        if use_breaker and not self.breaker.allow_request():
+            raise CircuitOpenError(self.name, self.breaker.retry_after())
+
+        balanced = instance is None
+        if balanced:
+            instance = self.balancer.acquire()
+        with self._lock:
+            self.in_use += 1
+            self.max_in_use = max(self.max_in_use, self.in_use)
+        started = time.perf_counter()
+        failed = True
+        try:
+            response = self.session.request(method=method, url=f'{instance.url}{path}', **kwargs)
+            failed = response.status_code in BREAKER_FAILURE_STATUSES
+        except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+            if use_breaker:
+                self.breaker.record_failure()
+            METRICS.observe_upstream(self.name, time.perf_counter() - started, failed=True)
+            raise
+        except Exception:
+            failed = False
+            if use_breaker:
+                self.breaker.release()
+            METRICS.observe_upstream(self.name, time.perf_counter() - started, failed=True)
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                self.in_use -= 1
+            if balanced:
+                self.balancer.release(instance, elapsed, failed)
+
+        METRICS.observe_upstream(self.name, elapsed)
+
+        if use_breaker:
+            self.breaker.record_status(response.status_code)
+        return response
+
+    def stats(self):
+        instances = self.balancer.stats()
+        with self._lock:
+            in_use, max_in_use, queue_rejected = self.in_use, self.max_in_use, self.queue_rejected
+        requests_sent = misses = 0
+        for instance in instances:
+            pool = self.adapter.poolmanager.connection_from_url(instance['url'])
+            # urllib3 cuenta peticiones y conexiones nuevas: cada conexión nueva es un fallo del pool
+            instance['connections'] = pool.num_connections
+            requests_sent += pool.num_requests
+            misses += pool.num_connections
+        return {
+            'strategy': self.balancer.strategy,
+            'instances': instances,
+            'pool_size': UPSTREAM_POOL_SIZE,
+            'keepalive': UPSTREAM_KEEPALIVE,
+            'timeout': {'connect': self.timeout[0], 'read': self.timeout[1]},
+            'requests': requests_sent,
+            'hits': max(requests_sent - misses, 0),
+            'misses': misses,
+            'in_use': in_use,
+            'max_in_use': max_in_use,
+            'max_concurrency': self.max_concurrency,
+            'queue_rejected': queue_rejected,
+            'circuit': self.breaker.stats()
+        }
+
+    def close(self):
+        self.session.close()
+
+
+def build_pools():
+    return {name: UpstreamPool(name, url) for name, url in SERVICES.items()}
+
+
+POOLS = build_pools()
+
 # ==========================================
 # AUTENTICACIÓN
 # ==========================================
 
+TOKEN_VERIFY_ENABLED = os.getenv('TOKEN_VERIFY_ENABLED', 'True') == 'True'
+TOKEN_VERIFY_PATH = os.getenv('TOKEN_VERIFY_PATH', '/api/me')
+TOKEN_CACHE_TTL = float(os.getenv('TOKEN_CACHE_TTL', 60))
+TOKEN_NEGATIVE_TTL = float(os.getenv('TOKEN_NEGATIVE_TTL', 10))
+TOKEN_CACHE_MAX_ENTRIES = int(os.getenv('TOKEN_CACHE_MAX_ENTRIES', 10000))
+
+# Identidad verificada que el gateway envía a los servicios (nunca se aceptan del cliente)
+IDENTITY_HEADERS = {'X-User-Id': 'id', 'X-User-Email': 'email', 'X-User-Role': 'role'}
+IDENTITY_HEADER_NAMES = {header.lower() for header in IDENTITY_HEADERS}
+
+
+class TokenVerificationError(Exception):
+    """El servicio de autenticación no pudo confirmar ni rechazar el token"""
+
+
+class TokenCache:
+    """Caché acotada de tokens verificados y rechazados, con TTL"""
+
+    MISSING = object()
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    def get(self, token):
+        """Usuario del token, None si fue rechazado, o MISSING si no está en caché"""
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] < time.monotonic():
+                self._entries.pop(key, None)
+                self.misses += 1
+                return self.MISSING
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, token, user):
+        ttl = TOKEN_CACHE_TTL if user is not None else TOKEN_NEGATIVE_TTL
+        with self._lock:
+            self._entries[self._key(token)] = (time.monotonic() + ttl, user)
+            self._entries.move_to_end(self._key(token))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def forget(self, token):
+        with self._lock:
+            self._entries.pop(self._key(token), None)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'enabled': TOKEN_VERIFY_ENABLED,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+
+TOKEN_CACHE = TokenCache(TOKEN_CACHE_MAX_ENTRIES)
+
+
+def identity_from_me(payload):
+    """Extrae el usuario de la respuesta de /api/me del servicio de autenticación"""
+    if not isinstance(payload, dict):
+        raise TokenVerificationError(f'Respuesta inesperada de {TOKEN_VERIFY_PATH}')
+    data = payload.get('data')
+    user = (data.get('user') if isinstance(data, dict) else None) or payload.get('user') or payload
+    if not isinstance(user, dict):
+        raise TokenVerificationError(f'Respuesta inesperada de {TOKEN_VERIFY_PATH}')
+    return {'id': user.get('id'), 'email': user.get('email'), 'role': user.get('role')}
+
+
+def token_verification_result(status_code, payload):
+    """Usuario si el token es válido, None si fue rechazado"""
+    if status_code == 200:
+        return identity_from_me(payload)
+    if status_code in (401, 403):
+        return None
+    raise TokenVerificationError(f'HTTP {status_code} en {TOKEN_VERIFY_PATH}')
+
+
+def verify_token(token):
+    """Verifica el token una vez contra el servicio de auth y luego lo sirve desde la caché"""
+    cached = TOKEN_CACHE.get(token)
+    if cached is not TokenCache.MISSING:
+        return cached
+
+    try:
+        response = POOLS['auth'].request(
+            'GET',
+            TOKEN_VERIFY_PATH,
+            headers={
+                'Authorization': f'Bearer {token}',
+                'Accept': 'application/json',
+                'X-API-Key': API_KEY,
+                'X-Gateway': 'api-gateway'
+            }
+        )
+        payload = response.json() if response.status_code == 200 else {}
+    except (requests.exceptions.RequestException, ValueError) as e:
+        raise TokenVerificationError(str(e))
+
+    user = token_verification_result(response.status_code, payload)
+    TOKEN_CACHE.put(token, user)
+    return user
+
+
+def identity_headers(user):
+    return {header: str(user[field]) for header, field in IDENTITY_HEADERS.items() if user.get(field) is not None}
+
+
+def is_public_route(path):
+    return path.startswith(PUBLIC_ROUTE_PREFIXES)
+
+def parse_bearer(auth_header):
+    """Devuelve (token, mensaje de error) a partir del header Authorization"""
+    if not auth_header:
+        return None, 'Token no proporcionado'
+
+    try:
+        token_type, token = auth_header.split(' ')
+        if token_type.lower() != 'bearer':
+            raise ValueError()
+    except ValueError:
+        return None, 'Formato inválido. Use: Bearer <token>'
+
+    return token, None
+
 def require_auth(f):
     @wraps(f)
     def wrapper(*args, **kwargs):
 
-        if any(request.path.startswith(route) for route in PUBLIC_ROUTES):
+        if is_public_route(request.path):
             return f(*args, **kwargs)
 
-        auth_header = request.headers.get('Authorization')
-        if not auth_header:
-            return jsonify({'success': False, 'message': 'Token no proporcionado'}), 401
+        token, error = parse_bearer(request.headers.get('Authorization'))
+        if error:
+            return jsonify({'success': False, 'message': error}), 401
+
+        if TOKEN_VERIFY_ENABLED:
+            try:
+                user = verify_token(token)
+            except TokenVerificationError as e:
+                logger.error(f"No se pudo verificar el token: {e}")
+                return jsonify({'success': False, 'message': 'No se pudo verificar el token'}), 503
+
+            if user is None:
+                return jsonify({'success': False, 'message': 'Token inválido o expirado'}), 401
+            g.user = user
 
-        try:
-            token_type, token = auth_header.split(' ')
-            if token_type.lower() != 'bearer':
-                raise ValueError()
-        except ValueError:
-            return jsonify({
-                'success': False,
-                'message': 'Formato inválido. Use: Bearer <token>'
-            }), 401
-        
         return f(*args, **kwargs)
     return wrapper
 
+# ==========================================
+# CACHÉ DE RESPUESTAS GET
+# ==========================================
+
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'True') == 'True'
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+# Formato: "prefijo=segundos,prefijo=segundos"
+RESPONSE_CACHE_TTLS = os.getenv('RESPONSE_CACHE_TTLS', '/api/reservas=5,/api/audit/audit=5')
+
+MUTATING_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+# Headers del servicio que no se reenvían ni se guardan: requests ya decodificó el cuerpo,
+# y Date/Server los pone el servidor del gateway
+UPSTREAM_SKIP_HEADERS = frozenset({
+    'connection', 'keep-alive', 'transfer-encoding', 'content-encoding', 'content-length', 'date', 'server'
+})
+
+
+def passthrough_headers(upstream_headers):
+    return CaseInsensitiveDict(
+        (key, value) for key, value in upstream_headers.items() if key.lower() not in UPSTREAM_SKIP_HEADERS
+    )
+
+
+def parse_route_ttls(value):
+    ttls = {}
+    for item in value.split(','):
+        if '=' not in item:
+            continue
+        prefix, ttl = item.split('=', 1)
+        ttls[prefix.strip().rstrip('/')] = float(ttl)
+    return ttls
+
+
+def auth_subject(auth_header):
+    """Sujeto de una clave de caché: hash del header Authorization (nunca el token en claro)"""
+    return hashlib.sha256(auth_header.encode()).hexdigest() if auth_header else 'anonymous'
+
+
+class CachedResponse:
+    __slots__ = ('status', 'headers', 'body', 'etag', 'upstream_etag', 'variants', 'stored', 'expires', 'size')
+
+    def __init__(self, status, headers, body, ttl):
+        self.status = status
+        self.headers = CaseInsensitiveDict(headers)
+        self.body = body
+        # Solo el ETag del servicio sirve para revalidar; el generado es para los clientes
+        self.upstream_etag = self.headers.get('ETag')
+        if self.upstream_etag is None and CONDITIONAL_ETAGS:
+            self.headers['ETag'] = etag_for(body)
+        self.etag = self.headers.get('ETag')
+        self.variants = {}  # codificación -> cuerpo comprimido
+        self.stored = False
+        self.expires = time.monotonic() + ttl
+        self.size = len(body) + sum(len(k) + len(v) for k, v in self.headers.items())
+
+    def is_fresh(self):
+        return time.monotonic() < self.expires
+
+    def to_response(self, cache_status):
+        return client_response(self.status, self.headers, self.body, cache_status, entry=self)
+
+
+class ResponseCache:
+    """Caché LRU en memoria de respuestas GET por ruta y por sujeto de Authorization"""
+
+    def __init__(self, ttls, max_bytes):
+        self.ttls = PrefixTable(ttls)
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.bytes_served = 0
+        self.bytes_fetched = 0
+
+    def route_rule(self, path):
+        """Devuelve (prefijo, ttl) de la regla que cubre la ruta, o (None, None)"""
+        return self.ttls.lookup(path)
+
+    @staticmethod
+    def key(prefix, path, query_string, auth_header):
+        return (prefix, path, query_string, auth_subject(auth_header))
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def record_hit(self, entry, revalidated=False):
+        with self._lock:
+            if revalidated:
+                self.revalidations += 1
+            else:
+                self.hits += 1
+            self.bytes_served += len(entry.body)
+
+    def record_miss(self, size):
+        with self._lock:
+            self.misses += 1
+            self.bytes_fetched += size
+
+    def refresh(self, key, entry, ttl):
+        entry.expires = time.monotonic() + ttl
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+    def store(self, key, entry):
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._bytes -= previous.size
+                previous.stored = False
+            self._entries[key] = entry
+            entry.stored = True
+            self._bytes += entry.size
+            self._evict()
+
+    def add_variant(self, entry, encoding, body):
+        """Guarda la versión comprimida junto a la entrada para no volver a comprimir"""
+        with self._lock:
+            if encoding in entry.variants:
+                return
+            entry.variants[encoding] = body
+            entry.size += len(body)
+            if entry.stored:
+                self._bytes += len(body)
+                self._evict()
+
+    def _evict(self):
+        while self._bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+            evicted.stored = False
+            self.evictions += 1
+
+    def invalidate(self, prefix):
+        """Elimina todas las entradas del recurso, para todos los sujetos"""
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == prefix]
+            for key in keys:
+                entry = self._entries.pop(key)
+                self._bytes -= entry.size
+                entry.stored = False
+            self.invalidations += len(keys)
+        return len(keys)
+
+    def stats(self):
+        with self._lock:
+            served = self.hits + self.revalidations
+            lookups = served + self.misses
+            return {
+                'enabled': RESPONSE_CACHE_ENABLED,
+                'routes': dict(self.ttls.items()),
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'revalidations': self.revalidations,
+                'misses': self.misses,
+                'hit_ratio': round(served / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations,
+                'bytes_served_from_cache': self.bytes_served,
+                'bytes_fetched_from_upstream': self.bytes_fetched
+            }
+
+
+RESPONSE_CACHE = ResponseCache(parse_route_ttls(RESPONSE_CACHE_TTLS), RESPONSE_CACHE_MAX_BYTES)
+
+
+def cache_control_forbids(value):
+    directives = {d.strip().split('=')[0].lower() for d in (value or '').split(',')}
+    return bool(directives & {'no-store', 'no-cache'})
+
+# ==========================================
+# COMPRESIÓN Y PETICIONES CONDICIONALES
+# ==========================================
+
+COMPRESSION_ENABLED = os.getenv('COMPRESSION_ENABLED', 'True') == 'True'
+COMPRESSION_MIN_BYTES = int(os.getenv('COMPRESSION_MIN_BYTES', 1024))
+# Prefijos de Content-Type que se comprimen (las imágenes y los PDF ya vienen comprimidos)
+COMPRESSION_TYPES = tuple(
+    t.strip() for t in os.getenv(
+        'COMPRESSION_TYPES', 'application/json,text/,application/javascript,application/xml,application/x-ndjson'
+    ).split(',') if t.strip()
+)
+COMPRESSION_GZIP_LEVEL = int(os.getenv('COMPRESSION_GZIP_LEVEL', 6))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv('COMPRESSION_BROTLI_QUALITY', 5))
+# ETag generado por el gateway para los GET 200 cuyo servicio no envía uno
+CONDITIONAL_ETAGS = os.getenv('CONDITIONAL_ETAGS', 'True') == 'True'
+
+try:
+    import brotli
+except ImportError:
+    # Opcional (pip install brotli): sin él solo se ofrece gzip
+    brotli = None
+
+COMPRESSORS = {
+    'gzip': lambda body: gzip.compress(body, compresslevel=COMPRESSION_GZIP_LEVEL, mtime=0)
+}
+if brotli is not None:
+    COMPRESSORS['br'] = lambda body: brotli.compress(body, quality=COMPRESSION_BROTLI_QUALITY)
+
+# Preferencia del gateway cuando el cliente acepta varias con el mismo peso
+ENCODING_PREFERENCE = tuple(encoding for encoding in ('br', 'gzip') if encoding in COMPRESSORS)
+
+# Headers que acompañan a un 304 (RFC 9110 §15.4.5)
+NOT_MODIFIED_HEADERS = ('ETag', 'Cache-Control', 'Content-Location', 'Expires', 'Vary')
+
+_encoding_memo = {}
+
+
+def negotiate_encoding(accept_encoding):
+    """Codificación a usar según Accept-Encoding, o None para enviar sin comprimir"""
+    if not accept_encoding:
+        return None
+    found = _encoding_memo.get(accept_encoding, False)
+    if found is not False:
+        return found
+
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name.strip().lower()] = q
+
+    found, best = None, 0.0
+    for encoding in ENCODING_PREFERENCE:
+        q = weights.get(encoding, weights.get('*', 0.0))
+        if q > best:
+            found, best = encoding, q
+
+    # Los navegadores envían pocas variantes distintas del header
+    if len(_encoding_memo) >= 256:
+        _encoding_memo.clear()
+    _encoding_memo[accept_encoding] = found
+    return found
+
+
+def is_compressible(headers, size):
+    if size < COMPRESSION_MIN_BYTES:
+        return False
+    if not headers.get('Content-Type', '').startswith(COMPRESSION_TYPES):
+        return False
+    return 'no-transform' not in headers.get('Cache-Control', '')
+
+
+def etag_for(body):
+    return 'W/"%s"' % hashlib.blake2b(body, digest_size=16).hexdigest()
+
+
+def weak_etag(etag):
+    return etag if etag.startswith('W/') else f'W/{etag}'
+
+
+def etag_matches(if_none_match, etag):
+    """Comparación débil de If-None-Match (RFC 9110 §13.1.2)"""
+    if not if_none_match or not etag:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    opaque = etag[2:] if etag.startswith('W/') else etag
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == opaque:
+            return True
+    return False
+
+
+def client_response(status, headers, body, cache_status=None, entry=None):
+    """Respuesta final al cliente: 304 si ya tiene esta versión, si no el cuerpo en la codificación negociada"""
+    headers = CaseInsensitiveDict(headers)
+    encoding = None
+
+    if status == 200:
+        if CONDITIONAL_ETAGS and 'ETag' not in headers and request.method == 'GET':
+            headers['ETag'] = etag_for(body)
+
+        if COMPRESSION_ENABLED and is_compressible(headers, len(body)):
+            vary = headers.get('Vary')
+            if not vary:
+                headers['Vary'] = 'Accept-Encoding'
+            elif 'accept-encoding' not in vary.lower():
+                headers['Vary'] = f'{vary}, Accept-Encoding'
+            # Todas las codificaciones comparten ETag débil: el contenido es el mismo
+            if 'ETag' in headers:
+                headers['ETag'] = weak_etag(headers['ETag'])
+            encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+
+        # Un 304 solo responde a lecturas: en POST/PUT/PATCH/DELETE If-None-Match no evita la respuesta
+        if request.method in ('GET', 'HEAD') and etag_matches(request.headers.get('If-None-Match'), headers.get('ETag')):
+            response = Response(status=304, headers={
+                name: headers[name] for name in NOT_MODIFIED_HEADERS if name in headers
+            })
+            del response.headers['Content-Type']
+            if cache_status is not None:
+                response.headers['X-Cache'] = cache_status
+            return response
+
+    if encoding is not None:
+        compressed = entry.variants.get(encoding) if entry is not None else None
+        if compressed is None:
+            compressed = COMPRESSORS[encoding](body)
+            if entry is not None:
+                RESPONSE_CACHE.add_variant(entry, encoding, compressed)
+        METRICS.observe_compression(encoding, len(body), len(compressed))
+        body = compressed
+        headers['Content-Encoding'] = encoding
+
+    response = Response(body, status=status, headers=list(headers.items()))
+    if cache_status is not None:
+        response.headers['X-Cache'] = cache_status
+    return response
+
+# ==========================================
+# RATE LIMITING
+# ==========================================
+
+RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'True') == 'True'
+# Formato: "prefijo=tokens_por_segundo/ráfaga,..." aplicado por IP y por token
+RATE_LIMITS = os.getenv(
+    'RATE_LIMITS',
+    '/api/reports=2/10,/api/notifications/send_reservation_notification=1/5,/api=50/100'
+)
+RATE_LIMIT_MAX_KEYS = int(os.getenv('RATE_LIMIT_MAX_KEYS', 100000))
+# Backend compartido entre procesos (opcional), p. ej. redis://localhost:6379/0
+RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', '')
+
+TOO_MANY_REQUESTS = {'success': False, 'message': 'Demasiadas peticiones, intente más tarde'}
+
+
+def parse_rate_limits(value):
+    rules = {}
+    for item in value.split(','):
+        if '=' not in item:
+            continue
+        prefix, spec = item.split('=', 1)
+        rate, _, burst = spec.partition('/')
+        rate, burst = float(rate), float(burst or rate)
+        # Se valida al arrancar: con rate 0 el cálculo de Retry-After divide por cero
+        if rate <= 0 or burst < 1:
+            raise ValueError(f"RATE_LIMITS inválido en '{item.strip()}': rate debe ser > 0 y burst >= 1")
+        rules[prefix.strip().rstrip('/')] = (rate, burst)
+    return rules
+
+
+class MemoryBucketStore:
+    """Token buckets en memoria del proceso, con expulsión LRU"""
+
+    name = 'memory'
+
+    def __init__(self, max_keys):
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+
+    def consume(self, keys, rate, capacity):
+        """Toma un token de cada bucket solo si todos tienen uno: (permitido, segundos hasta poder pasar)"""
+        now = time.monotonic()
+        with self._lock:
+            levels = []
+            for key in keys:
+                tokens, last = self._buckets.pop(key, (capacity, now))
+                levels.append(min(capacity, tokens + (now - last) * rate))
+            allowed = all(tokens >= 1 for tokens in levels)
+            retry_after = 0.0 if allowed else max((1 - tokens) / rate for tokens in levels if tokens < 1)
+            for key, tokens in zip(keys, levels):
+                self._buckets[key] = (tokens - 1 if allowed else tokens, now)
+            # Un bucket expulsado vuelve lleno: solo se pierde historial de clientes inactivos
+            while len(self._buckets) > self.max_keys:
+                self._buckets.popitem(last=False)
+        return allowed, retry_after
+
+    def size(self):
+        return len(self._buckets)
+
+
+class RedisBucketStore:
+    """Token buckets en un Redis local compartido por todos los workers"""
+
+    name = 'redis'
+
+    # Todos los buckets en un solo script: se consumen solo si todos tienen token
+    SCRIPT = """
+    local rate = tonumber(ARGV[1])
+    local capacity = tonumber(ARGV[2])
+    local now = tonumber(ARGV[3])
+    local levels = {}
+    local allowed = 1
+    local retry_after = 0
+    for i, key in ipairs(KEYS) do
+        local bucket = redis.call('HMGET', key, 'tokens', 'ts')
+        local tokens = tonumber(bucket[1]) or capacity
+        local ts = tonumber(bucket[2]) or now
+        tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+        levels[i] = tokens
+        if tokens < 1 then
+            allowed = 0
+            retry_after = math.max(retry_after, (1 - tokens) / rate)
+        end
+    end
+    for i, key in ipairs(KEYS) do
+        redis.call('HSET', key, 'tokens', levels[i] - allowed, 'ts', now)
+        redis.call('EXPIRE', key, math.ceil(capacity / rate) + 1)
+    end
+    return {allowed, tostring(retry_after)}
+    """
+
+    def __init__(self, url):
+        import redis
+        self.client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+        # from_url no conecta: se comprueba aquí para caer a memoria en vez de fallar en cada petición
+        self.client.ping()
+        self._script = self.client.register_script(self.SCRIPT)
+
+    def consume(self, keys, rate, capacity):
+        try:
+            allowed, retry_after = self._script(keys=[f'gateway:rl:{key}' for key in keys], args=[rate, capacity, time.time()])
+            return bool(allowed), float(retry_after)
+        except Exception as e:
+            # Si Redis no responde no se bloquea el tráfico
+            logger.error(f"Rate limit en Redis no disponible: {e}")
+            return True, 0.0
+
+    def size(self):
+        return None
+
+
+def build_bucket_store():
+    if RATE_LIMIT_REDIS_URL:
+        try:
+            return RedisBucketStore(RATE_LIMIT_REDIS_URL)
+        except ImportError:
+            logger.warning("RATE_LIMIT_REDIS_URL configurada pero el paquete redis no está instalado; se usa memoria")
+        except Exception as e:
+            # URL inválida o Redis caído al arrancar: el worker arranca igual con buckets en memoria
+            logger.error(f"Rate limit en Redis no disponible al arrancar ({e}); se usa memoria")
+    return MemoryBucketStore(RATE_LIMIT_MAX_KEYS)
+
+
+class RateLimiter:
+    def __init__(self, rules, store):
+        self.rules = PrefixTable(rules)
+        self.store = store
+        self.rejected = 0
+        self._lock = threading.Lock()
+
+    def rule_for(self, path):
+        return self.rules.lookup(path)
+
+    def check(self, path, client_ip, auth_header):
+        """Devuelve None si se permite, o los segundos a esperar si se rechaza"""
+        prefix, limits = self.rule_for(path)
+        if prefix is None:
+            return None
+
+        rate, capacity = limits
+        keys = [f'{prefix}|ip|{client_ip}']
+        if auth_header:
+            keys.append(f'{prefix}|sub|{hashlib.sha256(auth_header.encode()).hexdigest()}')
+
+        # Una petición rechazada no gasta la cuota de ninguno de sus buckets
+        allowed, retry_after = self.store.consume(keys, rate, capacity)
+        if allowed:
+            return None
+
+        with self._lock:
+            self.rejected += 1
+        return retry_after
+
+    def stats(self):
+        return {
+            'enabled': RATE_LIMIT_ENABLED,
+            'backend': self.store.name,
+            'rules': {prefix: {'rate': rate, 'burst': burst} for prefix, (rate, burst) in self.rules.items()},
+            'tracked_keys': self.store.size(),
+            'rejected': self.rejected
+        }
+
+
+RATE_LIMITER = RateLimiter(parse_rate_limits(RATE_LIMITS), build_bucket_store())
+
+
+def retry_after_header(seconds):
+    return {'Retry-After': str(max(1, math.ceil(seconds)))}
+
+
+@app.before_request
+def rate_limit():
+    if not RATE_LIMIT_ENABLED:
+        return None
+    retry_after = RATE_LIMITER.check(request.path, request.remote_addr, request.headers.get('Authorization'))
+    if retry_after is not None:
+        return jsonify(TOO_MANY_REQUESTS), 429, retry_after_header(retry_after)
+    return None
+
+# ==========================================
+# SINGLE-FLIGHT (COALESCENCIA DE GET)
+# ==========================================
+
+# Prefijos cuyas peticiones GET idénticas y simultáneas comparten una sola llamada al servicio
+SINGLE_FLIGHT_ROUTES = os.getenv('SINGLE_FLIGHT_ROUTES', '/api/reservas,/api/reports')
+# Partes de la petición que forman la clave: path, query, auth, accept
+SINGLE_FLIGHT_KEY = os.getenv('SINGLE_FLIGHT_KEY', 'path,query,auth')
+
+
+class BackendBusyError(Exception):
+    """No hubo turno libre hacia el servicio dentro de BACKEND_QUEUE_TIMEOUT"""
+
+
+class _Flight:
+    __slots__ = ('done', 'response', 'error', 'waiters')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+        self.waiters = 0
+
+
+class SingleFlight:
+    """Agrupa llamadas idénticas en curso: la primera va al servicio y las demás esperan su resultado"""
+
+    def __init__(self, routes, key_parts):
+        self.routes = PrefixTable({route.strip(): True for route in routes.split(',') if route.strip()})
+        self.key_parts = tuple(part.strip() for part in key_parts.split(',') if part.strip())
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.upstream_calls = 0
+        self.shared = 0
+
+    def key_for(self, service_name, req, upstream_headers):
+        prefix, _ = self.routes.lookup(req.path)
+        if prefix is None:
+            return None
+        parts = {
+            'path': req.path,
+            'query': req.query_string.decode('latin-1'),
+            'auth': req.headers.get('Authorization', ''),
+            'accept': req.headers.get('Accept', '')
+        }
+        key = (service_name, upstream_headers.get('If-None-Match', '')) + tuple(
+            parts.get(part, '') for part in self.key_parts
+        )
+        # If-None-Match siempre forma parte de la clave: un 304 solo sirve a quien tiene esa versión.
+        # En rutas protegidas el sujeto también, aunque SINGLE_FLIGHT_KEY no incluya auth:
+        # la respuesta de un usuario nunca se comparte con otro
+        if 'auth' not in self.key_parts and not is_public_route(req.path):
+            key += (auth_subject(parts['auth']),)
+        return key
+
+    def do(self, key, fn, timeout=None):
+        with self._lock:
+            flight = self._flights.get(key)
+            if flight is None:
+                flight = self._flights[key] = _Flight()
+                leader = True
+                self.upstream_calls += 1
+            else:
+                flight.waiters += 1
+                leader = False
+
+        if not leader:
+            started = time.perf_counter()
+            finished = flight.done.wait(timeout)
+            # La espera al líder cuenta como tiempo del servicio en las métricas
+            METRICS.add_upstream_time(time.perf_counter() - started)
+            if not finished:
+                # El líder tarda más de lo esperado: se hace la llamada propia
+                return fn()
+            with self._lock:
+                self.shared += 1
+            if flight.error is not None:
+                raise flight.error
+            return flight.response
+
+        try:
+            flight.response = fn()
+            return flight.response
+        except Exception as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                self._flights.pop(key, None)
+            flight.done.set()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'routes': list(self.routes.rules),
+                'key': list(self.key_parts),
+                'upstream_calls': self.upstream_calls,
+                'saved_upstream_calls': self.shared,
+                'in_flight': len(self._flights)
+            }
+
+
+SINGLE_FLIGHT = SingleFlight(SINGLE_FLIGHT_ROUTES, SINGLE_FLIGHT_KEY)
+
 # ==========================================
 # PROXY REQUEST
 # ==========================================
 
+# Headers del cliente que no se reenvían; la identidad solo la pone el gateway
+# Accept-Encoding lo pone requests: solo pide codificaciones que sabe decodificar
+EXCLUDED_REQUEST_HEADERS = frozenset({'host', 'connection', 'content-length', 'accept-encoding'} | IDENTITY_HEADER_NAMES)
+
+
+def forward_headers(items):
+    return {key: value for key, value in items if key.lower() not in EXCLUDED_REQUEST_HEADERS}
+
+
 def proxy_request(service_name, path='', method=None):
-    service_url = SERVICES.get(service_name)
+    pool = POOLS.get(service_name)
 
-    if not service_url:
+    if not pool:
         return jsonify({'success': False, 'message': f'Servicio no encontrado: {service_name}'}), 404
 
-    # Construir URL destino
-    url = f"{service_url}{path}"
-
     method = method or request.method
 
     # Copiar headers excepto los conflictivos
-    headers = {
-        key: value for key, value in request.headers.items()
-        if key.lower() not in ['host', 'connection', 'content-length']
-    }
+    headers = forward_headers(request.headers.items())
 
     headers['X-API-Key'] = API_KEY
     headers['X-Gateway'] = 'api-gateway'
     headers['X-Forwarded-For'] = request.remote_addr
+    if 'user' in g:
+        headers.update(identity_headers(g.user))
+
+    # Caché de GET: se omite si el cliente trae sus propias condiciones o pide no usar caché
+    cache_prefix, cache_ttl = RESPONSE_CACHE.route_rule(request.path) if RESPONSE_CACHE_ENABLED else (None, None)
+    cache_key = cached = None
+    if (cache_prefix and method == 'GET'
+            and 'If-Modified-Since' not in request.headers
+            and not cache_control_forbids(request.headers.get('Cache-Control'))):
+        # El If-None-Match del cliente se responde en el gateway contra la versión cacheada
+        headers.pop('If-None-Match', None)
+        cache_key = RESPONSE_CACHE.key(
+            cache_prefix,
+            request.path,
+            request.query_string.decode('latin-1'),
+            request.headers.get('Authorization')
+        )
+        cached = RESPONSE_CACHE.get(cache_key)
+        if cached is not None and cached.is_fresh():
+            RESPONSE_CACHE.record_hit(cached)
+            return cached.to_response('HIT')
+        if cached is not None and cached.upstream_etag:
+            headers['If-None-Match'] = cached.upstream_etag
 
-    logger.info(f"Proxy → {method} {url}")
+    logger.debug("Proxy → %s %s%s", method, service_name, path)
 
     try:
         data = request.get_json(silent=True)
+        # Los cuerpos que no son JSON (NDJSON de /audit/bulk...) se reenvían tal cual
+        body = request.get_data() if data is None else None
         params = request.args
 
-        response = requests.request(
-            method=method,
-            url=url,
-            headers=headers,
-            json=data,
-            params=params,
-            timeout=30
-        )
+        def call_upstream():
+            # Solo quien llama al servicio ocupa turno de concurrencia
+            if not pool.acquire_slot():
+                raise BackendBusyError()
+            try:
+                return pool.request(
+                    method,
+                    path,
+                    headers=headers,
+                    json=data,
+                    data=body,
+                    params=params
+                )
+            finally:
+                pool.release_slot()
+
+        flight_key = SINGLE_FLIGHT.key_for(service_name, request, headers) if method == 'GET' else None
+        if flight_key is not None:
+            response = SINGLE_FLIGHT.do(flight_key, call_upstream, timeout=sum(pool.timeout))
+        else:
+            response = call_upstream()
+
+        if cache_key is not None:
+            if response.status_code == 304 and cached is not None:
+                RESPONSE_CACHE.refresh(cache_key, cached, cache_ttl)
+                RESPONSE_CACHE.record_hit(cached, revalidated=True)
+                return cached.to_response('REVALIDATED')
+
+            RESPONSE_CACHE.record_miss(len(response.content))
+            if response.status_code == 200 and not cache_control_forbids(response.headers.get('Cache-Control')):
+                entry = CachedResponse(
+                    response.status_code,
+                    passthrough_headers(response.headers),
+                    response.content,
+                    cache_ttl
+                )
+                RESPONSE_CACHE.store(cache_key, entry)
+                return entry.to_response('MISS')
+        elif cache_prefix and method in MUTATING_METHODS:
+            RESPONSE_CACHE.invalidate(cache_prefix)
 
-        return Response(
+        return client_response(
+            response.status_code,
+            passthrough_headers(response.headers),
             response.content,
-            status=response.status_code,
-            headers=dict(response.headers)
+            'MISS' if cache_key is not None else None
         )
 
+    except BackendBusyError:
+        return jsonify(TOO_MANY_REQUESTS), 429, retry_after_header(1)
+
     except requests.exceptions.Timeout:
         return jsonify({'success': False, 'message': 'Timeout al conectar con el servicio'}), 504
 
+    except CircuitOpenError as e:
+        return jsonify({'success': False, 'message': 'No se pudo conectar con el servicio'}), 503, retry_after_header(e.retry_after)
+
     except requests.exceptions.ConnectionError:
         return jsonify({'success': False, 'message': 'No se pudo conectar con el servicio'}), 503
 
@@ -127,24 +1734,142 @@ def proxy_request(service_name, path='', method=None):
 # HEALTH CHECK
 # ==========================================
 
+HEALTH_CACHE_TTL = float(os.getenv('HEALTH_CACHE_TTL', 10))
+HEALTH_REFRESH_INTERVAL = float(os.getenv('HEALTH_REFRESH_INTERVAL', 5))
+HEALTH_PROBE_TIMEOUT = float(os.getenv('HEALTH_PROBE_TIMEOUT', 5))
+# Cada ronda empieza a tiempo para terminar (como mucho HEALTH_PROBE_TIMEOUT) antes de que venza el TTL
+HEALTH_REFRESH_PERIOD = max(min(HEALTH_REFRESH_INTERVAL, HEALTH_CACHE_TTL - HEALTH_PROBE_TIMEOUT), 1.0)
+
+
+def probe_instance(pool, instance):
+    try:
+        # Los sondeos no pasan por el circuito: deben ver el servicio aunque esté abierto
+        response = pool.request(
+            'GET',
+            '/health',
+            use_breaker=False,
+            instance=instance,
+            timeout=HEALTH_PROBE_TIMEOUT,
+            headers={'X-API-Key': API_KEY}
+        )
+        status = {
+            'status': 'healthy' if response.status_code == 200 else 'unhealthy',
+            'url': instance.url,
+            'response_time': response.elapsed.total_seconds()
+        }
+    except Exception as e:
+        status = {
+            'status': 'unreachable',
+            'url': instance.url,
+            'error': str(e)
+        }
+    pool.balancer.record_probe(instance, status['status'] == 'healthy')
+    status['checked_at'] = datetime.now().isoformat()
+    return status
+
+
+def service_status(instance_statuses):
+    """Estado del servicio: sano si al menos una instancia lo está"""
+    if len(instance_statuses) == 1:
+        return instance_statuses[0]
+    healthy = [status for status in instance_statuses if status['status'] == 'healthy']
+    states = {status['status'] for status in instance_statuses}
+    return {
+        'status': 'healthy' if healthy else ('unhealthy' if 'unhealthy' in states else 'unreachable'),
+        'url': ','.join(status['url'] for status in instance_statuses),
+        'response_time': min(status['response_time'] for status in healthy) if healthy else None,
+        'checked_at': max(status['checked_at'] for status in instance_statuses),
+        'instances': instance_statuses
+    }
+
+
+class HealthCache:
+    """Estado de los servicios sondeado en paralelo y guardado durante HEALTH_CACHE_TTL"""
+
+    def __init__(self, pools):
+        self.pools = pools
+        workers = sum(len(pool.balancer.instances) for pool in pools.values())
+        self._executor = ThreadPoolExecutor(max_workers=max(workers, 1), thread_name_prefix='health')
+        self._results = {}
+        self._lock = threading.Lock()
+        # Una sola ronda de sondeo a la vez: las lecturas vencidas concurrentes esperan su resultado
+        self._probe_lock = threading.Lock()
+        self._refresher = None
+
+    def probe(self, names=None):
+        names = list(names or self.pools)
+        futures = {
+            name: [
+                self._executor.submit(probe_instance, self.pools[name], instance)
+                for instance in self.pools[name].balancer.instances
+            ]
+            for name in names
+        }
+        results = {
+            name: service_status([future.result() for future in instance_futures])
+            for name, instance_futures in futures.items()
+        }
+        checked = time.monotonic()
+        with self._lock:
+            for name, status in results.items():
+                self._results[name] = (checked, status)
+        return results
+
+    def snapshot(self, fresh=False):
+        self.start_refresher()
+        if fresh:
+            return self.probe()
+
+        if self._stale():
+            with self._probe_lock:
+                # Otra petición pudo sondear mientras esperábamos el turno
+                stale = self._stale()
+                if stale:
+                    self.probe(stale)
+
+        with self._lock:
+            return {name: self._results[name][1] for name in self.pools if name in self._results}
+
+    def _stale(self):
+        now = time.monotonic()
+        with self._lock:
+            return [
+                name for name in self.pools
+                if name not in self._results or now - self._results[name][0] > HEALTH_CACHE_TTL
+            ]
+
+    def start_refresher(self):
+        """Arranca (una vez por proceso) el hilo que mantiene la caché actualizada"""
+        if HEALTH_REFRESH_INTERVAL <= 0:
+            return
+        if self._refresher is not None and self._refresher.is_alive():
+            return
+        with self._lock:
+            if self._refresher is not None and self._refresher.is_alive():
+                return
+            self._refresher = threading.Thread(target=self._refresh_loop, name='health-refresher', daemon=True)
+            self._refresher.start()
+
+    def _refresh_loop(self):
+        # Periodo medido de inicio a inicio: la duración del sondeo no se suma al intervalo
+        next_run = time.monotonic()
+        while True:
+            try:
+                with self._probe_lock:
+                    self.probe()
+            except Exception as e:
+                logger.error(f"Error refrescando health check: {e}")
+            # Si una ronda se alargó más que el periodo, la siguiente empieza enseguida
+            next_run = max(next_run + HEALTH_REFRESH_PERIOD, time.monotonic())
+            time.sleep(max(next_run - time.monotonic(), 0))
+
+
+HEALTH = HealthCache(POOLS)
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
-    services_status = {}
-
-    for name, base_url in SERVICES.items():
-        try:
-            response = requests.get(f"{base_url}/health", timeout=5, headers={'X-API-Key': API_KEY})
-            services_status[name] = {
-                'status': 'healthy' if response.status_code == 200 else 'unhealthy',
-                'url': base_url,
-                'response_time': response.elapsed.total_seconds()
-            }
-        except Exception as e:
-            services_status[name] = {
-                'status': 'unreachable',
-                'url': base_url,
-                'error': str(e)
-            }
+    fresh = request.args.get('fresh', '').lower() in ('1', 'true')
 
     return jsonify({
         'success': True,
@@ -152,7 +1877,11 @@ def health_check():
         'status': 'healthy',
         'timestamp': datetime.now().isoformat(),
         'version': '1.0.0',
-        'services': services_status
+        'cached': not fresh,
+        'services': {
+            name: dict(status, circuit=POOLS[name].breaker.state)
+            for name, status in HEALTH.snapshot(fresh=fresh).items()
+        }
     })
 
 # ==========================================
@@ -161,7 +1890,12 @@ def health_check():
 
 @app.route('/api/auth/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE', 'PATCH'])
 def auth_proxy(path):
-    return proxy_request('auth', f'/api/{path}')
+    response = proxy_request('auth', f'/api/{path}')
+    if path == 'logout' and request.method == 'POST':
+        token, _ = parse_bearer(request.headers.get('Authorization'))
+        if token:
+            TOKEN_CACHE.forget(token)
+    return response
 
 @app.route('/api/reservas', methods=['GET', 'POST'])
 @app.route('/api/reservas/<path:path>', methods=['GET', 'POST', 'PUT', 'DELETE'])
@@ -184,6 +1918,135 @@ def reports_proxy(path):
 def audit_proxy(path):
     return proxy_request('audit', f'/{path}')
 
+# ==========================================
+# BATCH DE PETICIONES
+# ==========================================
+
+BATCH_MAX_REQUESTS = int(os.getenv('BATCH_MAX_REQUESTS', 20))
+# Tiempo total máximo del batch (s): las subpeticiones que no terminan responden 504
+BATCH_TIMEOUT = float(os.getenv('BATCH_TIMEOUT', 10))
+BATCH_WORKERS = int(os.getenv('BATCH_WORKERS', 32))
+
+BATCH_METHODS = {'GET', 'POST', 'PUT', 'PATCH', 'DELETE'}
+# Headers de la petición original que heredan todas las subpeticiones
+BATCH_INHERITED_HEADERS = ('Authorization', 'Accept', 'Accept-Language', 'User-Agent')
+# Headers que nunca llegan a una subpetición: el sobre del batch necesita el cuerpo completo y sin comprimir
+BATCH_STRIPPED_HEADERS = frozenset({'accept-encoding', 'if-none-match', 'if-modified-since'})
+# Headers de cada subrespuesta que se devuelven al cliente
+BATCH_RESPONSE_HEADERS = ('Content-Type', 'ETag', 'Cache-Control', 'X-Cache', 'Retry-After', 'Location')
+
+BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix='batch')
+
+
+class BatchError(ValueError):
+    pass
+
+
+def parse_batch(payload):
+    """Valida el cuerpo de /api/batch y devuelve la lista de subpeticiones normalizada"""
+    items = payload.get('requests') if isinstance(payload, dict) else None
+    if not isinstance(items, list) or not items:
+        raise BatchError('Se esperaba {"requests": [...]} con al menos una petición')
+    if len(items) > BATCH_MAX_REQUESTS:
+        raise BatchError(f'Máximo {BATCH_MAX_REQUESTS} peticiones por batch')
+
+    subrequests = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not isinstance(item.get('path'), str):
+            raise BatchError(f'Petición {index}: falta "path"')
+        path = item['path']
+        method = str(item.get('method', 'GET')).upper()
+        headers = item.get('headers') or {}
+        if not path.startswith('/api/') or path.startswith('/api/batch'):
+            raise BatchError(f'Petición {index}: ruta no permitida: {path}')
+        if method not in BATCH_METHODS:
+            raise BatchError(f'Petición {index}: método no permitido: {method}')
+        if not isinstance(headers, dict):
+            raise BatchError(f'Petición {index}: "headers" debe ser un objeto')
+        subrequests.append({
+            'id': item.get('id', index),
+            'method': method,
+            'path': path,
+            'headers': {str(k): str(v) for k, v in headers.items() if str(k).lower() != 'authorization'},
+            'body': item.get('body')
+        })
+    return subrequests
+
+
+def batch_result(subrequest, response):
+    body = response.get_data()
+    if not body:
+        body = None
+    elif response.is_json:
+        body = json.loads(body)
+    else:
+        body = body.decode('utf-8', errors='replace')
+    return {
+        'id': subrequest['id'],
+        'status': response.status_code,
+        'headers': {name: response.headers[name] for name in BATCH_RESPONSE_HEADERS if name in response.headers},
+        'body': body
+    }
+
+
+def run_subrequest(subrequest, inherited_headers, remote_addr):
+    """Despacha la subpetición por las mismas rutas y hooks que una petición normal del gateway"""
+    headers = {
+        name: value for name, value in {**inherited_headers, **subrequest['headers']}.items()
+        if name.lower() not in BATCH_STRIPPED_HEADERS
+    }
+    options = {'json': subrequest['body']} if subrequest['body'] is not None else {}
+    with app.test_request_context(
+        subrequest['path'],
+        method=subrequest['method'],
+        headers=headers,
+        environ_base={'REMOTE_ADDR': remote_addr},
+        **options
+    ):
+        return batch_result(subrequest, app.full_dispatch_request())
+
+
+@app.route('/api/batch', methods=['POST'])
+@require_auth
+def batch():
+    try:
+        subrequests = parse_batch(request.get_json(silent=True))
+    except BatchError as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+
+    inherited = {name: request.headers[name] for name in BATCH_INHERITED_HEADERS if name in request.headers}
+    started = time.perf_counter()
+    futures = [
+        BATCH_EXECUTOR.submit(run_subrequest, subrequest, inherited, request.remote_addr)
+        for subrequest in subrequests
+    ]
+    done, _ = wait(futures, timeout=BATCH_TIMEOUT)
+    # Las subpeticiones ya cuentan su propio tiempo de servicio
+    METRICS.add_upstream_time(time.perf_counter() - started)
+
+    results = []
+    for subrequest, future in zip(subrequests, futures):
+        if future in done:
+            try:
+                results.append(future.result())
+                continue
+            except Exception as e:
+                logger.error(f"Error en subpetición {subrequest['path']}: {e}")
+                message, status = 'Error interno del gateway', 500
+        else:
+            # Las que aún no empezaron se cancelan; las que están en curso terminan en segundo plano
+            future.cancel()
+            message, status = 'Tiempo límite del batch agotado', 504
+        results.append({
+            'id': subrequest['id'],
+            'status': status,
+            'headers': {},
+            'body': {'success': False, 'message': message}
+        })
+
+    body = json.dumps({'success': True, 'responses': results}).encode()
+    return client_response(200, {'Content-Type': 'application/json'}, body)
+
 # ==========================================
 # INFO DEL GATEWAY
 # ==========================================
@@ -194,9 +2057,129 @@ def gateway_info():
         'success': True,
         'gateway': 'API Gateway v1.0.0',
         'services': SERVICES,
-        'public_routes': PUBLIC_ROUTES
+        'public_routes': PUBLIC_ROUTES,
+        'pools': {name: pool.stats() for name, pool in POOLS.items()},
+        'token_cache': TOKEN_CACHE.stats(),
+        'rate_limit': RATE_LIMITER.stats(),
+        'single_flight': SINGLE_FLIGHT.stats(),
+        'batch': {
+            'max_requests': BATCH_MAX_REQUESTS,
+            'timeout': BATCH_TIMEOUT,
+            'workers': BATCH_WORKERS
+        },
+        'compression': {
+            'enabled': COMPRESSION_ENABLED,
+            'encodings': list(ENCODING_PREFERENCE),
+            'min_bytes': COMPRESSION_MIN_BYTES,
+            'types': list(COMPRESSION_TYPES),
+            'etags': CONDITIONAL_ETAGS
+        }
     })
 
+@app.route('/gateway/cache', methods=['GET'])
+def gateway_cache_stats():
+    return jsonify({'success': True, 'cache': RESPONSE_CACHE.stats()})
+
+CIRCUIT_STATE_VALUES = {CircuitBreaker.CLOSED: 0, CircuitBreaker.HALF_OPEN: 1, CircuitBreaker.OPEN: 2}
+
+
+def render_metrics():
+    """Contadores de peticiones (de todos los workers con METRICS_MULTIPROC_DIR) más el estado
+    de pools, cachés y breakers del worker que atiende el scrape"""
+    snap = METRICS_FILES.snapshot()
+    pools = {name: pool.stats() for name, pool in POOLS.items()}
+    cache = RESPONSE_CACHE.stats()
+    tokens = TOKEN_CACHE.stats()
+    flights = SINGLE_FLIGHT.stats()
+    out = MetricsWriter()
+
+    out.metric('gateway_requests_total', 'counter', 'Peticiones atendidas por ruta, método y status', (
+        (((('route', route), ('method', method), ('status', status))), count)
+        for (route, method, status), count in sorted(snap['requests'].items())
+    ))
+    out.metric('gateway_in_flight_requests', 'gauge', 'Peticiones en curso',
+               [((), snap['in_flight'])])
+    out.metric('gateway_request_bytes_total', 'counter', 'Bytes de cuerpo recibidos de clientes', (
+        ((('route', route),), total) for route, total in sorted(snap['request_bytes'].items())
+    ))
+    out.metric('gateway_response_bytes_total', 'counter', 'Bytes de cuerpo enviados a clientes', (
+        ((('route', route),), total) for route, total in sorted(snap['response_bytes'].items())
+    ))
+    histograms = snap['histograms']
+    out.histogram('gateway_request_duration_seconds', 'Tiempo total de la petición en el gateway',
+                  'route', histograms['request'])
+    out.histogram('gateway_overhead_duration_seconds', 'Tiempo de la petición sin contar la espera a servicios',
+                  'route', histograms['overhead'])
+    out.histogram('gateway_upstream_duration_seconds', 'Latencia de las llamadas a cada servicio',
+                  'backend', histograms['upstream'])
+    out.metric('gateway_upstream_errors_total', 'counter', 'Llamadas a servicios sin respuesta (timeout o conexión)', (
+        ((('backend', name),), count) for name, count in sorted(snap['upstream_errors'].items())
+    ))
+
+    compressed = sorted(snap['compressed'].items())
+    out.metric('gateway_compressed_responses_total', 'counter', 'Respuestas comprimidas por codificación', (
+        ((('encoding', encoding),), count) for encoding, (count, _, _) in compressed
+    ))
+    out.metric('gateway_compression_bytes_saved_total', 'counter', 'Bytes ahorrados por la compresión', (
+        ((('encoding', encoding),), before - after) for encoding, (_, before, after) in compressed
+    ))
+
+    pool_metrics = (
+        ('gateway_upstream_in_flight', 'gauge', 'in_use', 'Llamadas en curso por servicio'),
+        ('gateway_upstream_max_in_flight', 'gauge', 'max_in_use', 'Máximo de llamadas simultáneas observado'),
+        ('gateway_upstream_concurrency_limit', 'gauge', 'max_concurrency', 'Límite de concurrencia (0 = sin límite)'),
+        ('gateway_upstream_queue_rejected_total', 'counter', 'queue_rejected', 'Peticiones rechazadas por cola llena'),
+        ('gateway_pool_size', 'gauge', 'pool_size', 'Conexiones keep-alive por servicio'),
+        ('gateway_pool_requests_total', 'counter', 'requests', 'Peticiones enviadas por el pool'),
+        ('gateway_pool_connections_total', 'counter', 'misses', 'Conexiones nuevas abiertas por el pool')
+    )
+    for metric_name, kind, field, help_text in pool_metrics:
+        out.metric(metric_name, kind, help_text, (
+            ((('backend', name),), stats[field]) for name, stats in pools.items()
+        ))
+    out.metric('gateway_circuit_state', 'gauge', 'Estado del circuit breaker (0 cerrado, 1 semiabierto, 2 abierto)', (
+        ((('backend', name),), CIRCUIT_STATE_VALUES[stats['circuit']['state']]) for name, stats in pools.items()
+    ))
+    out.metric('gateway_circuit_rejected_total', 'counter', 'Peticiones rechazadas con el circuito abierto', (
+        ((('backend', name),), stats['circuit']['rejected']) for name, stats in pools.items()
+    ))
+
+    instance_metrics = (
+        ('gateway_upstream_instance_in_flight', 'gauge', 'Llamadas en curso por instancia',
+         lambda instance: instance['in_flight']),
+        ('gateway_upstream_instance_ejected', 'gauge', 'Instancia expulsada del balanceo (1) o activa (0)',
+         lambda instance: int(instance['state'] == 'ejected')),
+        ('gateway_upstream_instance_ejections_total', 'counter', 'Veces que la instancia fue expulsada',
+         lambda instance: instance['ejections']),
+        ('gateway_upstream_instance_ewma_seconds', 'gauge', 'Latencia media móvil exponencial por instancia',
+         lambda instance: instance['ewma_ms'] / 1000)
+    )
+    for metric_name, kind, help_text, value in instance_metrics:
+        out.metric(metric_name, kind, help_text, (
+            ((('backend', name), ('instance', instance['url'])), value(instance))
+            for name, stats in pools.items() for instance in stats['instances']
+        ))
+
+    out.metric('gateway_response_cache_lookups_total', 'counter', 'Consultas a la caché de respuestas por resultado', (
+        ((('result', result),), cache[field])
+        for result, field in (('hit', 'hits'), ('revalidated', 'revalidations'), ('miss', 'misses'))
+    ))
+    out.metric('gateway_response_cache_bytes', 'gauge', 'Bytes ocupados por la caché de respuestas',
+               [((), cache['bytes'])])
+    out.metric('gateway_token_cache_lookups_total', 'counter', 'Consultas a la caché de tokens por resultado', (
+        ((('result', 'hit'),), tokens['hits']), ((('result', 'miss'),), tokens['misses'])
+    ))
+    out.metric('gateway_rate_limited_total', 'counter', 'Peticiones rechazadas por rate limit',
+               [((), RATE_LIMITER.rejected)])
+    out.metric('gateway_single_flight_saved_total', 'counter', 'Llamadas a servicios ahorradas por coalescencia',
+               [((), flights['saved_upstream_calls'])])
+    return out.render()
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
 # ==========================================
 # ERRORES
 # ==========================================
@@ -221,27 +2204,44 @@ def global_exception(e):
 # LOGGING
 # ==========================================
 
-@app.before_request
-def log_before():
-    logger.info(f"[REQ] {request.method} {request.path}")
+def apply_cors(headers):
+    # Asignación por clave: Headers.update resultó más lento en benchmarks/bench_middleware.py
+    for key, value in CORS_HEADERS.items():
+        headers[key] = value
 
-@app.after_request
-def log_after(response):
-    logger.info(f"[RES] {response.status_code}")
-    return response
 
 @app.after_request
-def cors_headers(response):
-    response.headers['Access-Control-Allow-Origin'] = '*'
-    response.headers['Access-Control-Allow-Headers'] = 'Content-Type, Authorization'
-    response.headers['Access-Control-Allow-Methods'] = 'GET, POST, PUT, DELETE, PATCH, OPTIONS'
+def finish_response(response):
+    """CORS, línea de acceso muestreada y métricas en un único hook"""
+    apply_cors(response.headers)
+    if response.status_code >= 500 or random.random() < ACCESS_LOG_SAMPLE_RATE:
+        logger.info("[RES] %s %s %s", request.method, request.path, response.status_code)
+    if METRICS_ENABLED:
+        METRICS.observe_request(
+            metrics_route(),
+            request.method,
+            response.status_code,
+            request.content_length or 0,
+            response.calculate_content_length() or 0
+        )
     return response
 
 # ==========================================
 # START
 # ==========================================
 
+def init_worker():
+    """Recursos propios de cada proceso tras el fork de gunicorn (ver gunicorn.conf.py)"""
+    start_log_listener()
+    # Conexiones nuevas por worker; se reemplazan en el mismo dict porque HEALTH y
+    # gateway_asgi guardan la referencia a POOLS
+    inherited = list(POOLS.values())
+    POOLS.update(build_pools())
+    for pool in inherited:
+        pool.close()
+
 if __name__ == '__main__':
+    HEALTH.start_refresher()
     port = int(os.getenv('PORT', 3000))
     print("🚀 API GATEWAY listo")
     app.run(host='0.0.0.0', port=port, debug=False)
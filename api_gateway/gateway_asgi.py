@@ -0,0 +1,463 @@
+"""
+Modo asíncrono (ASGI) del API Gateway.
+
+Mismas rutas de proxy, autenticación y CORS que gateway.py, pero sobre asyncio:
+los cuerpos de petición y respuesta se reenvían por bloques sin cargarlos
+en memoria, y una espera a un servicio lento no bloquea un worker.
+
+No incluye /metrics, /api/batch, /gateway/cache, la caché de respuestas,
+single-flight ni la compresión del modo Flask (ver README).
+
+Ejecutar:
+    uvicorn gateway_asgi:app --host 0.0.0.0 --port 3000
+    gunicorn -k uvicorn.workers.UvicornWorker --workers 2 --bind 0.0.0.0:3000 gateway_asgi:app
+"""
+import asyncio
+import contextlib
+import functools
+import json
+import logging
+import os
+import random
+import time
+from datetime import datetime
+from urllib.parse import parse_qs, quote
+
+import httpx
+
+from gateway import (
+    ACCESS_LOG_SAMPLE_RATE,
+    API_KEY,
+    BREAKER_FAILURE_STATUSES,
+    CORS_HEADERS,
+    HEALTH,
+    IDENTITY_HEADER_NAMES,
+    BACKEND_QUEUE_TIMEOUT,
+    POOLS,
+    PUBLIC_ROUTES,
+    RATE_LIMIT_ENABLED,
+    RATE_LIMITER,
+    TOO_MANY_REQUESTS,
+    SERVICES,
+    TOKEN_CACHE,
+    TOKEN_VERIFY_ENABLED,
+    TOKEN_VERIFY_PATH,
+    UPSTREAM_KEEPALIVE,
+    UPSTREAM_POOL_SIZE,
+    TokenCache,
+    TokenVerificationError,
+    identity_headers,
+    is_public_route,
+    parse_bearer,
+    retry_after_header,
+    service_timeout,
+    token_verification_result,
+)
+
+logger = logging.getLogger('gateway_asgi')
+# httpx registra cada petición a INFO: una línea por llamada a los servicios
+logging.getLogger('httpx').setLevel(logging.WARNING)
+
+# ==========================================
+# CONFIGURACIÓN
+# ==========================================
+
+ASGI_MAX_CONNECTIONS = int(os.getenv('ASGI_MAX_CONNECTIONS', 500))
+ASGI_POOL_TIMEOUT = float(os.getenv('ASGI_POOL_TIMEOUT', 10))
+
+# Headers que no se reenvían (hop-by-hop)
+HOP_BY_HOP = {
+    'host', 'connection', 'keep-alive', 'proxy-connection', 'te', 'trailer',
+    'transfer-encoding', 'upgrade', 'proxy-authenticate', 'proxy-authorization'
+}
+
+# La identidad del usuario solo la pone el gateway
+REQUEST_SKIP_HEADERS = HOP_BY_HOP | IDENTITY_HEADER_NAMES
+
+# El servidor ASGI agrega sus propios Date y Server
+RESPONSE_SKIP_HEADERS = HOP_BY_HOP | {'date', 'server'}
+
+CORS_RAW_HEADERS = [(k.lower().encode(), v.encode()) for k, v in CORS_HEADERS.items()]
+
+# (endpoint, prefijo público, servicio, prefijo destino, métodos, requiere auth)
+ROUTES = [
+    ('auth_proxy', '/api/auth/', 'auth', '/api/',
+     {'GET', 'POST', 'PUT', 'DELETE', 'PATCH'}, False),
+    ('reservations_proxy', '/api/reservas/', 'reservations', '/api/reservas/',
+     {'GET', 'POST', 'PUT', 'DELETE'}, True),
+    ('notifications_proxy', '/api/notifications/', 'notifications', '/',
+     {'GET', 'POST', 'PUT', 'DELETE'}, True),
+    ('reports_proxy', '/api/reports/', 'reports', '/api/',
+     {'GET', 'POST'}, True),
+    ('audit_proxy', '/api/audit/', 'audit', '/',
+     {'GET', 'POST'}, True),
+]
+
+# /api/reservas sin subruta acepta solo GET y POST
+EXACT_ROUTES = {
+    '/api/reservas': ('reservations_proxy', 'reservations', '/api/reservas', {'GET', 'POST'}, True)
+}
+
+
+def resolve_route(path):
+    """Devuelve (endpoint, servicio, ruta destino, métodos, requiere auth) o None"""
+    if path in EXACT_ROUTES:
+        return EXACT_ROUTES[path]
+
+    for endpoint, prefix, service, target, methods, protected in ROUTES:
+        if path.startswith(prefix) and len(path) > len(prefix):
+            return endpoint, service, target + path[len(prefix):], methods, protected
+
+    return None
+
+# ==========================================
+# CLIENTES HTTP ASÍNCRONOS
+# ==========================================
+
+CLIENTS = {}
+# Límite de peticiones simultáneas por servicio (se crea dentro del event loop)
+SLOTS = {}
+
+
+def build_clients():
+    clients = {}
+    SLOTS.clear()
+    for name, pool in POOLS.items():
+        if pool.max_concurrency > 0:
+            SLOTS[name] = asyncio.Semaphore(pool.max_concurrency)
+        connect, read = service_timeout(name)
+        # Un cliente por servicio; la instancia la elige el mismo balanceador del modo Flask
+        clients[name] = httpx.AsyncClient(
+            timeout=httpx.Timeout(read, connect=connect, pool=ASGI_POOL_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=ASGI_MAX_CONNECTIONS,
+                max_keepalive_connections=UPSTREAM_POOL_SIZE * len(pool.balancer.instances) if UPSTREAM_KEEPALIVE else 0
+            )
+        )
+    return clients
+
+
+@contextlib.asynccontextmanager
+async def balanced_stream(client, service_name, method, target, **kwargs):
+    """Envía a la instancia que elige el balanceador y le informa la latencia o el fallo.
+
+    La instancia cuenta como ocupada hasta que se cierra la respuesta, no solo hasta
+    recibir los headers: una descarga larga pesa en least-connections y en la latencia.
+    """
+    balancer = POOLS[service_name].balancer
+    instance = balancer.acquire()
+    started = time.perf_counter()
+    failed = False
+    try:
+        request = client.build_request(method, f'{instance.url}{target}', **kwargs)
+        response = await client.send(request, stream=True)
+        failed = response.status_code in BREAKER_FAILURE_STATUSES
+        try:
+            yield response
+        finally:
+            await response.aclose()
+    except httpx.TransportError:
+        failed = True
+        raise
+    finally:
+        balancer.release(instance, time.perf_counter() - started, failed)
+
+
+async def balanced_send(client, service_name, method, target, **kwargs):
+    """balanced_stream para respuestas pequeñas: lee el cuerpo entero y libera la instancia"""
+    async with balanced_stream(client, service_name, method, target, **kwargs) as response:
+        await response.aread()
+    return response
+
+
+async def close_clients():
+    await asyncio.gather(*(client.aclose() for client in CLIENTS.values()))
+    CLIENTS.clear()
+
+# ==========================================
+# RESPUESTAS
+# ==========================================
+
+def raw_headers(headers):
+    return [(key.lower().encode(), value.encode()) for key, value in headers.items()]
+
+
+async def send_json(send, payload, status=200, extra_headers=()):
+    body = json.dumps(payload).encode()
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [
+            (b'content-type', b'application/json'),
+            (b'content-length', str(len(body)).encode()),
+            *CORS_RAW_HEADERS,
+            *extra_headers
+        ]
+    })
+    await send({'type': 'http.response.body', 'body': body})
+
+
+async def stream_request_body(receive):
+    """Reenvía el cuerpo de la petición por bloques a medida que llega"""
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            return
+        chunk = message.get('body', b'')
+        if chunk:
+            yield chunk
+        if not message.get('more_body', False):
+            return
+
+# ==========================================
+# PROXY REQUEST
+# ==========================================
+
+async def proxy_request(scope, receive, send, service_name, path, user=None):
+    client = CLIENTS.get(service_name)
+
+    if client is None:
+        return await send_json(send, {'success': False, 'message': f'Servicio no encontrado: {service_name}'}, 404)
+
+    method = scope['method']
+    headers = [
+        (key, value) for key, value in scope['headers']
+        if key.decode('latin-1').lower() not in REQUEST_SKIP_HEADERS
+    ]
+    headers.append((b'x-api-key', API_KEY.encode()))
+    headers.append((b'x-gateway', b'api-gateway'))
+    if scope.get('client'):
+        headers.append((b'x-forwarded-for', scope['client'][0].encode()))
+    if user:
+        headers.extend((k.lower().encode(), v.encode()) for k, v in identity_headers(user).items())
+
+    target = quote(path)
+    if scope.get('query_string'):
+        target = f"{target}?{scope['query_string'].decode('latin-1')}"
+
+    logger.debug("Proxy → %s %s%s", method, service_name, path)
+
+    has_body = any(key.lower() in (b'content-length', b'transfer-encoding') for key, _ in scope['headers'])
+    upstream_request = {
+        'headers': headers,
+        'content': stream_request_body(receive) if has_body else None
+    }
+
+    # Cola corta: si no hay turno en BACKEND_QUEUE_TIMEOUT se rechaza con 429
+    slots = SLOTS.get(service_name)
+    if slots is not None:
+        try:
+            await asyncio.wait_for(slots.acquire(), BACKEND_QUEUE_TIMEOUT)
+        except asyncio.TimeoutError:
+            POOLS[service_name].record_queue_rejected()
+            return await send_json(send, TOO_MANY_REQUESTS, 429, raw_headers(retry_after_header(1)))
+    try:
+        await forward(send, client, service_name, method, target, upstream_request)
+    finally:
+        if slots is not None:
+            slots.release()
+
+
+async def forward(send, client, service_name, method, target, upstream_request):
+    """Envía la petición al servicio y reenvía la respuesta por bloques"""
+    # Mismo circuit breaker por servicio que el modo Flask
+    breaker = POOLS[service_name].breaker
+    if not breaker.allow_request():
+        return await send_json(send, {'success': False, 'message': 'No se pudo conectar con el servicio'}, 503,
+                               raw_headers(retry_after_header(breaker.retry_after())))
+
+    async with contextlib.AsyncExitStack() as stack:
+        try:
+            response = await stack.enter_async_context(
+                balanced_stream(client, service_name, method, target, **upstream_request)
+            )
+        except httpx.TimeoutException:
+            breaker.record_failure()
+            return await send_json(send, {'success': False, 'message': 'Timeout al conectar con el servicio'}, 504)
+        except httpx.TransportError:
+            breaker.record_failure()
+            return await send_json(send, {'success': False, 'message': 'No se pudo conectar con el servicio'}, 503)
+        except Exception as e:
+            breaker.release()
+            logger.error(f"Error inesperado: {e}")
+            return await send_json(send, {'success': False, 'message': 'Error interno del gateway'}, 500)
+
+        breaker.record_status(response.status_code)
+
+        try:
+            response_headers = [
+                (key, value) for key, value in response.headers.raw
+                if key.decode('latin-1').lower() not in RESPONSE_SKIP_HEADERS
+                and not key.lower().startswith(b'access-control-')
+            ]
+            response_headers.extend(CORS_RAW_HEADERS)
+            await send({
+                'type': 'http.response.start',
+                'status': response.status_code,
+                'headers': response_headers
+            })
+            # aiter_raw conserva el Content-Encoding original (p. ej. gzip) sin descomprimir
+            async for chunk in response.aiter_raw():
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+            await send({'type': 'http.response.body', 'body': b''})
+        except Exception as e:
+            # Los headers ya se enviaron: solo queda cortar la respuesta
+            logger.error(f"Error reenviando respuesta de {service_name}: {e}")
+
+# ==========================================
+# AUTENTICACIÓN
+# ==========================================
+
+async def verify_token(token):
+    """Igual que gateway.verify_token, pero consulta /api/me sin bloquear el event loop"""
+    cached = TOKEN_CACHE.get(token)
+    if cached is not TokenCache.MISSING:
+        return cached
+
+    try:
+        response = await balanced_send(CLIENTS['auth'], 'auth', 'GET', TOKEN_VERIFY_PATH, headers={
+            'Authorization': f'Bearer {token}',
+            'Accept': 'application/json',
+            'X-API-Key': API_KEY,
+            'X-Gateway': 'api-gateway'
+        })
+        payload = response.json() if response.status_code == 200 else {}
+    except (httpx.HTTPError, ValueError) as e:
+        raise TokenVerificationError(str(e))
+
+    user = token_verification_result(response.status_code, payload)
+    TOKEN_CACHE.put(token, user)
+    return user
+
+# ==========================================
+# HEALTH CHECK E INFO
+# ==========================================
+
+async def health_check(scope, receive, send):
+    """Misma caché y configuración de sondeo que el modo Flask; los sondeos corren fuera del event loop"""
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    fresh = query.get('fresh', [''])[0].lower() in ('1', 'true')
+    services = await asyncio.get_running_loop().run_in_executor(None, functools.partial(HEALTH.snapshot, fresh=fresh))
+    await send_json(send, {
+        'success': True,
+        'service': 'api-gateway',
+        'status': 'healthy',
+        'timestamp': datetime.now().isoformat(),
+        'version': '1.0.0',
+        'engine': 'asgi',
+        'cached': not fresh,
+        'services': {
+            name: dict(status, circuit=POOLS[name].breaker.state)
+            for name, status in services.items()
+        }
+    })
+
+
+async def gateway_info(scope, receive, send):
+    await send_json(send, {
+        'success': True,
+        'gateway': 'API Gateway v1.0.0',
+        'engine': 'asgi',
+        'services': SERVICES,
+        'public_routes': PUBLIC_ROUTES,
+        'circuits': {name: pool.breaker.stats() for name, pool in POOLS.items()},
+        'instances': {
+            name: {'strategy': pool.balancer.strategy, 'instances': pool.balancer.stats()}
+            for name, pool in POOLS.items()
+        },
+        'token_cache': TOKEN_CACHE.stats(),
+        'rate_limit': RATE_LIMITER.stats()
+    })
+
+# ==========================================
+# APLICACIÓN ASGI
+# ==========================================
+
+async def lifespan(scope, receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            CLIENTS.update(build_clients())
+            HEALTH.start_refresher()
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await close_clients()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(scope, receive, send)
+    if scope['type'] != 'http':
+        return
+
+    # Servidores sin lifespan: se crean los clientes en la primera petición
+    if not CLIENTS:
+        CLIENTS.update(build_clients())
+
+    method = scope['method']
+    path = scope['path']
+    if random.random() < ACCESS_LOG_SAMPLE_RATE:
+        logger.info("[REQ] %s %s", method, path)
+
+    if path == '/health':
+        if method not in ('GET', 'HEAD'):
+            return await send_json(send, {'success': False, 'message': 'The method is not allowed for the requested URL.'}, 405)
+        return await health_check(scope, receive, send)
+
+    if path == '/gateway/info':
+        if method not in ('GET', 'HEAD'):
+            return await send_json(send, {'success': False, 'message': 'The method is not allowed for the requested URL.'}, 405)
+        return await gateway_info(scope, receive, send)
+
+    if RATE_LIMIT_ENABLED:
+        auth_header = dict(scope['headers']).get(b'authorization')
+        client_ip = scope['client'][0] if scope.get('client') else ''
+        check = (path, client_ip, auth_header.decode('latin-1') if auth_header else None)
+        if RATE_LIMITER.store.name == 'redis':
+            # La consulta a Redis es bloqueante: se hace en un hilo para no detener el event loop
+            retry_after = await asyncio.get_running_loop().run_in_executor(None, RATE_LIMITER.check, *check)
+        else:
+            retry_after = RATE_LIMITER.check(*check)
+        if retry_after is not None:
+            return await send_json(send, TOO_MANY_REQUESTS, 429, raw_headers(retry_after_header(retry_after)))
+
+    route = resolve_route(path)
+    if route is None:
+        return await send_json(send, {
+            'success': False,
+            'message': 'Ruta no encontrada en el Gateway',
+            'path': path
+        }, 404)
+
+    endpoint, service_name, target, methods, protected = route
+
+    if method == 'OPTIONS':
+        return await send_json(send, {'success': True})
+
+    if method not in methods and not (method == 'HEAD' and 'GET' in methods):
+        return await send_json(send, {'success': False, 'message': 'The method is not allowed for the requested URL.'}, 405)
+
+    auth_header = dict(scope['headers']).get(b'authorization')
+    token, error = parse_bearer(auth_header.decode('latin-1') if auth_header else None)
+
+    user = None
+    if protected and not is_public_route(path):
+        if error:
+            return await send_json(send, {'success': False, 'message': error}, 401)
+
+        if TOKEN_VERIFY_ENABLED:
+            try:
+                user = await verify_token(token)
+            except TokenVerificationError as e:
+                logger.error(f"No se pudo verificar el token: {e}")
+                return await send_json(send, {'success': False, 'message': 'No se pudo verificar el token'}, 503)
+
+            if user is None:
+                return await send_json(send, {'success': False, 'message': 'Token inválido o expirado'}, 401)
+
+    await proxy_request(scope, receive, send, service_name, target, user)
+
+    if endpoint == 'auth_proxy' and target == '/api/logout' and method == 'POST' and token:
+        TOKEN_CACHE.forget(token)
@@ -0,0 +1,64 @@
+"""
+Configuración de gunicorn para producción del API Gateway.
+
+gunicorn la carga automáticamente desde el directorio de trabajo:
+    gunicorn gateway:app
+    GUNICORN_WORKER_CLASS=uvicorn.workers.UvicornWorker gunicorn gateway_asgi:app
+
+Recarga elegante (workers nuevos, los actuales terminan sus peticiones):
+    kill -HUP <pid del master>
+Con GUNICORN_PRELOAD=True el código se carga una vez en el master: HUP recarga
+la configuración pero no el código; para desplegar código nuevo sin cortar
+conexiones use USR2 + QUIT sobre el master anterior.
+"""
+import glob
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 3000)}"
+
+# Procesos: ~2 por núcleo; hilos por proceso para las esperas a los servicios
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = os.getenv('GUNICORN_WORKER_CLASS', 'gthread' if threads > 1 else 'sync')
+
+# El código se importa una vez en el master y los workers lo comparten (copy-on-write)
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+# Reciclar workers cada N peticiones (0 = nunca); el jitter evita que reinicien todos a la vez
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+# El gateway ya escribe su línea de acceso muestreada (ACCESS_LOG_SAMPLE_RATE)
+accesslog = os.getenv('GUNICORN_ACCESS_LOG') or None
+errorlog = '-'
+
+
+def on_starting(server):
+    # Las métricas compartidas empiezan de cero con cada arranque del master
+    metrics_dir = os.getenv('METRICS_MULTIPROC_DIR')
+    if metrics_dir:
+        for path in glob.glob(os.path.join(metrics_dir, '*.json*')):
+            os.remove(path)
+
+
+def post_fork(server, worker):
+    # Pools de conexión e hilo de logs propios de cada worker (sin preload, el import del worker ya los crea)
+    if server.cfg.preload_app:
+        import gateway
+        gateway.init_worker()
+
+
+def post_worker_init(worker):
+    # El refresco de /health arranca con el worker (con o sin preload), no con la primera petición
+    import gateway
+    gateway.HEALTH.start_refresher()
+    gateway.METRICS_FILES.start()
+
+
+def worker_exit(server, worker):
+    # Último volcado: lo que atendió el worker sigue sumando en /metrics
+    import gateway
+    gateway.METRICS_FILES.write()
@@ -0,0 +1,58 @@
+import json
+import os
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+
+class Backend(BaseHTTPRequestHandler):
+    """Servicio de prueba: responde JSON (de más de COMPRESSION_MIN_BYTES, con ETag fijo) con la petición recibida"""
+
+    def _reply(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            self.rfile.read(length)
+        body = json.dumps({
+            'method': self.command,
+            'path': self.path,
+            'headers': dict(self.headers),
+            'padding': 'x' * 4096
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('ETag', '"backend"')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    do_GET = do_POST = do_PUT = do_PATCH = do_DELETE = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+BACKEND = ThreadingHTTPServer(('127.0.0.1', 0), Backend)
+threading.Thread(target=BACKEND.serve_forever, daemon=True).start()
+BACKEND_URL = f'http://127.0.0.1:{BACKEND.server_address[1]}'
+
+# Todos los servicios apuntan al backend de prueba; sin verificación de tokens, rate limit ni caché
+for name in ('AUTH', 'RESERVATION', 'NOTIFICATIONS', 'REPORTS', 'AUDIT'):
+    os.environ[f'{name}_SERVICE_URL'] = BACKEND_URL
+os.environ.setdefault('TOKEN_VERIFY_ENABLED', 'False')
+os.environ.setdefault('RATE_LIMIT_ENABLED', 'False')
+os.environ.setdefault('RESPONSE_CACHE_ENABLED', 'False')
+os.environ.setdefault('ACCESS_LOG_ASYNC', 'False')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture
+def gateway():
+    import gateway
+    return gateway
+
+
+@pytest.fixture
+def client(gateway):
+    return gateway.app.test_client()
@@ -0,0 +1,32 @@
+import asyncio
+
+
+def test_streamed_response_keeps_instance_busy_until_body_ends(gateway):
+    import gateway_asgi
+
+    instance = gateway_asgi.POOLS['reservations'].balancer.instances[0]
+    in_flight_while_streaming = []
+    messages = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(message):
+        messages.append(message)
+        if message['type'] == 'http.response.body':
+            in_flight_while_streaming.append(instance.in_flight)
+
+    async def run():
+        scope = {
+            'type': 'http', 'method': 'GET', 'path': '/api/reservas/1', 'query_string': b'',
+            'headers': [(b'authorization', b'Bearer token')], 'client': ('127.0.0.1', 5000)
+        }
+        try:
+            await gateway_asgi.app(scope, receive, send)
+        finally:
+            await gateway_asgi.close_clients()
+
+    asyncio.run(run())
+    assert messages[0]['status'] == 200
+    assert in_flight_while_streaming and all(count == 1 for count in in_flight_while_streaming)
+    assert instance.in_flight == 0
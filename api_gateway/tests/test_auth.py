@@ -0,0 +1,13 @@
+import pytest
+
+
+@pytest.mark.parametrize('payload', [[], None, 'ok', 1, {'user': 'x'}])
+def test_unexpected_me_payload_is_verification_error(gateway, payload):
+    with pytest.raises(gateway.TokenVerificationError):
+        gateway.token_verification_result(200, payload)
+
+
+def test_me_payload_shapes(gateway):
+    user = {'id': 7, 'email': 'a@b.c', 'role': 'admin'}
+    for payload in (user, {'user': user}, {'data': {'user': user}}):
+        assert gateway.token_verification_result(200, payload) == user
@@ -0,0 +1,17 @@
+AUTH = {'Authorization': 'Bearer token'}
+
+
+def test_batch_ignores_encoding_and_conditional_headers(client):
+    response = client.post('/api/batch', headers=AUTH, json={'requests': [
+        {'id': 'a', 'path': '/api/reservas'},
+        {'id': 'b', 'path': '/api/reservas/1', 'headers': {
+            'Accept-Encoding': 'gzip', 'If-None-Match': '*', 'If-Modified-Since': 'Mon, 01 Jan 2024 00:00:00 GMT'
+        }},
+    ]})
+    assert response.status_code == 200
+    results = {result['id']: result for result in response.get_json()['responses']}
+    for result in results.values():
+        assert result['status'] == 200
+        sent = {name.lower() for name in result['body']['headers']}
+        assert not sent & {'if-none-match', 'if-modified-since'}
+    assert results['b']['body']['path'] == '/api/reservas/1'
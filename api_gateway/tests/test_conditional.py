@@ -0,0 +1,14 @@
+import pytest
+
+AUTH = {'Authorization': 'Bearer token'}
+
+
+def test_get_with_matching_etag_is_not_modified(client):
+    response = client.get('/api/reservas', headers={**AUTH, 'If-None-Match': '*'})
+    assert response.status_code == 304
+
+
+@pytest.mark.parametrize('method', ['POST', 'PUT', 'DELETE'])
+def test_writes_ignore_if_none_match(client, method):
+    response = client.open('/api/reservas/1', method=method, headers={**AUTH, 'If-None-Match': '*'}, json={})
+    assert response.status_code == 200
@@ -0,0 +1,23 @@
+import threading
+import time
+
+
+def test_stale_reads_share_one_probe(gateway, monkeypatch):
+    monkeypatch.setattr(gateway, 'HEALTH_REFRESH_INTERVAL', 0)
+    health = gateway.HealthCache(gateway.POOLS)
+    rounds = []
+
+    def probe(names=None):
+        rounds.append(names)
+        time.sleep(0.2)
+        with health._lock:
+            for name in gateway.POOLS:
+                health._results[name] = (time.monotonic(), {'status': 'healthy'})
+    monkeypatch.setattr(health, 'probe', probe)
+
+    readers = [threading.Thread(target=health.snapshot) for _ in range(8)]
+    for reader in readers:
+        reader.start()
+    for reader in readers:
+        reader.join()
+    assert len(rounds) == 1
@@ -0,0 +1,45 @@
+import threading
+
+import pytest
+
+
+def test_rejection_counters_are_exact_under_threads(gateway):
+    limiter = gateway.RateLimiter({'/api': (0.001, 1.0)}, gateway.MemoryBucketStore(1000))
+    pool = gateway.UpstreamPool('prueba', gateway.SERVICES['reservations'])
+
+    def hammer():
+        for _ in range(500):
+            limiter.check('/api/reservas', '10.0.0.1', None)
+            pool.record_queue_rejected()
+
+    threads = [threading.Thread(target=hammer) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert limiter.stats()['rejected'] == 8 * 500 - 1
+    assert pool.stats()['queue_rejected'] == 8 * 500
+
+
+def test_ip_rejection_does_not_spend_subject_quota(gateway):
+    limiter = gateway.RateLimiter({'/api': (0.001, 1.0)}, gateway.MemoryBucketStore(1000))
+    assert limiter.check('/api/reservas', '10.0.0.1', None) is None
+    # La IP ya no tiene tokens: el rechazo no debe gastar el bucket del token
+    assert limiter.check('/api/reservas', '10.0.0.1', 'Bearer abc') is not None
+    assert limiter.check('/api/reservas', '10.0.0.2', 'Bearer abc') is None
+
+
+def test_invalid_rate_limits_fail_at_startup(gateway):
+    with pytest.raises(ValueError):
+        gateway.parse_rate_limits('/api=0/10')
+    with pytest.raises(ValueError):
+        gateway.parse_rate_limits('/api=5/0.5')
+
+
+def test_redis_unavailable_at_build_falls_back_to_memory(gateway, monkeypatch):
+    def unreachable(url):
+        raise ConnectionError('Redis caído')
+
+    monkeypatch.setattr(gateway, 'RATE_LIMIT_REDIS_URL', 'redis://localhost:1/0')
+    monkeypatch.setattr(gateway, 'RedisBucketStore', unreachable)
+    assert isinstance(gateway.build_bucket_store(), gateway.MemoryBucketStore)
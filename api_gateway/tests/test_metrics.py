@@ -0,0 +1,28 @@
+import json
+
+
+def test_metrics_add_up_every_worker(gateway, client, tmp_path, monkeypatch):
+    files = gateway.MetricsFiles(str(tmp_path), 3600)
+    files.start()
+    monkeypatch.setattr(gateway, 'METRICS_FILES', files)
+
+    # Otro worker ya terminado: sus contadores cuentan, sus peticiones en curso no
+    buckets = [[bound, 3] for bound in gateway.METRICS_LATENCY_BUCKETS] + [[float('inf'), 3]]
+    (tmp_path / '999999999-1.json').write_text(json.dumps({
+        'pid': 999999999,
+        'in_flight': 7,
+        'requests': [['/api/reservas/<path:path>', 'GET', 200, 1000]],
+        'request_bytes': {}, 'response_bytes': {}, 'upstream_errors': {}, 'compressed': {},
+        'histograms': {'request': [['/api/reservas/<path:path>', buckets, 0.5, 3]], 'overhead': [], 'upstream': []}
+    }))
+
+    client.get('/api/reservas/1', headers={'Authorization': 'Bearer token'})
+    body = client.get('/metrics').get_data(as_text=True)
+    local = gateway.METRICS.snapshot()
+    requests = local['requests'][('/api/reservas/<path:path>', 'GET', 200)]
+    _, _, latencies = local['histograms']['request']['/api/reservas/<path:path>']
+
+    assert f'gateway_requests_total{{route="/api/reservas/<path:path>",method="GET",status="200"}} {1000 + requests}' in body
+    assert f'gateway_request_duration_seconds_count{{route="/api/reservas/<path:path>"}} {3 + latencies}' in body
+    # Solo la petición a /metrics sigue en curso
+    assert 'gateway_in_flight_requests 1\n' in body
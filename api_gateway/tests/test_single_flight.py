@@ -0,0 +1,7 @@
+def test_protected_routes_key_by_subject_without_auth_part(gateway):
+    flights = gateway.SingleFlight('/api/reservas', 'path,query')
+    keys = set()
+    for token in ('uno', 'dos'):
+        with gateway.app.test_request_context('/api/reservas', headers={'Authorization': f'Bearer {token}'}):
+            keys.add(flights.key_for('reservations', gateway.request, {}))
+    assert len(keys) == 2
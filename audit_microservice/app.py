@@ -1,11 +1,26 @@
 from flask import Flask, jsonify, request
-from pymongo import MongoClient
-from datetime import datetime
-from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, MongoClient, UpdateOne, WriteConcern
+from pymongo.errors import BulkWriteError, DuplicateKeyError, PyMongoError
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from bson import ObjectId, json_util
 from flask.json.provider import DefaultJSONProvider
 from functools import wraps  # Import necesario para el decorador
+import atexit
+import base64
+import codecs
+import gzip
+import heapq
+import itertools
 import os
 import json
+import queue
+import re
+import socket
+import tempfile
+import threading
+import time
+import uuid
 
 # -----------------------------------------------------------
 # Configuración base del microservicio
@@ -20,15 +35,46 @@ MICROSERVICE_NAME = 'audit'
 MONGO_URI = os.getenv("MONGO_URI", "mongodb://localhost:27017")
 MONGO_DB = os.getenv("MONGO_DB", "audit_db")
 
-try:
-    client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-    db = client[MONGO_DB]
-    # Verificamos conexión inicial
-    client.server_info()
-    auditoria_collection = db["audit_logs"] # Cambié nombre a uno más estándar, puedes usar el que quieras
-except Exception as e:
-    print(f"Error conectando a MongoDB: {e}")
-    auditoria_collection = None
+client = None
+db = None
+auditoria_collection = None
+
+
+def connect_mongo():
+    """Abre el cliente de Mongo del proceso actual (MongoClient no se comparte entre forks)"""
+    global client, db, auditoria_collection
+    try:
+        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000, tz_aware=True)
+        db = client[MONGO_DB]
+        # Verificamos conexión inicial
+        client.server_info()
+        auditoria_collection = db[AUDIT_COLLECTION] # Cambié nombre a uno más estándar, puedes usar el que quieras
+    except Exception as e:
+        print(f"Error conectando a MongoDB: {e}")
+        auditoria_collection = None
+        return
+    if AUDIT_MANAGE_INDEXES:
+        try:
+            prepare_collection(auditoria_collection)
+            migrate_fecha(auditoria_collection)
+            prepare_rollups()
+        except Exception as e:
+            print(f"Error preparando índices de auditoría: {e}")
+
+
+def close_mongo():
+    """Cierra el cliente antes del fork: cada worker de gunicorn abre el suyo"""
+    global client, db, auditoria_collection
+    if client is not None:
+        client.close()
+    client = db = auditoria_collection = None
+
+
+def init_worker():
+    """Recursos propios de cada worker de gunicorn (ver gunicorn.conf.py)"""
+    connect_mongo()
+    start_buffer()
+    start_maintenance()
 
 # -----------------------------------------------------------
 # Middleware de Seguridad
@@ -62,6 +108,938 @@ class CustomJSONProvider(DefaultJSONProvider):
 
 app.json = CustomJSONProvider(app)
 
+# -----------------------------------------------------------
+# Índices, filtros y paginación por cursor
+# -----------------------------------------------------------
+AUDIT_MANAGE_INDEXES = os.getenv('AUDIT_MANAGE_INDEXES', 'True') == 'True'
+AUDIT_PAGE_DEFAULT = int(os.getenv('AUDIT_PAGE_DEFAULT', 100))
+AUDIT_PAGE_MAX = int(os.getenv('AUDIT_PAGE_MAX', 1000))
+AUDIT_EXPORT_BATCH = int(os.getenv('AUDIT_EXPORT_BATCH', 1000))   # Documentos por lote del cursor de exportación
+
+EXPORT_MIMETYPES = {'ndjson': 'application/x-ndjson', 'json': 'application/json'}
+
+# Orden estable (fecha, _id) descendente: el _id desempata eventos del mismo milisegundo
+AUDIT_SORT = [("fecha", DESCENDING), ("_id", DESCENDING)]
+AUDIT_INDEXES = [
+    AUDIT_SORT,
+    [("user_id", ASCENDING)] + AUDIT_SORT,
+    [("action", ASCENDING)] + AUDIT_SORT,
+]
+AUDIT_FIELDS = frozenset({'action', 'user_id', 'fecha', 'ip', 'details'})
+
+
+def prepare_collection(collection):
+    """Crea los índices de una colección de eventos"""
+    indexes = [IndexModel(keys) for keys in AUDIT_INDEXES]
+    if AUDIT_PARTITIONING != 'monthly' and AUDIT_RETENTION_DAYS:
+        # Sin particiones la retención la aplica Mongo evento a evento
+        indexes.append(IndexModel([("fecha", ASCENDING)], expireAfterSeconds=AUDIT_RETENTION_DAYS * 86400))
+    collection.create_indexes(indexes)
+
+
+def migrate_fecha(collection):
+    """Convierte a fecha real los eventos antiguos guardados como texto ISO"""
+    # Con el índice de fecha el filtro por $type solo recorre los pendientes: tras la primera vez no hace nada.
+    # isoformat() trae microsegundos y Mongo guarda milisegundos: se recorta a 23 caracteres
+    result = collection.update_many(
+        {"fecha": {"$type": "string"}},
+        [{"$set": {"fecha": {"$dateFromString": {
+            "dateString": {"$substrCP": ["$fecha", 0, 23]},
+            "onError": "$fecha"
+        }}}}]
+    )
+    if result.modified_count:
+        print(f"Auditoría: {result.modified_count} eventos con fecha de texto convertidos a fecha")
+
+
+def parse_fecha(value, name):
+    """Fecha ISO 8601 de un parámetro (sin zona se asume UTC)"""
+    try:
+        fecha = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        raise ValueError(f"Parámetro {name} inválido: use una fecha ISO 8601")
+    return fecha if fecha.tzinfo else fecha.replace(tzinfo=timezone.utc)
+
+
+def audit_filter(args):
+    """Filtro de Mongo a partir de user_id, action, ip, desde y hasta"""
+    query = {}
+    user_id = args.get('user_id')
+    if user_id:
+        # user_id llega como texto y se guarda tal como lo envía el servicio (texto o número)
+        query["user_id"] = {"$in": [user_id, int(user_id)]} if user_id.isdigit() else user_id
+    for field in ('action', 'ip'):
+        if args.get(field):
+            query[field] = args[field]
+    rango = {}
+    if args.get('desde'):
+        rango["$gte"] = parse_fecha(args['desde'], 'desde')
+    if args.get('hasta'):
+        rango["$lt"] = parse_fecha(args['hasta'], 'hasta')
+    if rango:
+        query["fecha"] = rango
+    return query
+
+
+def audit_projection(fields):
+    """Proyección del parámetro fields (lista separada por comas); _id y fecha siempre se incluyen"""
+    if not fields:
+        return None
+    projection = {"fecha": 1}
+    for field in filter(None, (f.strip() for f in fields.split(','))):
+        if field.split('.')[0] not in AUDIT_FIELDS:
+            raise ValueError(f"Campo desconocido en fields: {field}")
+        projection[field] = 1
+    return projection
+
+
+def encode_cursor(evento):
+    """Cursor opaco con la posición (fecha, _id) del último evento de la página"""
+    position = json.dumps({"f": evento["fecha"].isoformat(), "i": str(evento["_id"])})
+    return base64.urlsafe_b64encode(position.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    try:
+        position = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        return datetime.fromisoformat(position["f"]), ObjectId(position["i"])
+    except Exception:
+        raise ValueError("Cursor inválido")
+
+
+def after_cursor(fecha, event_id):
+    """Condición para los eventos posteriores al cursor en el orden (fecha, _id) descendente"""
+    return {"$or": [
+        {"fecha": {"$lt": fecha}},
+        {"fecha": fecha, "_id": {"$lt": event_id}}
+    ]}
+
+
+def export_events(cursor, fmt):
+    """Serializa los eventos por lotes de AUDIT_EXPORT_BATCH: NDJSON (un evento por línea) o array JSON"""
+    dumps = app.json.dumps
+    separator = ''
+    try:
+        if fmt == 'json':
+            yield '['
+        while True:
+            eventos = list(itertools.islice(cursor, AUDIT_EXPORT_BATCH))
+            if not eventos:
+                break
+            if fmt == 'json':
+                yield separator + ','.join(dumps(evento) for evento in eventos)
+                separator = ','
+            else:
+                yield ''.join(dumps(evento) + '\n' for evento in eventos)
+        if fmt == 'json':
+            yield ']'
+    except PyMongoError as e:
+        # Los headers ya se enviaron: la salida queda truncada (JSON sin cerrar)
+        print(f"Exportación de auditoría interrumpida: {e}")
+
+
+def time_window(query):
+    """(desde, hasta) del filtro de fecha, para elegir las particiones"""
+    rango = query.get("fecha", {})
+    return rango.get("$gte"), rango.get("$lt")
+
+
+def page_limit(value):
+    try:
+        limit = int(value) if value else AUDIT_PAGE_DEFAULT
+    except ValueError:
+        raise ValueError("Parámetro limit inválido")
+    return max(1, min(limit, AUDIT_PAGE_MAX))
+
+# -----------------------------------------------------------
+# Particiones por mes, retención y archivado
+# -----------------------------------------------------------
+AUDIT_PARTITIONING = os.getenv('AUDIT_PARTITIONING', 'monthly')               # monthly o none (una sola colección)
+AUDIT_RETENTION_DAYS = int(os.getenv('AUDIT_RETENTION_DAYS', 0))               # 0 = sin límite
+AUDIT_ARCHIVE_AFTER_DAYS = int(os.getenv('AUDIT_ARCHIVE_AFTER_DAYS', 0))       # 0 = sin archivado
+AUDIT_ARCHIVE_DIR = os.getenv('AUDIT_ARCHIVE_DIR', 'archive')
+AUDIT_MAINTENANCE_INTERVAL = float(os.getenv('AUDIT_MAINTENANCE_INTERVAL', 3600))
+AUDIT_PARTITION_CACHE_SECONDS = float(os.getenv('AUDIT_PARTITION_CACHE_SECONDS', 30))
+
+AUDIT_COLLECTION = 'audit_logs'  # Colección única (modo none) o histórico previo a las particiones
+PARTITION_PATTERN = re.compile(r'^audit_logs_(\d{4})(\d{2})$')
+MAINTENANCE_OWNER = f"{socket.gethostname()}:{os.getpid()}"
+
+
+def month_start(fecha):
+    # Las fechas sin zona (p. ej. leídas del spill) están en UTC
+    fecha = fecha.astimezone(timezone.utc) if fecha.tzinfo else fecha.replace(tzinfo=timezone.utc)
+    return fecha.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def next_month(start):
+    return (start + timedelta(days=32)).replace(day=1)
+
+
+def partition_name(fecha):
+    """Colección donde se guarda un evento según su fecha"""
+    if AUDIT_PARTITIONING != 'monthly' or not isinstance(fecha, datetime):
+        return AUDIT_COLLECTION
+    return f"{AUDIT_COLLECTION}_{month_start(fecha):%Y%m}"
+
+
+def partition_start(name):
+    match = PARTITION_PATTERN.match(name)
+    return datetime(int(match.group(1)), int(match.group(2)), 1, tzinfo=timezone.utc)
+
+
+class PartitionCatalog:
+    """Particiones mensuales existentes (lista cacheada unos segundos) y las ya indexadas por este proceso"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.months = {}      # nombre -> inicio del mes
+        self.legacy = False   # audit_logs aún tiene eventos sin repartir
+        self.loaded_at = None
+        self.prepared = set()
+
+    def refresh(self):
+        names = db.list_collection_names(filter={"name": {"$regex": PARTITION_PATTERN.pattern}})
+        legacy = db[AUDIT_COLLECTION].estimated_document_count() > 0
+        with self.lock:
+            self.months = {name: partition_start(name) for name in names}
+            self.legacy = legacy
+            self.loaded_at = time.monotonic()
+
+    def _load(self):
+        if self.loaded_at is None or time.monotonic() - self.loaded_at > AUDIT_PARTITION_CACHE_SECONDS:
+            self.refresh()
+
+    def between(self, desde=None, hasta=None):
+        """Particiones que se solapan con [desde, hasta), de la más antigua a la más reciente"""
+        if AUDIT_PARTITIONING != 'monthly':
+            return []
+        self._load()
+        with self.lock:
+            months = sorted(self.months.items(), key=lambda item: item[1])
+        return [
+            name for name, start in months
+            if (hasta is None or start < hasta) and (desde is None or next_month(start) > desde)
+        ]
+
+    def legacy_active(self):
+        if AUDIT_PARTITIONING != 'monthly':
+            return True
+        self._load()
+        return self.legacy
+
+    def writer(self, name):
+        """Colección con el write concern configurado; la primera vez en el proceso crea sus índices"""
+        if name not in self.prepared:
+            if AUDIT_MANAGE_INDEXES:
+                prepare_collection(db[name])
+            self.prepared.add(name)
+            if PARTITION_PATTERN.match(name):
+                with self.lock:
+                    self.months[name] = partition_start(name)
+        return db[name].with_options(write_concern=WRITE_CONCERN)
+
+    def forget(self, name):
+        with self.lock:
+            self.months.pop(name, None)
+        self.prepared.discard(name)
+
+
+PARTITIONS = PartitionCatalog()
+
+
+def find_events(query, projection=None, desde=None, hasta=None, descending=True, limit=0):
+    """Eventos de todas las particiones del rango en orden (fecha, _id).
+
+    Las mensuales no se solapan: se encadenan y cada una se consulta solo cuando la anterior se agota,
+    así una página de los eventos recientes toca una o dos colecciones. El histórico sin repartir
+    (audit_logs) se mezcla ordenado con ellas."""
+    sort = AUDIT_SORT if descending else [(field, ASCENDING) for field, _ in AUDIT_SORT]
+
+    def find(name):
+        return db[name].find(query, projection).sort(sort).limit(limit).batch_size(AUDIT_EXPORT_BATCH)
+
+    names = PARTITIONS.between(desde, hasta)
+    if descending:
+        names.reverse()
+    streams = [itertools.chain.from_iterable(find(name) for name in names)]
+    if PARTITIONS.legacy_active():
+        streams.append(find(AUDIT_COLLECTION))
+    return heapq.merge(*streams, key=lambda evento: (evento["fecha"], evento["_id"]), reverse=descending)
+
+
+def find_event(event_id):
+    """Busca un evento por _id en la partición del instante en que se generó (y la anterior, por el borde de mes)"""
+    generated = event_id.generation_time
+    names = dict.fromkeys([partition_name(generated), partition_name(generated - timedelta(minutes=1))])
+    if PARTITIONS.legacy_active():
+        names[AUDIT_COLLECTION] = None
+    for name in names:
+        evento = db[name].find_one({"_id": event_id})
+        if evento is not None:
+            return evento
+    return None
+
+
+def acquire_maintenance_lease():
+    """Solo un proceso (de cualquier worker o réplica) hace el mantenimiento en cada intervalo"""
+    now = datetime.now(timezone.utc)
+    try:
+        db.audit_maintenance.find_one_and_update(
+            {"_id": "lease", "$or": [{"expires": {"$lt": now}}, {"owner": MAINTENANCE_OWNER}]},
+            {"$set": {"owner": MAINTENANCE_OWNER, "expires": now + timedelta(seconds=AUDIT_MAINTENANCE_INTERVAL)}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        return False
+    return True
+
+
+def migrate_legacy():
+    """Mueve los eventos de audit_logs a su partición mensual, un mes cada vez ($merge + delete_many)"""
+    legacy = db[AUDIT_COLLECTION]
+    while True:
+        oldest = legacy.find_one({"fecha": {"$type": "date"}}, {"fecha": 1}, sort=[("fecha", ASCENDING)])
+        if oldest is None:
+            return
+        start = month_start(oldest["fecha"])
+        month = {"fecha": {"$gte": start, "$lt": next_month(start)}}
+        name = partition_name(start)
+        PARTITIONS.writer(name)
+        legacy.aggregate([
+            {"$match": month},
+            {"$merge": {"into": name, "on": "_id", "whenMatched": "keepExisting", "whenNotMatched": "insert"}}
+        ])
+        moved = legacy.delete_many(month).deleted_count
+        print(f"Auditoría: {moved} eventos de {AUDIT_COLLECTION} movidos a {name}")
+
+
+def archive_partition(name):
+    """Escribe la partición en AUDIT_ARCHIVE_DIR como NDJSON comprimido (JSON extendido, apto para mongoimport)"""
+    os.makedirs(AUDIT_ARCHIVE_DIR, exist_ok=True)
+    path = os.path.join(AUDIT_ARCHIVE_DIR, f"{name}.ndjson.gz")
+    if os.path.exists(path):
+        # Eventos tardíos de un mes ya archivado: van a un archivo aparte
+        path = os.path.join(AUDIT_ARCHIVE_DIR, f"{name}.{int(time.time())}.ndjson.gz")
+    temporary = f"{path}.tmp"
+    cursor = db[name].find({}, sort=[("fecha", ASCENDING), ("_id", ASCENDING)]).batch_size(AUDIT_EXPORT_BATCH)
+    written = 0
+    with open(temporary, 'wb') as raw:
+        with gzip.GzipFile(fileobj=raw, mode='wb') as compressed:
+            while True:
+                eventos = list(itertools.islice(cursor, AUDIT_EXPORT_BATCH))
+                if not eventos:
+                    break
+                compressed.write(''.join(json_util.dumps(evento) + '\n' for evento in eventos).encode())
+                written += len(eventos)
+        raw.flush()
+        os.fsync(raw.fileno())
+    # Si llegaron eventos mientras se archivaba no se borra: se reintenta en el siguiente ciclo
+    if db[name].count_documents({}) != written:
+        os.remove(temporary)
+        raise RuntimeError(f"{name} cambió durante el archivado")
+    os.replace(temporary, path)
+    return path, written
+
+
+def run_maintenance():
+    """Reparte el histórico, archiva y borra las particiones vencidas"""
+    if not acquire_maintenance_lease():
+        return
+    migrate_legacy()
+    PARTITIONS.refresh()
+    now = datetime.now(timezone.utc)
+    for name in PARTITIONS.between():
+        end = next_month(partition_start(name))
+        expired = AUDIT_RETENTION_DAYS and end <= now - timedelta(days=AUDIT_RETENTION_DAYS)
+        archivable = AUDIT_ARCHIVE_AFTER_DAYS and end <= now - timedelta(days=AUDIT_ARCHIVE_AFTER_DAYS)
+        if not (expired or archivable):
+            if AUDIT_MANAGE_INDEXES:
+                # Una partición recreada por eventos tardíos puede haber nacido sin índices en otro worker
+                prepare_collection(db[name])
+            continue
+        if AUDIT_ARCHIVE_AFTER_DAYS:
+            path, written = archive_partition(name)
+            print(f"Auditoría: {name} archivada en {path} ({written} eventos)")
+        db.drop_collection(name)
+        PARTITIONS.forget(name)
+        print(f"Auditoría: partición {name} eliminada")
+
+
+def maintenance_loop(stop):
+    # La primera pasada espera un poco: con preload el master importa la app y se detiene antes del fork
+    delay = min(60, AUDIT_MAINTENANCE_INTERVAL)
+    while not stop.wait(delay):
+        delay = AUDIT_MAINTENANCE_INTERVAL
+        if db is None:
+            continue
+        try:
+            run_maintenance()
+        except Exception as e:
+            print(f"Error en el mantenimiento de particiones de auditoría: {e}")
+
+
+maintenance_stop = None
+
+
+def start_maintenance():
+    global maintenance_stop
+    if AUDIT_PARTITIONING == 'monthly':
+        maintenance_stop = threading.Event()
+        threading.Thread(target=maintenance_loop, args=(maintenance_stop,), name='audit-maintenance', daemon=True).start()
+
+
+def stop_maintenance():
+    global maintenance_stop
+    if maintenance_stop is not None:
+        maintenance_stop.set()
+        maintenance_stop = None
+
+# -----------------------------------------------------------
+# Estadísticas: rollups por minuto, hora y día
+# -----------------------------------------------------------
+AUDIT_ROLLUPS_ENABLED = os.getenv('AUDIT_ROLLUPS_ENABLED', 'True') == 'True'
+AUDIT_STATS_MAX_ROWS = int(os.getenv('AUDIT_STATS_MAX_ROWS', 5000))
+
+# Días que se conserva cada granularidad (0 = sin límite); el TTL lo aplica Mongo
+ROLLUP_RETENTION_DAYS = {
+    'minute': int(os.getenv('AUDIT_ROLLUP_MINUTE_DAYS', 7)),
+    'hour': int(os.getenv('AUDIT_ROLLUP_HOUR_DAYS', 90)),
+    'day': int(os.getenv('AUDIT_ROLLUP_DAY_DAYS', 0)),
+}
+ROLLUP_TRUNCATE = {
+    'minute': lambda fecha: fecha.replace(second=0, microsecond=0),
+    'hour': lambda fecha: fecha.replace(minute=0, second=0, microsecond=0),
+    'day': lambda fecha: fecha.replace(hour=0, minute=0, second=0, microsecond=0),
+}
+ROLLUP_STEP = {'minute': timedelta(minutes=1), 'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+# Dimensiones de cada contador: acción × usuario × estado (details.status), más la IP para las consultas por origen
+ROLLUP_DIMENSIONS = ('action', 'user_id', 'status', 'ip')
+# Valor guardado para una dimensión ausente: $merge rechaza claves "on" nulas o inexistentes (error 51132)
+ROLLUP_MISSING = ''
+
+
+def rollup_collection(granularity):
+    return db[f"audit_rollup_{granularity}"]
+
+
+def prepare_rollups():
+    """Índice único por (bucket, dimensiones) para los upsert y TTL por granularidad"""
+    for granularity, days in ROLLUP_RETENTION_DAYS.items():
+        indexes = [IndexModel([("bucket", ASCENDING)] + [(dim, ASCENDING) for dim in ROLLUP_DIMENSIONS], unique=True)]
+        if days:
+            indexes.append(IndexModel([("bucket", ASCENDING)], expireAfterSeconds=days * 86400))
+        rollup_collection(granularity).create_indexes(indexes)
+
+
+def rollup_key(evento):
+    details = evento.get("details")
+    status = details.get("status") if isinstance(details, dict) else None
+    key = (evento.get("action"), evento.get("user_id"), status, evento.get("ip"))
+    return tuple(ROLLUP_MISSING if value is None else value for value in key)
+
+
+def record_rollups(eventos):
+    """Suma los eventos ya guardados a los contadores de cada granularidad (un upsert por combinación)"""
+    if not AUDIT_ROLLUPS_ENABLED or db is None or not eventos:
+        return
+    for granularity, truncate in ROLLUP_TRUNCATE.items():
+        counts = Counter()
+        for evento in eventos:
+            try:
+                counts[(truncate(evento["fecha"]),) + rollup_key(evento)] += 1
+            except TypeError:
+                # Valores no hashables (listas, objetos) en las dimensiones: no se agregan
+                continue
+        operations = [
+            UpdateOne(dict(zip(('bucket',) + ROLLUP_DIMENSIONS, key)), {"$inc": {"count": count}}, upsert=True)
+            for key, count in counts.items()
+        ]
+        try:
+            rollup_collection(granularity).bulk_write(operations, ordered=False)
+        except PyMongoError as e:
+            print(f"Error actualizando rollups de auditoría ({granularity}): {e}")
+
+
+def rebuild_rollups(desde, hasta):
+    """Recalcula los rollups de [desde, hasta) desde los eventos con un pipeline y $merge (días completos)"""
+    desde = ROLLUP_TRUNCATE['day'](desde)
+    hasta = ROLLUP_TRUNCATE['day'](hasta - timedelta(microseconds=1)) + ROLLUP_STEP['day']
+    names = PARTITIONS.between(desde, hasta) + ([AUDIT_COLLECTION] if PARTITIONS.legacy_active() else [])
+    if not names:
+        return
+    # $merge necesita un índice único exactamente sobre sus campos "on"
+    prepare_rollups()
+    match = {"$match": {"fecha": {"$gte": desde, "$lt": hasta}}}
+    # Todas las particiones del rango en un solo $group: un bucket nunca queda repartido entre dos $merge
+    union = [{"$unionWith": {"coll": name, "pipeline": [match]}} for name in names[1:]]
+    for granularity in ROLLUP_TRUNCATE:
+        db[names[0]].aggregate([
+            match,
+            *union,
+            {"$group": {
+                "_id": {
+                    "bucket": {"$dateTrunc": {"date": "$fecha", "unit": granularity}},
+                    "action": {"$ifNull": ["$action", ROLLUP_MISSING]},
+                    "user_id": {"$ifNull": ["$user_id", ROLLUP_MISSING]},
+                    "status": {"$ifNull": ["$details.status", ROLLUP_MISSING]},
+                    "ip": {"$ifNull": ["$ip", ROLLUP_MISSING]},
+                },
+                "count": {"$sum": 1}
+            }},
+            {"$project": {"_id": 0, "count": 1, "bucket": "$_id.bucket", **{dim: f"$_id.{dim}" for dim in ROLLUP_DIMENSIONS}}},
+            {"$merge": {
+                "into": rollup_collection(granularity).name,
+                "on": ["bucket", *ROLLUP_DIMENSIONS],
+                "whenMatched": "replace",
+                "whenNotMatched": "insert"
+            }}
+        ], allowDiskUse=True)
+    print(f"Rollups de auditoría recalculados entre {desde.isoformat()} y {hasta.isoformat()}")
+
+
+def stats_query(args):
+    """Granularidad, $match y campos de agrupación de GET /audit/stats"""
+    granularity = args.get('granularity', 'hour')
+    if granularity not in ROLLUP_TRUNCATE:
+        raise ValueError("Parámetro granularity inválido (minute, hour o day)")
+    hasta = parse_fecha(args['hasta'], 'hasta') if args.get('hasta') else datetime.now(timezone.utc)
+    desde = parse_fecha(args['desde'], 'desde') if args.get('desde') else hasta - 60 * ROLLUP_STEP[granularity]
+
+    match = {"bucket": {"$gte": ROLLUP_TRUNCATE[granularity](desde), "$lt": hasta}}
+    for dim in ROLLUP_DIMENSIONS:
+        if args.get(dim):
+            value = args[dim]
+            # Como en user_id: details.status puede ser el código HTTP numérico o un texto ("failed")
+            if dim in ('user_id', 'status') and value.lstrip('-').isdigit():
+                value = {"$in": [int(value), value]}
+            match[dim] = value
+
+    group_by = [field.strip() for field in args.get('group_by', 'bucket').split(',') if field.strip()]
+    unknown = set(group_by) - {'bucket', *ROLLUP_DIMENSIONS}
+    if unknown:
+        raise ValueError(f"Parámetro group_by inválido: {', '.join(sorted(unknown))}")
+    return granularity, desde, hasta, match, group_by
+
+def stats_dimension(field):
+    """Expresión de agrupación: las dimensiones ausentes (ROLLUP_MISSING o null de rollups antiguos) salen como null"""
+    if field == 'bucket':
+        return "$bucket"
+    return {"$cond": [{"$eq": [f"${field}", ROLLUP_MISSING]}, None, f"${field}"]}
+
+# -----------------------------------------------------------
+# Ingesta con buffer (insert_many por lotes)
+# -----------------------------------------------------------
+AUDIT_BUFFER_ENABLED = os.getenv('AUDIT_BUFFER_ENABLED', 'True') == 'True'
+AUDIT_BUFFER_SIZE = int(os.getenv('AUDIT_BUFFER_SIZE', 10000))            # Eventos máximos en memoria
+AUDIT_FLUSH_BATCH = int(os.getenv('AUDIT_FLUSH_BATCH', 500))              # Eventos por insert_many
+AUDIT_FLUSH_INTERVAL = float(os.getenv('AUDIT_FLUSH_INTERVAL', 0.5))      # Segundos máximos de un evento en el buffer
+AUDIT_ENQUEUE_TIMEOUT = float(os.getenv('AUDIT_ENQUEUE_TIMEOUT', 0.05))   # Espera con el buffer lleno antes del 503
+AUDIT_WRITE_CONCERN = os.getenv('AUDIT_WRITE_CONCERN', '1')               # w: 0, 1, 2... o majority
+AUDIT_WRITE_JOURNAL = os.getenv('AUDIT_WRITE_JOURNAL', 'False') == 'True'
+AUDIT_WRITE_TIMEOUT_MS = int(os.getenv('AUDIT_WRITE_TIMEOUT_MS', 5000))
+AUDIT_SPILL_DIR = os.getenv('AUDIT_SPILL_DIR', 'spill')                  # NDJSON con lo que Mongo no aceptó
+AUDIT_RETRY_INTERVAL = float(os.getenv('AUDIT_RETRY_INTERVAL', 10))       # Reconexión y reintento del spill
+AUDIT_PENDING_WINDOW = float(os.getenv('AUDIT_PENDING_WINDOW', 60))       # Segundos en que un _id no encontrado se da por pendiente
+
+DUPLICATE_KEY = 11000
+
+WRITE_CONCERN = WriteConcern(
+    w=int(AUDIT_WRITE_CONCERN) if AUDIT_WRITE_CONCERN.isdigit() else AUDIT_WRITE_CONCERN,
+    j=AUDIT_WRITE_JOURNAL or None,
+    wtimeout=AUDIT_WRITE_TIMEOUT_MS
+)
+
+
+def insert_partition(collection, eventos):
+    """insert_many sin orden en una colección; devuelve (insertados, writeErrors de los rechazados).
+    Los duplicados ya estaban guardados: no son error ni se vuelven a contar en los rollups"""
+    try:
+        collection.insert_many(eventos, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get('writeConcernErrors', []):
+            print(f"Write concern no confirmado en auditoría: {error.get('errmsg')}")
+        write_errors = e.details.get('writeErrors', [])
+        errors = [error for error in write_errors if error.get('code') != DUPLICATE_KEY]
+        for error in errors:
+            print(f"Evento de auditoría rechazado por MongoDB: {error.get('errmsg')}")
+        failed = {error['index'] for error in write_errors}
+        return [evento for index, evento in enumerate(eventos) if index not in failed], errors
+    return eventos, []
+
+
+def insert_events(eventos):
+    """Inserta cada evento en su partición y suma los insertados a los rollups;
+    devuelve los writeErrors de los rechazados con 'index' relativo a eventos"""
+    positions = {}
+    for position, evento in enumerate(eventos):
+        positions.setdefault(partition_name(evento["fecha"]), []).append(position)
+    errors = []
+    for name, indexes in positions.items():
+        inserted, rejected = insert_partition(PARTITIONS.writer(name), [eventos[i] for i in indexes])
+        record_rollups(inserted)
+        errors.extend(dict(error, index=indexes[error['index']]) for error in rejected)
+    return errors
+
+
+class AuditBuffer:
+    """Cola acotada de eventos que un hilo vuelca a MongoDB con insert_many"""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=AUDIT_BUFFER_SIZE)
+        self.pending = {}  # event_id -> evento aún no escrito (consultable con GET /audit/<id>)
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(('accepted', 'rejected', 'flushed', 'batches', 'failed', 'spilled', 'replayed'), 0)
+        self.stopping = threading.Event()
+        self.last_retry = 0.0
+        self.spill_path = os.path.join(AUDIT_SPILL_DIR, f'spill-{os.getpid()}.ndjson')
+        self.thread = threading.Thread(target=self._run, name='audit-flusher', daemon=True)
+
+    def start(self):
+        self.thread.start()
+
+    def stop(self, timeout=30):
+        """Vuelca lo que queda en la cola y detiene el hilo"""
+        self.stopping.set()
+        if self.thread.is_alive():
+            self.thread.join(timeout)
+
+    def put(self, evento):
+        """Encola un evento; False si el buffer sigue lleno tras AUDIT_ENQUEUE_TIMEOUT"""
+        event_id = str(evento['_id'])
+        self.pending[event_id] = evento
+        try:
+            self.queue.put(evento, timeout=AUDIT_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            self.pending.pop(event_id, None)
+            self._count('rejected')
+            return False
+        self._count('accepted')
+        return True
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        return {
+            'queued': self.queue.qsize(),
+            'capacity': AUDIT_BUFFER_SIZE,
+            'flush_batch': AUDIT_FLUSH_BATCH,
+            'flush_interval': AUDIT_FLUSH_INTERVAL,
+            'write_concern': WRITE_CONCERN.document,
+            **counters
+        }
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.counters[key] += n
+
+    def _run(self):
+        while not (self.stopping.is_set() and self.queue.empty()):
+            batch = self._collect()
+            if batch:
+                self._flush(batch)
+            self._retry_spill()
+
+    def _collect(self):
+        """Espera el primer evento y junta más hasta AUDIT_FLUSH_BATCH o AUDIT_FLUSH_INTERVAL"""
+        try:
+            batch = [self.queue.get(timeout=AUDIT_FLUSH_INTERVAL)]
+        except queue.Empty:
+            return []
+        deadline = time.monotonic() + AUDIT_FLUSH_INTERVAL
+        while len(batch) < AUDIT_FLUSH_BATCH:
+            remaining = deadline - time.monotonic()
+            try:
+                batch.append(self.queue.get(timeout=remaining) if remaining > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _connected(self):
+        """Reintenta la conexión (como mucho cada AUDIT_RETRY_INTERVAL) si Mongo no estaba al arrancar"""
+        if auditoria_collection is None and time.monotonic() - self.last_retry >= AUDIT_RETRY_INTERVAL:
+            self.last_retry = time.monotonic()
+            connect_mongo()
+        return auditoria_collection is not None
+
+    def _flush(self, batch):
+        try:
+            if not self._connected():
+                raise PyMongoError('sin conexión con MongoDB')
+            failed = len(insert_events(batch))
+            self._count('batches')
+            self._count('flushed', len(batch) - failed)
+            self._count('failed', failed)
+        except PyMongoError as e:
+            print(f"Error volcando auditoría a MongoDB, se guarda en {self.spill_path}: {e}")
+            self._spill(batch)
+        for evento in batch:
+            self.pending.pop(str(evento['_id']), None)
+
+    def _spill(self, eventos):
+        """Añade los eventos al spill de este proceso (NDJSON, fsync) para reintentarlos luego"""
+        try:
+            os.makedirs(AUDIT_SPILL_DIR, exist_ok=True)
+            with open(self.spill_path, 'a', encoding='utf-8') as f:
+                f.write(''.join(json_util.dumps(evento) + '\n' for evento in eventos))
+                f.flush()
+                os.fsync(f.fileno())
+            self._count('spilled', len(eventos))
+        except OSError as e:
+            print(f"No se pudo escribir el spill de auditoría, se pierden {len(eventos)} eventos: {e}")
+            self._count('failed', len(eventos))
+
+    def _retry_spill(self):
+        """Reinserta los spill cuando Mongo responde (el _id fijo evita duplicados)"""
+        if time.monotonic() - self.last_retry < AUDIT_RETRY_INTERVAL or not os.path.isdir(AUDIT_SPILL_DIR):
+            return
+        connected = self._connected()
+        self.last_retry = time.monotonic()
+        if not connected:
+            return
+        for name in sorted(os.listdir(AUDIT_SPILL_DIR)):
+            claimed = self._claim(name)
+            if claimed is None:
+                continue
+            try:
+                # Por lotes de AUDIT_FLUSH_BATCH: un spill grande no se carga entero en memoria
+                with open(claimed, encoding='utf-8') as f:
+                    lines = (line for line in f if line.strip())
+                    while True:
+                        eventos = [json_util.loads(line) for line in itertools.islice(lines, AUDIT_FLUSH_BATCH)]
+                        if not eventos:
+                            break
+                        self._count('failed', len(insert_events(eventos)))
+                        self._count('replayed', len(eventos))
+            except PyMongoError as e:
+                # El archivo reclamado queda en disco y se vuelve a tomar en el siguiente intento
+                print(f"MongoDB sigue sin aceptar el spill de auditoría: {e}")
+                return
+            os.remove(claimed)
+
+    def _claim(self, name):
+        """Toma un spill propio o de un worker que ya terminó (los vivos reintentan los suyos)"""
+        if not name.startswith('spill-') or not name.endswith(('.ndjson', '.replay')):
+            return None
+        try:
+            owner = int(name[len('spill-'):].split('.')[0])
+        except ValueError:
+            return None
+        if owner != os.getpid():
+            try:
+                os.kill(owner, 0)
+                return None
+            except ProcessLookupError:
+                pass
+            except OSError:
+                return None
+        # El rename es atómico: si dos workers reclaman el mismo archivo solo uno lo consigue.
+        # Cada reclamo lleva un nombre nuevo: en POSIX rename sobrescribe el destino y se perdería
+        # un .replay que quedó de un reintento fallido
+        claimed = os.path.join(AUDIT_SPILL_DIR, f'spill-{os.getpid()}.{uuid.uuid4().hex}.replay')
+        try:
+            os.rename(os.path.join(AUDIT_SPILL_DIR, name), claimed)
+        except OSError:
+            return None
+        return claimed
+
+
+audit_buffer = None
+
+
+def event_pending(event_id):
+    """Un evento no encontrado puede estar aún sin escribir: generado hace poco o con spill pendiente"""
+    if not AUDIT_BUFFER_ENABLED:
+        return False
+    age = datetime.now(timezone.utc) - event_id.generation_time
+    if age < timedelta(seconds=AUDIT_PENDING_WINDOW):
+        return True
+    try:
+        return any(name.startswith('spill-') for name in os.listdir(AUDIT_SPILL_DIR))
+    except OSError:
+        return False
+
+
+def start_buffer():
+    """Arranca el hilo de volcado del proceso actual (los hilos no sobreviven al fork)"""
+    global audit_buffer
+    if AUDIT_BUFFER_ENABLED:
+        audit_buffer = AuditBuffer()
+        audit_buffer.start()
+
+
+def stop_buffer():
+    """Vuelca los eventos pendientes antes de salir (o antes del fork en el master)"""
+    global audit_buffer
+    if audit_buffer is not None:
+        audit_buffer.stop()
+        audit_buffer = None
+
+
+connect_mongo()
+start_buffer()
+start_maintenance()
+atexit.register(stop_buffer)
+
+# -----------------------------------------------------------
+# Ingesta masiva (array JSON o NDJSON leídos por bloques)
+# -----------------------------------------------------------
+AUDIT_BULK_MAX_EVENTS = int(os.getenv('AUDIT_BULK_MAX_EVENTS', 100000))      # Eventos máximos por petición
+AUDIT_BULK_CHUNK = int(os.getenv('AUDIT_BULK_CHUNK', 1000))                  # Eventos por insert_many
+AUDIT_BULK_MAX_LINE_BYTES = int(os.getenv('AUDIT_BULK_MAX_LINE_BYTES', 65536))  # Tamaño máximo de un evento
+AUDIT_BULK_READ_BYTES = 65536
+
+NDJSON_MIMETYPES = frozenset({'application/x-ndjson', 'application/ndjson', 'application/jsonl'})
+WHITESPACE = re.compile(r'[ \t\n\r]*')
+MISSING_ACTION = "Faltan campos requeridos (action)"
+INVALID_JSON = "JSON inválido"
+
+
+def build_event(data, ip):
+    """Valida un evento recibido y lo completa: (evento, None) o (None, error)"""
+    if not isinstance(data, dict) or 'action' not in data:
+        return None, MISSING_ACTION
+    return {
+        "action": data['action'],
+        "user_id": data.get('user_id', 'system'), # Default a 'system' si no viene
+        "fecha": datetime.now(timezone.utc),
+        "ip": ip, # Agregamos IP de origen
+        "details": data.get('details', {})
+    }, None
+
+
+def iter_ndjson(stream):
+    """(elemento, error) por cada línea no vacía del body, leído por bloques"""
+    pending, too_long = b'', False
+    while True:
+        chunk = stream.read(AUDIT_BULK_READ_BYTES)
+        lines = (pending + chunk).split(b'\n')
+        pending = lines.pop() if chunk else b''
+        for line in lines:
+            if too_long:
+                # Final de una línea que ya superó el máximo: se descarta entera
+                too_long = False
+                yield None, f"Evento de más de {AUDIT_BULK_MAX_LINE_BYTES} bytes"
+                continue
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line), None
+            except ValueError:
+                yield None, INVALID_JSON
+        if len(pending) > AUDIT_BULK_MAX_LINE_BYTES:
+            pending, too_long = b'', True
+        if not chunk:
+            return
+
+
+class JSONArrayReader:
+    """Recorre los elementos de un array JSON del body por bloques, sin cargarlo entero"""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.decoder = json.JSONDecoder()
+        self.utf8 = codecs.getincrementaldecoder('utf-8')('replace')
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def __iter__(self):
+        """(elemento, None) por elemento; (None, error) y fin si el array está mal formado"""
+        if self._peek() != '[':
+            yield None, "El body debe ser un array JSON o NDJSON"
+            return
+        self.pos += 1
+        if self._peek() == ']':
+            return
+        while True:
+            try:
+                yield self._decode(), None
+            except ValueError as e:
+                yield None, str(e)
+                return
+            separator = self._peek()
+            self.pos += 1
+            if separator == ']':
+                return
+            if separator != ',':
+                yield None, f"{INVALID_JSON}: se esperaba ',' o ']'"
+                return
+
+    def _fill(self):
+        chunk = self.stream.read(AUDIT_BULK_READ_BYTES)
+        self.eof = not chunk
+        self.buffer = self.buffer[self.pos:] + self.utf8.decode(chunk, final=self.eof)
+        self.pos = 0
+
+    def _peek(self):
+        """Siguiente carácter que no es espacio ('' al terminar el body)"""
+        while True:
+            self.pos = WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer) or self.eof:
+                return self.buffer[self.pos:self.pos + 1]
+            self._fill()
+
+    def _decode(self):
+        while True:
+            self._peek()
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except ValueError:
+                if self.eof:
+                    raise ValueError(INVALID_JSON)
+                if len(self.buffer) - self.pos > AUDIT_BULK_MAX_LINE_BYTES:
+                    raise ValueError(f"Evento de más de {AUDIT_BULK_MAX_LINE_BYTES} bytes")
+                self._fill()
+                continue
+            # Un número al final del bloque puede estar cortado: se confirma con más datos
+            if end == len(self.buffer) and not self.eof:
+                self._fill()
+                continue
+            self.pos = end
+            return value
+
+
+def write_bulk_window(window, results):
+    """Inserta los eventos válidos de la ventana y escribe su resultado por índice; (aceptados, rechazados)"""
+    eventos = [evento for _, evento, _ in window if evento is not None]
+    failed = {}
+    if eventos:
+        try:
+            failed = {error['index']: error.get('errmsg', 'Rechazado por MongoDB') for error in insert_events(eventos)}
+        except PyMongoError as e:
+            failed = dict.fromkeys(range(len(eventos)), f"Error al guardar en Mongo: {e}")
+
+    accepted = rejected = 0
+    position = 0
+    for index, evento, error in window:
+        if evento is not None:
+            error = failed.get(position)
+            position += 1
+        if error is None:
+            results.write(json.dumps({"index": index, "event_id": str(evento["_id"])}) + '\n')
+            accepted += 1
+        else:
+            results.write(json.dumps({"index": index, "error": error}) + '\n')
+            rejected += 1
+    window.clear()
+    return accepted, rejected
+
+
+def stream_bulk_response(summary, results):
+    """JSON con el resumen y los resultados leídos del archivo temporal, por bloques de líneas"""
+    results.seek(0)
+    yield json.dumps(summary)[:-1] + ', "results": ['
+    separator = ''
+    while True:
+        lines = [line.rstrip('\n') for line in itertools.islice(results, AUDIT_BULK_CHUNK)]
+        if not lines:
+            break
+        yield separator + ','.join(lines)
+        separator = ','
+    yield ']}'
+    results.close()
+
 # -----------------------------------------------------------
 #  Endpoint para health check (Público para el Gateway)
 # -----------------------------------------------------------
@@ -72,11 +1050,14 @@ def health_check():
     if auditoria_collection is None:
         db_status = 'disconnected'
     
-    return jsonify({
+    health = {
         'status': 'healthy', 
         'db_status': db_status,
         'service': MICROSERVICE_NAME
-    }), 200
+    }
+    if audit_buffer is not None:
+        health['buffer'] = audit_buffer.stats()
+    return jsonify(health), 200
 
 # -----------------------------------------------------------
 # 1️ Endpoint para registrar eventos de auditoría
@@ -84,55 +1065,246 @@ def health_check():
 @app.route('/audit', methods=['POST'])
 @validate_api_key  # <--- PROTEGIDO
 def log_audit():
-    if auditoria_collection is None:
-        return jsonify({"error": "No hay conexión con la base de datos"}), 500
-
-    data = request.get_json()
+    evento, error = build_event(request.get_json(), request.remote_addr)
+    if error:
+        return jsonify({"error": error}), 400
 
-    if not data or 'action' not in data:
-        return jsonify({"error": "Faltan campos requeridos (action)"}), 400
+    # Modo buffer: el _id se genera aquí y el evento se escribe en el siguiente lote
+    if audit_buffer is not None:
+        evento["_id"] = ObjectId()
+        if not audit_buffer.put(evento):
+            return jsonify({"error": "Buffer de auditoría lleno, reintente más tarde"}), 503, {'Retry-After': '1'}
+        return jsonify({"message": "Evento aceptado", "event_id": str(evento["_id"]), "status": "queued"}), 202
 
-    evento = {
-        "action": data['action'],
-        "user_id": data.get('user_id', 'system'), # Default a 'system' si no viene
-        "fecha": datetime.now().isoformat(),
-        "ip": request.remote_addr, # Agregamos IP de origen
-        "details": data.get('details', {})
-    }
+    if auditoria_collection is None:
+        return jsonify({"error": "No hay conexión con la base de datos"}), 500
 
     try:
-        result = auditoria_collection.insert_one(evento)
-        evento["_id"] = str(result.inserted_id)
+        evento["_id"] = ObjectId()
+        errors = insert_events([evento])
+        if errors:
+            return jsonify({"error": f"Error al guardar en Mongo: {errors[0].get('errmsg')}"}), 500
         return jsonify({"message": "Evento registrado", "event": evento}), 201
     except Exception as e:
         return jsonify({"error": f"Error al guardar en Mongo: {str(e)}"}), 500
 
 # -----------------------------------------------------------
-# 2️ Endpoint para listar eventos
+# 2️ Endpoint para registrar eventos en lote (array JSON o NDJSON)
+# -----------------------------------------------------------
+@app.route('/audit/bulk', methods=['POST'])
+@validate_api_key  # <--- PROTEGIDO
+def log_audit_bulk():
+    if request.mimetype in NDJSON_MIMETYPES:
+        items = iter_ndjson(request.stream)
+    elif request.mimetype == 'application/json':
+        items = JSONArrayReader(request.stream)
+    else:
+        return jsonify({"error": "Content-Type debe ser application/json (array) o application/x-ndjson"}), 415
+
+    if auditoria_collection is None:
+        return jsonify({"error": "No hay conexión con la base de datos"}), 500
+
+    # Los resultados por evento van a un archivo temporal: la memoria no crece con el lote
+    results = tempfile.SpooledTemporaryFile(max_size=1024 * 1024, mode='w+', encoding='utf-8')
+    window = []
+    accepted = rejected = 0
+    for index, (data, error) in enumerate(items):
+        if index >= AUDIT_BULK_MAX_EVENTS:
+            window.append((index, None, f"Se superó el máximo de {AUDIT_BULK_MAX_EVENTS} eventos por petición"))
+            break
+        evento = None
+        if error is None:
+            evento, error = build_event(data, request.remote_addr)
+        if evento is not None:
+            evento["_id"] = ObjectId()
+        window.append((index, evento, error))
+        if len(window) >= AUDIT_BULK_CHUNK:
+            ok, failed = write_bulk_window(window, results)
+            accepted, rejected = accepted + ok, rejected + failed
+    ok, failed = write_bulk_window(window, results)
+    accepted, rejected = accepted + ok, rejected + failed
+
+    summary = {"message": "Lote procesado", "total": accepted + rejected, "accepted": accepted, "rejected": rejected}
+    return app.response_class(stream_bulk_response(summary, results), status=200, mimetype='application/json')
+
+# -----------------------------------------------------------
+# 3️ Endpoint para listar eventos
 # -----------------------------------------------------------
 @app.route('/audit', methods=['GET'])
 @validate_api_key  # <--- PROTEGIDO
 def get_audit_logs():
     if auditoria_collection is None:
         return jsonify({"error": "No hay conexión con la base de datos"}), 500
-        
+
     try:
         # Limite opcional para no traer millones de registros
-        limit = int(request.args.get('limit', 100))
-        eventos = list(auditoria_collection.find().sort("fecha", -1).limit(limit))
-        return jsonify({"total": len(eventos), "events": eventos}), 200
+        limit = page_limit(request.args.get('limit'))
+        query = audit_filter(request.args)
+        projection = audit_projection(request.args.get('fields'))
+        desde, hasta = time_window(query)
+        if request.args.get('cursor'):
+            fecha, event_id = decode_cursor(request.args['cursor'])
+            query = {"$and": [query, after_cursor(fecha, event_id)]}
+            # Las particiones posteriores al cursor ya no pueden aportar eventos
+            hasta = min(hasta, fecha + timedelta(milliseconds=1)) if hasta else fecha + timedelta(milliseconds=1)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    try:
+        # Un evento de más indica si hay página siguiente
+        eventos = list(itertools.islice(find_events(query, projection, desde, hasta, limit=limit + 1), limit + 1))
+        next_cursor = encode_cursor(eventos[limit - 1]) if len(eventos) > limit else None
+        eventos = eventos[:limit]
+        return jsonify({"total": len(eventos), "events": eventos, "next_cursor": next_cursor}), 200
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+
+# -----------------------------------------------------------
+# 4️ Endpoint para exportar eventos en streaming (NDJSON o JSON)
+# -----------------------------------------------------------
+@app.route('/audit/export', methods=['GET'])
+@validate_api_key  # <--- PROTEGIDO
+def export_audit_logs():
+    if auditoria_collection is None:
+        return jsonify({"error": "No hay conexión con la base de datos"}), 500
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in EXPORT_MIMETYPES:
+        return jsonify({"error": "Parámetro format inválido (ndjson o json)"}), 400
+    try:
+        query = audit_filter(request.args)
+        projection = audit_projection(request.args.get('fields'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Orden cronológico sobre el mismo índice (fecha, _id) recorrido al revés
+    eventos = find_events(query, projection, *time_window(query), descending=False)
+    return app.response_class(
+        export_events(eventos, fmt),
+        mimetype=EXPORT_MIMETYPES[fmt],
+        headers={'Content-Disposition': f'attachment; filename=audit-export.{fmt}'}
+    )
+
+# -----------------------------------------------------------
+# 5️ Endpoints de estadísticas (rollups)
+# -----------------------------------------------------------
+@app.route('/audit/stats', methods=['GET'])
+@validate_api_key  # <--- PROTEGIDO
+def get_audit_stats():
+    if auditoria_collection is None:
+        return jsonify({"error": "No hay conexión con la base de datos"}), 500
+
+    try:
+        granularity, desde, hasta, match, group_by = stats_query(request.args)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    pipeline = [
+        {"$match": match},
+        {"$group": {"_id": {field: stats_dimension(field) for field in group_by}, "count": {"$sum": "$count"}}},
+        {"$sort": {"_id.bucket": 1} if 'bucket' in group_by else {"count": -1}},
+        {"$limit": AUDIT_STATS_MAX_ROWS},
+        {"$project": {"_id": 0, "count": 1, **{field: f"$_id.{field}" for field in group_by}}}
+    ]
+    try:
+        rows = list(rollup_collection(granularity).aggregate(pipeline))
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    return jsonify({
+        "granularity": granularity,
+        "desde": desde,
+        "hasta": hasta,
+        "group_by": group_by,
+        "total": sum(row["count"] for row in rows),
+        "rows": rows
+    }), 200
+
+
+@app.route('/audit/stats/rebuild', methods=['POST'])
+@validate_api_key  # <--- PROTEGIDO
+def rebuild_audit_stats():
+    if auditoria_collection is None:
+        return jsonify({"error": "No hay conexión con la base de datos"}), 500
+
+    try:
+        desde = parse_fecha(request.args['desde'], 'desde')
+        hasta = parse_fecha(request.args['hasta'], 'hasta')
+    except KeyError:
+        return jsonify({"error": "Faltan parámetros requeridos (desde, hasta)"}), 400
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    # Puede recorrer millones de eventos: se ejecuta en segundo plano
+    def run():
+        try:
+            rebuild_rollups(desde, hasta)
+        except PyMongoError as e:
+            print(f"Error recalculando rollups de auditoría: {e}")
+
+    threading.Thread(target=run, name='audit-rollup-rebuild', daemon=True).start()
+    return jsonify({"message": "Recálculo de rollups iniciado", "desde": desde, "hasta": hasta}), 202
+
+# -----------------------------------------------------------
+# 6️ Endpoint de particiones y archivos
+# -----------------------------------------------------------
+@app.route('/audit/partitions', methods=['GET'])
+@validate_api_key  # <--- PROTEGIDO
+def get_audit_partitions():
+    if auditoria_collection is None:
+        return jsonify({"error": "No hay conexión con la base de datos"}), 500
+
+    try:
+        PARTITIONS.refresh()
+        names = PARTITIONS.between()
+        if PARTITIONS.legacy_active():
+            names.append(AUDIT_COLLECTION)
+        partitions = [{"name": name, "events": db[name].estimated_document_count()} for name in names]
+    except Exception as e:
+        return jsonify({"error": str(e)}), 500
+    archives = sorted(os.listdir(AUDIT_ARCHIVE_DIR)) if os.path.isdir(AUDIT_ARCHIVE_DIR) else []
+    return jsonify({
+        "partitioning": AUDIT_PARTITIONING,
+        "retention_days": AUDIT_RETENTION_DAYS,
+        "archive_after_days": AUDIT_ARCHIVE_AFTER_DAYS,
+        "partitions": partitions,
+        "archives": [name for name in archives if name.endswith('.ndjson.gz')]
+    }), 200
+
+# -----------------------------------------------------------
+# 7️ Endpoint para consultar un evento por id
+# -----------------------------------------------------------
+@app.route('/audit/<event_id>', methods=['GET'])
+@validate_api_key  # <--- PROTEGIDO
+def get_audit_event(event_id):
+    # Aún en el buffer de este worker
+    if audit_buffer is not None and event_id in audit_buffer.pending:
+        return jsonify({"event_id": event_id, "status": "queued"}), 202
+
+    if not ObjectId.is_valid(event_id):
+        return jsonify({"error": "Id de evento inválido"}), 400
+    if auditoria_collection is None:
+        return jsonify({"error": "No hay conexión con la base de datos"}), 500
+
+    try:
+        evento = find_event(ObjectId(event_id))
     except Exception as e:
         return jsonify({"error": str(e)}), 500
+    if evento is None:
+        if event_pending(ObjectId(event_id)):
+            # Puede seguir en el buffer de otro worker o en el spill: aún no se sabe si se guardará
+            return jsonify({"event_id": event_id, "status": "pending"}), 202
+        return jsonify({"error": "Evento no encontrado", "event_id": event_id}), 404
+    return jsonify({"status": "stored", "event": evento}), 200
 
 # -----------------------------------------------------------
-# 3️ Endpoint raíz
+# 8️ Endpoint raíz
 # -----------------------------------------------------------
 @app.route('/')
 def index():
     return jsonify({"service": "Audit Service", "version": "1.0"}), 200
 
 # -----------------------------------------------------------
-# 4️ Ejecutar servidor
+# 9️ Ejecutar servidor
 # -----------------------------------------------------------
 if __name__ == '__main__':
     # Importante: host='0.0.0.0' para que Docker lo exponga correctamente
@@ -0,0 +1,70 @@
+import os
+import sys
+import uuid
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+from pymongo import MongoClient
+from pymongo.errors import PyMongoError
+
+os.environ.setdefault('AUDIT_BUFFER_ENABLED', 'False')
+os.environ.setdefault('AUDIT_PARTITIONING', 'none')
+os.environ.setdefault('AUDIT_MANAGE_INDEXES', 'False')
+os.environ.setdefault('MONGO_URI', 'mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=100')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+# Pruebas contra un mongod real (MongoDB 5+ por $dateTrunc): MONGO_TEST_URI=mongodb://localhost:27017
+MONGO_TEST_URI = os.getenv('MONGO_TEST_URI')
+
+
+def test_stats_status_matches_number_or_text():
+    *_, match, _ = app.stats_query({'status': '500'})
+    assert match['status'] == {"$in": [500, '500']}
+    *_, match, _ = app.stats_query({'status': 'failed'})
+    assert match['status'] == 'failed'
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    if not MONGO_TEST_URI:
+        pytest.skip('MONGO_TEST_URI no definido')
+    client = MongoClient(MONGO_TEST_URI, serverSelectionTimeoutMS=2000, tz_aware=True)
+    try:
+        client.server_info()
+    except PyMongoError as e:
+        pytest.skip(f'MongoDB no disponible: {e}')
+    name = f'audit_test_{uuid.uuid4().hex[:8]}'
+    monkeypatch.setattr(app, 'db', client[name])
+    monkeypatch.setattr(app, 'auditoria_collection', client[name][app.AUDIT_COLLECTION])
+    monkeypatch.setattr(app, 'PARTITIONS', app.PartitionCatalog())
+    yield client[name]
+    client.drop_database(name)
+    client.close()
+
+
+def test_rebuild_rollups_with_missing_dimensions(mongo):
+    fecha = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(days=1)
+    eventos = [
+        {"_id": ObjectId(), "action": "login", "user_id": 1, "fecha": fecha, "ip": None, "details": {}},
+        {"_id": ObjectId(), "action": "login", "user_id": 1, "fecha": fecha, "ip": "10.0.0.1", "details": {"status": 500}},
+        {"_id": ObjectId(), "action": "logout", "user_id": 2, "fecha": fecha, "details": {}},
+    ]
+    app.prepare_rollups()
+    app.insert_events(eventos)
+    # El recálculo reemplaza los mismos contadores que dejaron los upsert incrementales
+    app.rebuild_rollups(fecha, fecha + timedelta(seconds=1))
+
+    rollups = list(app.rollup_collection('day').find({}, {"_id": 0}))
+    assert sorted(r["count"] for r in rollups) == [1, 1, 1]
+    assert {(r["action"], r["status"], r["ip"]) for r in rollups} == {
+        ("login", "", ""), ("login", 500, "10.0.0.1"), ("logout", "", "")
+    }
+
+    client = app.app.test_client()
+    desde = (fecha - timedelta(days=1)).isoformat()
+    response = client.get(f'/audit/stats?granularity=day&status=500&desde={desde}', headers={'X-API-Key': app.API_KEY})
+    assert response.status_code == 200
+    assert response.get_json()["total"] == 1
@@ -0,0 +1,69 @@
+import os
+import sys
+
+import pytest
+from bson import ObjectId
+from pymongo.errors import PyMongoError
+
+# Sin hilos de fondo ni particiones: el buffer se crea a mano en cada prueba
+os.environ.setdefault('AUDIT_BUFFER_ENABLED', 'False')
+os.environ.setdefault('AUDIT_PARTITIONING', 'none')
+os.environ.setdefault('AUDIT_MANAGE_INDEXES', 'False')
+os.environ.setdefault('MONGO_URI', 'mongodb://127.0.0.1:1/?serverSelectionTimeoutMS=100')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import app  # noqa: E402
+
+
+def evento(action):
+    return {"_id": ObjectId(), "action": action, "user_id": 1, "fecha": app.datetime.now(app.timezone.utc),
+            "ip": "127.0.0.1", "details": {}}
+
+
+@pytest.fixture
+def buffer(tmp_path, monkeypatch):
+    monkeypatch.setattr(app, 'AUDIT_SPILL_DIR', str(tmp_path))
+    monkeypatch.setattr(app, 'AUDIT_RETRY_INTERVAL', 0)
+    buffer = app.AuditBuffer()
+    monkeypatch.setattr(buffer, '_connected', lambda: True)
+    return buffer
+
+
+def test_failed_replay_survives_next_spill(buffer, monkeypatch):
+    first, second = evento('primero'), evento('segundo')
+    buffer._spill([first])
+
+    def unavailable(eventos):
+        raise PyMongoError('no disponible')
+    monkeypatch.setattr(app, 'insert_events', unavailable)
+    buffer._retry_spill()
+
+    buffer._spill([second])
+    buffer._retry_spill()
+
+    inserted = []
+    monkeypatch.setattr(app, 'insert_events', lambda eventos: inserted.extend(eventos) or [])
+    buffer._retry_spill()
+
+    assert sorted(e['action'] for e in inserted) == ['primero', 'segundo']
+    assert os.listdir(app.AUDIT_SPILL_DIR) == []
+
+
+def test_replay_streams_spill_in_batches(buffer, monkeypatch):
+    monkeypatch.setattr(app, 'AUDIT_FLUSH_BATCH', 2)
+    buffer._spill([evento(str(i)) for i in range(5)])
+    batches = []
+    monkeypatch.setattr(app, 'insert_events', lambda eventos: batches.append(len(eventos)) or [])
+    buffer._retry_spill()
+    assert batches == [2, 2, 1]
+    assert buffer.stats()['replayed'] == 5
+
+
+def test_unknown_recent_event_is_pending(monkeypatch, tmp_path):
+    monkeypatch.setattr(app, 'AUDIT_BUFFER_ENABLED', True)
+    monkeypatch.setattr(app, 'AUDIT_SPILL_DIR', str(tmp_path))
+    assert app.event_pending(ObjectId())
+    old = ObjectId.from_datetime(app.datetime.now(app.timezone.utc) - app.timedelta(hours=1))
+    assert not app.event_pending(old)
+    (tmp_path / 'spill-1.ndjson').write_text('')
+    assert app.event_pending(old)
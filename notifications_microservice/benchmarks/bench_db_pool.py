@@ -0,0 +1,87 @@
+"""
+Conexión por petición frente al pool de conexiones MySQL bajo carga concurrente.
+
+Para cada número de hilos de BENCH_THREADS ejecuta durante BENCH_DURATION
+segundos el patrón del servicio (pedir conexión, una consulta, close()) con
+get_db_connection, primero abriendo una conexión nueva en cada uso
+(DB_POOL_ENABLED=False) y luego con el pool. Mide operaciones por segundo,
+latencia p50/p99 y conexiones abiertas.
+
+Requiere una base MySQL accesible con las variables del servicio. Con el
+docker-compose del proyecto la base de reservas queda publicada en el 3308:
+    RESERVATION_DB_HOST=127.0.0.1 RESERVATION_DB_PORT=3308 python benchmarks/bench_db_pool.py
+    BENCH_THREADS=1,8,32 DB_POOL_MAX=16 python benchmarks/bench_db_pool.py
+
+Ejecutar desde notifications_microservice/.
+"""
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mail  # noqa: E402
+
+THREAD_COUNTS = [int(n) for n in os.getenv('BENCH_THREADS', '1,4,16').split(',')]
+DURATION = float(os.getenv('BENCH_DURATION', 5))
+DATABASE = os.getenv('BENCH_DATABASE', 'reservation')
+QUERY = os.getenv('BENCH_QUERY', 'SELECT 1')
+
+# ------------------------------------------
+# Carga
+# ------------------------------------------
+
+def worker(deadline, latencies, errors):
+    while time.monotonic() < deadline:
+        start = time.perf_counter()
+        conn = mail.get_db_connection(DATABASE)
+        if conn is None:
+            errors.append(1)
+            continue
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute(QUERY)
+                cursor.fetchall()
+        except Exception:
+            errors.append(1)
+        finally:
+            conn.close()
+        latencies.append(time.perf_counter() - start)
+
+
+def run(pooled, threads):
+    mail.DB_POOL_ENABLED = pooled
+    pool = mail.DB_POOLS['auth' if DATABASE == 'auth' else 'reservation']
+    creadas = pool.stats()['creadas']
+    latencies, errors = [], []
+    deadline = time.monotonic() + DURATION
+    workers = [threading.Thread(target=worker, args=(deadline, latencies, errors)) for _ in range(threads)]
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    latencies.sort()
+    if not latencies:
+        return 0, 0, 0, len(errors), 0
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(int(len(latencies) * 0.99), len(latencies) - 1)] * 1000
+    conexiones = pool.stats()['creadas'] - creadas if pooled else len(latencies) + len(errors)
+    return len(latencies) / DURATION, p50, p99, len(errors), conexiones
+
+
+def main():
+    config = mail.DB_CONFIG_AUTH if DATABASE == 'auth' else mail.DB_CONFIG_RESERVATION
+    print(f"Base: {config['host']}:{config['port']}/{config['database']}  consulta: {QUERY!r}  duración: {DURATION}s  "
+          f"pool: min {mail.DB_POOL_MIN} / max {mail.DB_POOL_MAX}")
+    print(f'{"modo":>10} {"hilos":>6} {"ops/s":>10} {"p50 ms":>8} {"p99 ms":>8} {"errores":>8} {"conexiones":>11}')
+    for threads in THREAD_COUNTS:
+        for pooled in (False, True):
+            ops, p50, p99, errors, conexiones = run(pooled, threads)
+            modo = 'pool' if pooled else 'connect'
+            print(f'{modo:>10} {threads:>6} {ops:>10.0f} {p50:>8.2f} {p99:>8.2f} {errors:>8} {conexiones:>11}')
+    mail.stop_workers()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,135 @@
+"""
+Una sesión SMTP por correo frente a sesiones persistentes en paralelo.
+
+Envía BENCH_MESSAGES correos con BENCH_CHANNELS hilos de dos formas:
+mail.send() por correo (connect/EHLO/QUIT cada vez, como antes) y el
+SMTPPool del servicio con BENCH_CHANNELS sesiones reutilizadas. Mide correos
+por segundo y sesiones abiertas.
+
+Por defecto levanta un servidor SMTP local de depuración que acepta y descarta
+los correos y tarda BENCH_CONNECT_MS en saludar, para simular el costo del
+handshake TLS + login de un proveedor real. Para medir contra otro servidor
+(p. ej. `python -m aiosmtpd -n -l 127.0.0.1:1025`), use BENCH_SMTP=host:puerto.
+
+Ejecutar desde notifications_microservice/:
+    python benchmarks/bench_smtp.py
+    BENCH_CHANNELS=1,4,8 BENCH_CONNECT_MS=150 SMTP_MAX_MESSAGES=50 python benchmarks/bench_smtp.py
+"""
+import os
+import socketserver
+import sys
+import threading
+import time
+
+MESSAGES = int(os.getenv('BENCH_MESSAGES', 400))
+CHANNEL_COUNTS = [int(n) for n in os.getenv('BENCH_CHANNELS', '1,4').split(',')]
+CONNECT_MS = float(os.getenv('BENCH_CONNECT_MS', 50))
+TARGET = os.getenv('BENCH_SMTP')
+
+# ------------------------------------------
+# Servidor SMTP de depuración
+# ------------------------------------------
+
+SESSIONS = {'total': 0}
+
+
+class SinkHandler(socketserver.StreamRequestHandler):
+    """Acepta cualquier correo y lo descarta"""
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        SESSIONS['total'] += 1
+        time.sleep(CONNECT_MS / 1000)
+        self.reply('220 bench')
+        for line in self.rfile:
+            command = line.strip().upper()
+            if command.startswith(b'EHLO'):
+                self.reply('250-bench')
+                self.reply('250 8BITMIME')
+            elif command == b'DATA':
+                self.reply('354 fin con <CRLF>.<CRLF>')
+                for data in self.rfile:
+                    if data == b'.\r\n':
+                        break
+                self.reply('250 ok')
+            elif command == b'QUIT':
+                self.reply('221 bye')
+                return
+            else:
+                self.reply('250 ok')
+
+
+class SinkServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+def start_sink():
+    server = SinkServer(('127.0.0.1', 0), SinkHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return '127.0.0.1', server.server_address[1]
+
+
+if TARGET:
+    HOST, PORT = TARGET.rsplit(':', 1)
+else:
+    HOST, PORT = start_sink()
+
+os.environ.update(MAIL_SERVER=HOST, MAIL_PORT=str(PORT), MAIL_USE_TLS='False', MAIL_USE_SSL='False',
+                  MAIL_USERNAME='', MAIL_PASSWORD='', MAIL_DEFAULT_SENDER='bench@example.com')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import mail  # noqa: E402
+
+DATOS = {'nombre_usuario': 'Bench', 'fecha_inicio': '2026-01-01', 'fecha_fin': '2026-01-02',
+         'descripcion': 'Reserva de prueba', 'estado': 'confirmada'}
+
+# ------------------------------------------
+# Envío
+# ------------------------------------------
+
+def run(channels, send):
+    pending = iter(range(MESSAGES))
+    lock = threading.Lock()
+    errors = []
+
+    def worker():
+        with mail.app.app_context():
+            while True:
+                with lock:
+                    if next(pending, None) is None:
+                        return
+                try:
+                    send(mail.build_notification('destino@example.com', DATOS))
+                except OSError as e:  # Incluye los errores de smtplib
+                    errors.append(e)
+
+    sessions = SESSIONS['total']
+    start = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(channels)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    return MESSAGES / elapsed, SESSIONS['total'] - sessions, len(errors)
+
+
+def main():
+    mail.stop_workers()
+    servidor = f'{HOST}:{PORT}' if TARGET else f'local (saludo {CONNECT_MS:.0f} ms)'
+    print(f'Servidor: {servidor}  correos: {MESSAGES}  máx. por sesión: {mail.SMTP_MAX_MESSAGES}  ritmo: {mail.SMTP_RATE_LIMIT or "sin límite"}')
+    print(f'{"modo":>12} {"canales":>8} {"correos/s":>10} {"sesiones":>9} {"errores":>8}')
+    for channels in CHANNEL_COUNTS:
+        throughput, sessions, errors = run(channels, mail.mail.send)
+        print(f'{"por correo":>12} {channels:>8} {throughput:>10.1f} {sessions if not TARGET else "-":>9} {errors:>8}')
+        pool = mail.SMTPPool(channels)
+        throughput, sessions, errors = run(channels, pool.send)
+        pool.close()
+        print(f'{"persistente":>12} {channels:>8} {throughput:>10.1f} {sessions if not TARGET else "-":>9} {errors:>8}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,51 @@
+"""
+Configuración de gunicorn para producción del servicio de notificaciones.
+
+gunicorn la carga automáticamente desde el directorio de trabajo:
+    gunicorn mail:app
+
+Recarga elegante (workers nuevos, los actuales terminan sus peticiones):
+    kill -HUP <pid del master>
+Con GUNICORN_PRELOAD=True, HUP no recarga el código: use USR2 + QUIT.
+"""
+import os
+
+bind = f"0.0.0.0:{os.getenv('PORT', 5000)}"
+
+workers = int(os.getenv('GUNICORN_WORKERS', 4))
+# Los envíos de correo esperan al servidor SMTP: los hilos mantienen ocupado el proceso
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# El código se importa una vez en el master y los workers lo comparten (copy-on-write)
+preload_app = os.getenv('GUNICORN_PRELOAD', 'True') == 'True'
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 120))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 0))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 0))
+
+accesslog = os.getenv('GUNICORN_ACCESS_LOG', '-') or None
+errorlog = '-'
+
+
+# Sin preload cada worker importa la app y arranca su pool de envío: los hooks de arranque no hacen nada
+
+def when_ready(server):
+    # El master no atiende peticiones: sus hilos de envío no deben heredarse
+    if server.cfg.preload_app:
+        import mail
+        mail.stop_workers()
+
+
+def post_fork(server, worker):
+    if server.cfg.preload_app:
+        import mail
+        mail.init_worker()
+
+
+def worker_exit(server, worker):
+    # Los correos que quedan en la cola del worker pasan a dead-letter (recarga, max_requests, apagado)
+    import mail
+    mail.stop_workers()
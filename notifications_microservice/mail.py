@@ -1,9 +1,21 @@
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response
 from flask_mail import Mail, Message
 import pymysql
+import pymysql.cursors
 from functools import wraps
-from datetime import datetime
+from datetime import date, datetime, timezone
+from collections import OrderedDict, deque
+import atexit
+import heapq
+import itertools
+import json
 import os
+import queue
+import random
+import smtplib
+import threading
+import time
+import uuid
 
 app = Flask(__name__)
 
@@ -67,8 +79,191 @@ DB_CONFIG_RESERVATION = {
     'charset': 'utf8mb4'
 }
 
-def get_db_connection(database='reservation'):
+# Pool de conexiones por base de datos (uno por proceso: las conexiones no sobreviven al fork)
+DB_POOL_ENABLED = os.getenv('DB_POOL_ENABLED', 'True') == 'True'
+DB_POOL_MIN = int(os.getenv('DB_POOL_MIN', 1))                        # Conexiones que se abren con el primer uso y se conservan siempre
+DB_POOL_MAX = int(os.getenv('DB_POOL_MAX', 10))                       # Conexiones abiertas máximas por base
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', 5))              # Espera máxima por una conexión libre
+DB_POOL_MAX_LIFETIME = float(os.getenv('DB_POOL_MAX_LIFETIME', 1800))  # Segundos antes de reciclar una conexión
+DB_POOL_IDLE_TIMEOUT = float(os.getenv('DB_POOL_IDLE_TIMEOUT', 300))   # Cierra las libres sobrantes tras este tiempo
+DB_POOL_PING_AFTER = float(os.getenv('DB_POOL_PING_AFTER', 5))        # Ping al sacar una conexión inactiva más de N segundos
+
+
+class PoolTimeout(Exception):
+    """No se liberó ninguna conexión dentro de DB_POOL_TIMEOUT"""
+
+
+class PooledConnection:
+    """Conexión prestada por el pool: close() la devuelve en lugar de cerrarla"""
+
+    def __init__(self, pool, entry):
+        self._pool = pool
+        self._entry = entry
+
+    def __getattr__(self, name):
+        return getattr(self._entry['conn'], name)
+
+    def close(self):
+        if self._entry is not None:
+            self._pool.release(self._entry)
+            self._entry = None
+
+
+class MySQLPool:
+    """Pool de conexiones pymysql seguro entre hilos con tamaño mínimo/máximo, ping y tiempo de vida"""
+
+    def __init__(self, name, config):
+        self.name = name
+        self.config = dict(config, autocommit=True)  # Cada consulta ve datos frescos al reutilizar la conexión
+        self._reset()
+
+    def _reset(self):
+        self.pid = os.getpid()
+        self.idle = deque()  # Conexiones libres; se reutiliza la más reciente y caducan las del otro extremo
+        self.size = 0        # Conexiones abiertas (en uso + libres) o abriéndose
+        self.cond = threading.Condition()
+        self.warmed = False  # Ya se abrieron las DB_POOL_MIN conexiones iniciales en este proceso
+        self.counters = dict.fromkeys(('prestamos', 'creadas', 'cerradas', 'esperas', 'timeouts', 'ping_fallidos'), 0)
+
+    def _check_fork(self):
+        # En un proceso hijo las conexiones heredadas comparten socket con el padre: se abandonan sin cerrarlas
+        if self.pid != os.getpid():
+            self._reset()
+
+    def acquire(self):
+        self._check_fork()
+        if not self.warmed:
+            self._warm()
+        deadline = time.monotonic() + DB_POOL_TIMEOUT
+        entry = None
+        with self.cond:
+            self.counters['prestamos'] += 1
+            while True:
+                if self.idle:
+                    entry = self.idle.pop()
+                    break
+                if self.size < DB_POOL_MAX:
+                    self.size += 1
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters['timeouts'] += 1
+                    raise PoolTimeout(f'Sin conexiones libres en el pool {self.name} tras {DB_POOL_TIMEOUT}s')
+                self.counters['esperas'] += 1
+                self.cond.wait(remaining)
+
+        if entry is not None and not self._healthy(entry):
+            self._discard(entry['conn'])
+            entry = None
+        if entry is None:
+            try:
+                now = time.monotonic()
+                entry = {'conn': pymysql.connect(**self.config), 'creada': now, 'usada': now}
+            except Exception:
+                with self.cond:
+                    self.size -= 1
+                    self.cond.notify()
+                raise
+            self._count('creadas')
+        return PooledConnection(self, entry)
+
+    def _warm(self):
+        """Abre DB_POOL_MIN conexiones en el primer uso del proceso: la primera ráfaga no paga cada conexión"""
+        with self.cond:
+            if self.warmed:
+                return
+            self.warmed = True
+            faltan = max(DB_POOL_MIN - self.size, 0)
+            self.size += faltan
+        for abiertas in range(faltan):
+            try:
+                conn = pymysql.connect(**self.config)
+            except Exception as e:
+                print(f"No se pudieron abrir las conexiones iniciales del pool {self.name}: {e}")
+                with self.cond:
+                    self.size -= faltan - abiertas
+                    self.cond.notify_all()
+                return
+            now = time.monotonic()
+            with self.cond:
+                self.idle.append({'conn': conn, 'creada': now, 'usada': now})
+                self.counters['creadas'] += 1
+                self.cond.notify()
+
+    def release(self, entry):
+        if self.pid != os.getpid():
+            return
+        conn = entry['conn']
+        now = time.monotonic()
+        if not conn.open or now - entry['creada'] >= DB_POOL_MAX_LIFETIME:
+            self._close(conn)
+            return
+        entry['usada'] = now
+        sobrantes = []
+        with self.cond:
+            self.idle.append(entry)
+            while len(self.idle) > DB_POOL_MIN and now - self.idle[0]['usada'] >= DB_POOL_IDLE_TIMEOUT:
+                sobrantes.append(self.idle.popleft()['conn'])
+            self.cond.notify()
+        for conn in sobrantes:
+            self._close(conn)
+
+    def _healthy(self, entry):
+        """Descarta conexiones viejas y hace ping a las que llevan un rato sin usarse"""
+        now = time.monotonic()
+        if now - entry['creada'] >= DB_POOL_MAX_LIFETIME:
+            return False
+        if now - entry['usada'] >= DB_POOL_PING_AFTER:
+            try:
+                entry['conn'].ping(reconnect=False)
+            except Exception:
+                self._count('ping_fallidos')
+                return False
+        return True
+
+    def _discard(self, conn):
+        """Cierra una conexión sin liberar su plaza (se reemplaza enseguida)"""
+        try:
+            conn.close()
+        except Exception:
+            pass
+        self._count('cerradas')
+
+    def _close(self, conn):
+        self._discard(conn)
+        with self.cond:
+            self.size -= 1
+            self.cond.notify()
+
+    def _count(self, key):
+        with self.cond:
+            self.counters[key] += 1
+
+    def stats(self):
+        self._check_fork()
+        with self.cond:
+            return {
+                'abiertas': self.size,
+                'libres': len(self.idle),
+                'en_uso': self.size - len(self.idle),
+                'min': DB_POOL_MIN,
+                'max': DB_POOL_MAX,
+                **self.counters
+            }
+
+
+DB_POOLS = {
+    'auth': MySQLPool('auth', DB_CONFIG_AUTH),
+    'reservation': MySQLPool('reservation', DB_CONFIG_RESERVATION)
+}
+
+
+def get_db_connection(database='reservation', dedicated=False):
+    """Conexión a la base indicada; con el pool activo, close() la devuelve al pool.
+    dedicated=True abre una conexión fuera del pool para sesiones que cambian variables o duran mucho"""
     try:
+        if DB_POOL_ENABLED and not dedicated:
+            return DB_POOLS['auth' if database == 'auth' else 'reservation'].acquire()
         if database == 'auth':
             return pymysql.connect(**DB_CONFIG_AUTH)
         else:
@@ -81,23 +276,90 @@ def get_db_connection(database='reservation'):
 # 4. CORREO FUNCIONES AUXILIARES
 # ==========================================
 
-def get_user_email(user_id):
-    """Obtiene el email del usuario desde la base de datos de autenticación"""
+USER_EMAIL_CACHE_TTL = float(os.getenv('USER_EMAIL_CACHE_TTL', 300))     # Segundos que se recuerda un email
+USER_EMAIL_CACHE_SIZE = int(os.getenv('USER_EMAIL_CACHE_SIZE', 10000))    # Usuarios máximos en caché (LRU)
+USER_EMAIL_BATCH = int(os.getenv('USER_EMAIL_BATCH', 500))                # Ids por consulta IN (...)
+
+
+class EmailCache:
+    """Caché LRU con TTL de user_id -> email compartida entre peticiones (None = usuario sin email)"""
+
+    def __init__(self, ttl, size):
+        self.ttl = ttl
+        self.size = size
+        self.entries = OrderedDict()  # user_id -> (vence, email)
+        self.lock = threading.Lock()
+        self.hits = self.misses = 0
+
+    def get_many(self, user_ids):
+        """Devuelve (encontrados, faltantes)"""
+        encontrados, faltantes = {}, []
+        now = time.monotonic()
+        with self.lock:
+            for user_id in user_ids:
+                entry = self.entries.get(user_id)
+                if entry and entry[0] > now:
+                    self.entries.move_to_end(user_id)
+                    encontrados[user_id] = entry[1]
+                else:
+                    faltantes.append(user_id)
+            self.hits += len(encontrados)
+            self.misses += len(faltantes)
+        return encontrados, faltantes
+
+    def put_many(self, emails):
+        vence = time.monotonic() + self.ttl
+        with self.lock:
+            for user_id, email in emails.items():
+                self.entries[user_id] = (vence, email)
+                self.entries.move_to_end(user_id)
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+    def stats(self):
+        with self.lock:
+            return {'usuarios': len(self.entries), 'capacidad': self.size, 'ttl': self.ttl, 'aciertos': self.hits, 'fallos': self.misses}
+
+
+email_cache = EmailCache(USER_EMAIL_CACHE_TTL, USER_EMAIL_CACHE_SIZE)
+
+
+def lookup_user_emails(user_ids):
+    """
+    Emails de varios usuarios: primero la caché y luego consultas IN (...) de
+    USER_EMAIL_BATCH ids sobre una sola conexión. Devuelve (emails, consultas).
+    """
+    emails, faltantes = email_cache.get_many(dict.fromkeys(user_ids))
+    if not faltantes:
+        return emails, 0
+
     conn = get_db_connection('auth')
     if not conn:
-        return None
-    
+        return emails, 0
+
+    consultas = 0
     try:
         with conn.cursor() as cursor:
-            sql = "SELECT email FROM users WHERE id = %s"
-            cursor.execute(sql, (user_id,))
-            result = cursor.fetchone()
-            return result[0] if result else None
+            for i in range(0, len(faltantes), USER_EMAIL_BATCH):
+                lote = faltantes[i:i + USER_EMAIL_BATCH]
+                sql = f"SELECT id, email FROM users WHERE id IN ({', '.join(['%s'] * len(lote))})"
+                cursor.execute(sql, lote)
+                consultas += 1
+                encontrados = dict.fromkeys(lote)
+                encontrados.update(cursor.fetchall())
+                email_cache.put_many(encontrados)
+                emails.update(encontrados)
     except Exception as e:
-        print(f"Error al obtener email del usuario: {e}")
-        return None
+        print(f"Error al obtener emails de usuarios: {e}")
     finally:
         conn.close()
+    return emails, consultas
+
+
+def get_user_email(user_id):
+    """Obtiene el email del usuario desde la base de datos de autenticación"""
+    emails, _ = lookup_user_emails([user_id])
+    return emails.get(user_id)
 
 def generar_cuerpo_html_por_estado(nombre_usuario, fecha_inicio, fecha_fin, descripcion, estado):
     """Genera el cuerpo HTML del correo según el estado de la reserva"""
@@ -158,7 +420,617 @@ def generar_cuerpo_html_por_estado(nombre_usuario, fecha_inicio, fecha_fin, desc
       """
 
 # ==========================================
-# 5. ENDPOINTS (RUTAS)
+# 5. COLA DE TRABAJOS DE NOTIFICACIÓN
+# ==========================================
+# Los endpoints encolan y responden 202 con un job_id; un pool de hilos por
+# proceso envía los correos. Total de envíos en paralelo = workers de gunicorn × NOTIFY_WORKERS.
+NOTIFY_WORKERS = int(os.getenv('NOTIFY_WORKERS', 4))                    # Hilos de envío por proceso
+NOTIFY_QUEUE_SIZE = int(os.getenv('NOTIFY_QUEUE_SIZE', 10000))           # Mensajes máximos en la cola de cada proceso
+NOTIFY_ENQUEUE_TIMEOUT = float(os.getenv('NOTIFY_ENQUEUE_TIMEOUT', 1))   # Espera máxima si la cola está llena
+NOTIFY_MAX_ATTEMPTS = int(os.getenv('NOTIFY_MAX_ATTEMPTS', 5))           # Intentos antes de pasar a dead-letter
+NOTIFY_BACKOFF_BASE = float(os.getenv('NOTIFY_BACKOFF_BASE', 2))         # Segundos antes del primer reintento (se duplica)
+NOTIFY_BACKOFF_MAX = float(os.getenv('NOTIFY_BACKOFF_MAX', 300))         # Tope de espera entre reintentos
+NOTIFY_JOBS_DIR = os.getenv('NOTIFY_JOBS_DIR', '/tmp/notification_jobs')  # Estado de trabajos compartido entre workers
+NOTIFY_JOB_TTL = int(os.getenv('NOTIFY_JOB_TTL', 86400))                # Segundos que se conserva un trabajo terminado
+NOTIFY_JOB_MAX_ERRORS = int(os.getenv('NOTIFY_JOB_MAX_ERRORS', 100))     # Errores detallados guardados por trabajo
+NOTIFY_JOB_SYNC_INTERVAL = 0.5                                           # Segundos entre escrituras del estado en curso
+NOTIFY_CLEANUP_INTERVAL = 300
+NOTIFY_BROADCAST_CHUNK = int(os.getenv('NOTIFY_BROADCAST_CHUNK', 1000))            # Reservas leídas por bloque
+NOTIFY_BROADCAST_NET_TIMEOUT = int(os.getenv('NOTIFY_BROADCAST_NET_TIMEOUT', 3600))  # Espera de MySQL si la cola está llena
+NOTIFY_STREAM_INTERVAL = float(os.getenv('NOTIFY_STREAM_INTERVAL', 1))             # Segundos entre líneas de progreso NDJSON
+
+DEAD_LETTER_PATH = os.path.join(NOTIFY_JOBS_DIR, 'dead-letter.ndjson')
+
+# Errores SMTP que no se arreglan reintentando (destinatario rechazado)
+PERMANENT_SMTP_ERRORS = (smtplib.SMTPRecipientsRefused,)
+
+# Sesiones SMTP persistentes: el connect/TLS/login se paga una vez por sesión y no por correo
+SMTP_POOL_SIZE = int(os.getenv('SMTP_POOL_SIZE', NOTIFY_WORKERS))          # Sesiones en paralelo por proceso
+SMTP_MAX_MESSAGES = int(os.getenv('SMTP_MAX_MESSAGES', 100))             # Correos por sesión antes de reconectar
+SMTP_IDLE_TIMEOUT = float(os.getenv('SMTP_IDLE_TIMEOUT', 60))            # Reabre la sesión si lleva más tiempo sin uso
+SMTP_RATE_LIMIT = float(os.getenv('SMTP_RATE_LIMIT', 0))                 # Correos por segundo por proceso (0 = sin límite)
+
+# Errores que indican una sesión caída: se reconecta y se reintenta una vez en el acto
+SMTP_SESSION_ERRORS = (smtplib.SMTPServerDisconnected, smtplib.SMTPConnectError, ConnectionError, TimeoutError)
+
+RESERVATION_FIELDS = ('nombre_usuario', 'fecha_inicio', 'fecha_fin', 'descripcion', 'estado')
+
+
+def build_notification(email, datos):
+    """Arma el correo de una reserva (requiere contexto de aplicación)"""
+    asunto = f"Notificación de Reserva - Estado: {datos['estado']}"
+    cuerpo_html = generar_cuerpo_html_por_estado(
+        datos['nombre_usuario'], datos['fecha_inicio'], datos['fecha_fin'], datos['descripcion'], datos['estado']
+    )
+    return Message(subject=asunto, recipients=[email], html=cuerpo_html, charset='utf-8')
+
+
+def job_path(job_id):
+    return os.path.join(NOTIFY_JOBS_DIR, f'{job_id}.json')
+
+
+def load_job(job_id):
+    """Lee el estado guardado de un trabajo (lo escribe el proceso que lo atiende)"""
+    try:
+        job_id = uuid.UUID(job_id).hex
+    except ValueError:
+        return None
+    if notification_queue is not None:
+        job = notification_queue.snapshot(job_id)
+        if job is not None:
+            return job
+    try:
+        with open(job_path(job_id), encoding='utf-8') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_dead_letters(limit):
+    """Últimas entradas de la cola de fallidos"""
+    try:
+        with open(DEAD_LETTER_PATH, encoding='utf-8') as f:
+            return [json.loads(linea) for linea in deque(f, maxlen=limit)]
+    except OSError:
+        return []
+
+
+class SMTPChannel:
+    """Sesión SMTP (Connection de Flask-Mail) reutilizada entre correos y reabierta al fallar"""
+
+    def __init__(self, pool):
+        self.pool = pool
+        self.connection = None
+        self.enviados = 0
+        self.usada = 0.0
+
+    def send(self, msg):
+        """Envía por la sesión abierta; si estaba caída reconecta y reintenta una vez"""
+        for intento in (1, 2):
+            if self.connection is None or time.monotonic() - self.usada >= SMTP_IDLE_TIMEOUT:
+                self.close()
+                self._open()
+            try:
+                self.connection.send(msg)
+            except SMTP_SESSION_ERRORS:
+                self.close(quit=False)
+                if intento == 2:
+                    raise
+                self.pool._count('reconexiones')
+                continue
+            except smtplib.SMTPResponseException as e:
+                if e.smtp_code == 421:  # El servidor cierra la sesión
+                    self.close(quit=False)
+                raise
+            break
+        self.usada = time.monotonic()
+        self.enviados += 1
+        self.pool._count('correos')
+        if self.enviados >= SMTP_MAX_MESSAGES:
+            self.close()
+
+    def _open(self):
+        connection = mail.connect()
+        connection.__enter__()
+        self.connection = connection
+        self.enviados = 0
+        self.usada = time.monotonic()
+        self.pool._count('sesiones')
+
+    def close(self, quit=True):
+        if self.connection is None:
+            return
+        host = self.connection.host
+        self.connection = None
+        if host is None:
+            return
+        try:
+            if quit:
+                host.quit()
+            else:
+                host.close()
+        except (smtplib.SMTPException, OSError):
+            host.close()
+
+
+class SMTPPool:
+    """SMTP_POOL_SIZE sesiones persistentes compartidas por los hilos de envío, con límite de ritmo"""
+
+    def __init__(self, size):
+        self.lock = threading.Lock()
+        self.counters = dict.fromkeys(('correos', 'sesiones', 'reconexiones', 'esperas_ritmo'), 0)
+        self.channels = queue.LifoQueue()  # La última sesión usada sigue caliente
+        for _ in range(size):
+            self.channels.put(SMTPChannel(self))
+        self.size = size
+        self.interval = 1 / SMTP_RATE_LIMIT if SMTP_RATE_LIMIT > 0 else 0
+        self.next_slot = 0.0
+
+    def send(self, msg):
+        """Requiere contexto de aplicación"""
+        self._throttle()
+        channel = self.channels.get()
+        try:
+            channel.send(msg)
+        finally:
+            self.channels.put(channel)
+
+    def _throttle(self):
+        """Reparte los envíos a SMTP_RATE_LIMIT por segundo (sin ráfagas)"""
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            slot = max(self.next_slot, now)
+            self.next_slot = slot + self.interval
+            if slot > now:
+                self.counters['esperas_ritmo'] += 1
+        if slot > now:
+            time.sleep(slot - now)
+
+    def _count(self, key):
+        with self.lock:
+            self.counters[key] += 1
+
+    def close(self):
+        """Cierra las sesiones libres (QUIT)"""
+        while True:
+            try:
+                channel = self.channels.get_nowait()
+            except queue.Empty:
+                break
+            channel.close()
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+        return {
+            'canales': self.size,
+            'max_correos_por_sesion': SMTP_MAX_MESSAGES,
+            'ritmo_max': SMTP_RATE_LIMIT or None,
+            **counters
+        }
+
+
+class NotificationQueue:
+    """Cola acotada de correos que un pool de hilos envía con reintentos y dead-letter"""
+
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=NOTIFY_QUEUE_SIZE)
+        self.jobs = {}        # job_id -> estado de los trabajos activos de este proceso
+        self.saved_at = {}    # job_id -> última escritura del estado en disco
+        self.retries = []     # heap (vence, secuencia, mensaje) de reintentos programados
+        self.sequence = itertools.count()
+        self.lock = threading.Lock()
+        self.save_lock = threading.Lock()
+        self.retry_ready = threading.Condition(self.lock)
+        self.counters = dict.fromkeys(('encolados', 'enviados', 'reintentos', 'fallidos', 'rechazados'), 0)
+        self.stopping = threading.Event()
+        self.smtp = SMTPPool(SMTP_POOL_SIZE)
+        self.threads = [
+            threading.Thread(target=self._work, name=f'notify-worker-{i}', daemon=True)
+            for i in range(NOTIFY_WORKERS)
+        ]
+        self.threads.append(threading.Thread(target=self._schedule, name='notify-retry', daemon=True))
+
+    def start(self):
+        os.makedirs(NOTIFY_JOBS_DIR, exist_ok=True)
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self, timeout=10):
+        """Termina los envíos en curso y pasa lo pendiente a dead-letter"""
+        self.stopping.set()
+        with self.retry_ready:
+            self.retry_ready.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self.threads:
+            if thread.is_alive():
+                thread.join(max(deadline - time.monotonic(), 0))
+        pendientes = [mensaje for _, _, mensaje in self.retries]
+        self.retries = []
+        while True:
+            try:
+                pendientes.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        for mensaje in pendientes:
+            self._dead_letter(mensaje, 'Servicio detenido antes del envío')
+        self.smtp.close()
+
+    # ---------- Trabajos ----------
+
+    def create_job(self, tipo, total=None, **extra):
+        now = datetime.now().isoformat()
+        job = {
+            'job_id': uuid.uuid4().hex,
+            'tipo': tipo,
+            'estado': 'en_cola',
+            'creado': now,
+            'actualizado': now,
+            'total': total,
+            'encolados': 0,
+            'sin_encolar': 0,   # Reservas que nunca entraron en la cola (sin email, cola llena)
+            'enviados': 0,
+            'fallidos': 0,      # Correos encolados que terminaron en dead-letter
+            'reintentos': 0,
+            'errores': [],
+            **extra
+        }
+        with self.lock:
+            self.jobs[job['job_id']] = job
+        self._save(job, force=True)
+        return dict(job)
+
+    def snapshot(self, job_id):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            return json.loads(json.dumps(job)) if job else None
+
+    def fail(self, job_id, id_reserva, error):
+        """Registra una reserva que no se pudo encolar (sin reintento)"""
+        self._update(job_id, 'sin_encolar', {'id_reserva': id_reserva, 'error': error})
+
+    def progress(self, job_id, leidas):
+        """Suma las reservas leídas de un bloque de la difusión"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job['leidas'] += leidas
+            job['estado'] = 'en_proceso'
+            job['actualizado'] = datetime.now().isoformat()
+            job = dict(job, errores=list(job['errores']))
+        self._save(job)
+
+    def finish_planning(self, job_id, error=None, consultas=None):
+        """Fija el total del trabajo cuando ya se encolaron todas sus reservas"""
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            # fallidos no entra: esos correos ya se contaron al encolarlos
+            job['total'] = job['encolados'] + job['sin_encolar']
+            if consultas is not None:
+                job['consultas'] = consultas
+            if error:
+                job['error'] = error
+            job = self._check_done(job)
+        self._save(job, force=True)
+
+    def _update(self, job_id, campo, error=None):
+        with self.lock:
+            job = self.jobs.get(job_id)
+            if job is None:
+                return
+            job[campo] += 1
+            job['estado'] = 'en_proceso'
+            if error and len(job['errores']) < NOTIFY_JOB_MAX_ERRORS:
+                job['errores'].append(error)
+            job = self._check_done(job)
+        self._save(job)
+
+    def _check_done(self, job):
+        """Cierra el trabajo si todas sus reservas terminaron (con el lock tomado)"""
+        job['actualizado'] = datetime.now().isoformat()
+        terminados = job['enviados'] + job['fallidos'] + job['sin_encolar']
+        if job['total'] is not None and terminados >= job['total']:
+            errores = job['fallidos'] or job['sin_encolar'] or job.get('error')
+            job['estado'] = 'con_errores' if errores else 'completado'
+            if job['total'] == 0 and job.get('error'):
+                job['estado'] = 'fallido'
+            self.jobs.pop(job['job_id'], None)
+        return dict(job, errores=list(job['errores']))
+
+    def _save(self, job, force=False):
+        """Escribe el estado para que GET /jobs/<id> responda desde cualquier worker"""
+        job_id = job['job_id']
+        terminado = job['estado'] in ('completado', 'con_errores', 'fallido')
+        with self.save_lock:
+            # Un estado intermedio que llega tarde no pisa al final
+            if not terminado and job_id not in self.jobs:
+                return
+            now = time.monotonic()
+            if not (force or terminado) and now - self.saved_at.get(job_id, 0) < NOTIFY_JOB_SYNC_INTERVAL:
+                return
+            if terminado:
+                self.saved_at.pop(job_id, None)
+            else:
+                self.saved_at[job_id] = now
+            tmp = f'{job_path(job_id)}.{os.getpid()}.tmp'
+            try:
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(job, f, default=str)
+                os.replace(tmp, job_path(job_id))
+            except OSError as e:
+                print(f"No se pudo guardar el estado del trabajo {job_id}: {e}")
+
+    # ---------- Mensajes ----------
+
+    def put(self, job_id, id_reserva, email, datos):
+        """Encola un correo; False si la cola sigue llena tras NOTIFY_ENQUEUE_TIMEOUT"""
+        if self._enqueue(job_id, id_reserva, email, datos):
+            return True
+        self._count('rechazados')
+        return False
+
+    def put_wait(self, job_id, id_reserva, email, datos):
+        """Encola esperando a que haya sitio (difusiones); False si el servicio se detiene"""
+        while not self.stopping.is_set():
+            if self._enqueue(job_id, id_reserva, email, datos):
+                return True
+        return False
+
+    def _enqueue(self, job_id, id_reserva, email, datos):
+        mensaje = {'job_id': job_id, 'id_reserva': id_reserva, 'email': email, 'datos': datos, 'intentos': 0}
+        with self.lock:
+            if job_id in self.jobs:
+                self.jobs[job_id]['encolados'] += 1
+        try:
+            self.queue.put(mensaje, timeout=NOTIFY_ENQUEUE_TIMEOUT)
+        except queue.Full:
+            with self.lock:
+                if job_id in self.jobs:
+                    self.jobs[job_id]['encolados'] -= 1
+            return False
+        self._count('encolados')
+        return True
+
+    def stats(self):
+        with self.lock:
+            counters = dict(self.counters)
+            activos = len(self.jobs)
+            reintentos = len(self.retries)
+        return {
+            'hilos': NOTIFY_WORKERS,
+            'en_cola': self.queue.qsize(),
+            'capacidad': NOTIFY_QUEUE_SIZE,
+            'esperando_reintento': reintentos,
+            'trabajos_activos': activos,
+            'smtp': self.smtp.stats(),
+            **counters
+        }
+
+    def _count(self, key, n=1):
+        with self.lock:
+            self.counters[key] += n
+
+    def _work(self):
+        while not self.stopping.is_set():
+            try:
+                mensaje = self.queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            self._send(mensaje)
+
+    def _send(self, mensaje):
+        mensaje['intentos'] += 1
+        try:
+            with app.app_context():
+                self.smtp.send(build_notification(mensaje['email'], mensaje['datos']))
+        except Exception as e:
+            if isinstance(e, PERMANENT_SMTP_ERRORS) or mensaje['intentos'] >= NOTIFY_MAX_ATTEMPTS:
+                self._dead_letter(mensaje, str(e))
+            else:
+                self._retry_later(mensaje)
+            return
+        self._count('enviados')
+        self._update(mensaje['job_id'], 'enviados')
+
+    def _retry_later(self, mensaje):
+        """Backoff exponencial con jitter: base × 2^(intento-1), hasta NOTIFY_BACKOFF_MAX"""
+        espera = min(NOTIFY_BACKOFF_BASE * 2 ** (mensaje['intentos'] - 1), NOTIFY_BACKOFF_MAX)
+        espera *= random.uniform(0.5, 1)
+        with self.retry_ready:
+            heapq.heappush(self.retries, (time.monotonic() + espera, next(self.sequence), mensaje))
+            self.counters['reintentos'] += 1
+            job = self.jobs.get(mensaje['job_id'])
+            if job is not None:
+                job['reintentos'] += 1
+            self.retry_ready.notify()
+
+    def _schedule(self):
+        """Devuelve a la cola los reintentos vencidos y limpia trabajos viejos"""
+        last_cleanup = 0.0
+        while not self.stopping.is_set():
+            vencidos = []
+            with self.retry_ready:
+                now = time.monotonic()
+                while self.retries and self.retries[0][0] <= now:
+                    vencidos.append(heapq.heappop(self.retries)[2])
+                if not vencidos:
+                    espera = self.retries[0][0] - now if self.retries else 1.0
+                    self.retry_ready.wait(min(espera, 1.0))
+            for mensaje in vencidos:
+                try:
+                    self.queue.put(mensaje, timeout=NOTIFY_ENQUEUE_TIMEOUT)
+                except queue.Full:
+                    with self.retry_ready:
+                        heapq.heappush(self.retries, (time.monotonic() + 1, next(self.sequence), mensaje))
+            if time.monotonic() - last_cleanup >= NOTIFY_CLEANUP_INTERVAL:
+                last_cleanup = time.monotonic()
+                self._cleanup()
+
+    def _dead_letter(self, mensaje, error):
+        """Guarda el correo fallido en NDJSON para revisarlo o reenviarlo a mano"""
+        entrada = {
+            'job_id': mensaje['job_id'],
+            'id_reserva': mensaje['id_reserva'],
+            'email': mensaje['email'],
+            'datos': mensaje['datos'],
+            'intentos': mensaje['intentos'],
+            'error': error,
+            'fecha': datetime.now().isoformat()
+        }
+        try:
+            with open(DEAD_LETTER_PATH, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(entrada, default=str) + '\n')
+        except OSError as e:
+            print(f"No se pudo escribir en dead-letter la reserva {mensaje['id_reserva']}: {e}")
+        self._count('fallidos')
+        self._update(mensaje['job_id'], 'fallidos', {'id_reserva': mensaje['id_reserva'], 'error': error})
+
+    def _cleanup(self):
+        """Borra los estados de trabajos más viejos que NOTIFY_JOB_TTL"""
+        limite = time.time() - NOTIFY_JOB_TTL
+        try:
+            with os.scandir(NOTIFY_JOBS_DIR) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.json') and entry.stat().st_mtime < limite:
+                        os.remove(entry.path)
+        except OSError as e:
+            print(f"Error limpiando trabajos de notificación: {e}")
+
+
+notification_queue = None
+
+
+def start_workers():
+    """Arranca el pool de envío del proceso actual (los hilos no sobreviven al fork)"""
+    global notification_queue
+    notification_queue = NotificationQueue()
+    notification_queue.start()
+
+
+def stop_workers():
+    """Detiene el pool antes de salir (o antes del fork en el master)"""
+    global notification_queue
+    if notification_queue is not None:
+        notification_queue.stop()
+        notification_queue = None
+
+
+def init_worker():
+    """Recursos propios de cada worker de gunicorn (ver gunicorn.conf.py)"""
+    start_workers()
+
+
+def broadcast_filters(args):
+    """Filtros de la difusión desde la query string; ValueError si alguno no es válido"""
+    filtros = {}
+    if args.get('estado'):
+        filtros['estado'] = [estado.strip() for estado in args['estado'].split(',') if estado.strip()]
+    for campo in ('desde', 'hasta'):
+        if args.get(campo):
+            filtros[campo] = date.fromisoformat(args[campo]).isoformat()
+    if args.get('since'):
+        since = datetime.fromisoformat(args['since'].replace('Z', '+00:00'))
+        if since.tzinfo is not None:
+            # updated_at se guarda en UTC sin zona (timezone de Laravel)
+            since = since.astimezone(timezone.utc).replace(tzinfo=None)
+        filtros['since'] = since.isoformat(sep=' ')
+    return filtros
+
+
+def broadcast_where(filtros):
+    """WHERE parametrizado para los filtros de la difusión"""
+    condiciones, params = [], []
+    if filtros.get('estado'):
+        condiciones.append(f"estado IN ({', '.join(['%s'] * len(filtros['estado']))})")
+        params.extend(filtros['estado'])
+    if filtros.get('desde'):
+        condiciones.append("fecha_inicio >= %s")
+        params.append(filtros['desde'])
+    if filtros.get('hasta'):
+        condiciones.append("fecha_inicio <= %s")
+        params.append(filtros['hasta'])
+    if filtros.get('since'):
+        condiciones.append("updated_at > %s")
+        params.append(filtros['since'])
+    return (' WHERE ' + ' AND '.join(condiciones) if condiciones else ''), params
+
+
+def plan_broadcast(job_id, filtros):
+    """
+    Recorre las reservas que cumplen los filtros con un cursor del servidor, por
+    bloques de NOTIFY_BROADCAST_CHUNK, y encola un correo por cada una (hilo propio
+    por difusión). La memoria no crece con la tabla.
+    """
+    cola = notification_queue
+    # Conexión propia: el cursor ocupa la sesión toda la difusión y su net_write_timeout no debe
+    # heredarlo el siguiente préstamo del pool
+    conn_reservation = get_db_connection('reservation', dedicated=True)
+    if not conn_reservation:
+        cola.finish_planning(job_id, 'Error al conectar con la base de datos de reservas')
+        return
+
+    error = None
+    consultas = {'reservas': 0, 'usuarios': 0}
+    where, params = broadcast_where(filtros)
+    try:
+        with conn_reservation.cursor(pymysql.cursors.SSCursor) as cursor:
+            # Con la cola llena dejamos de leer: MySQL no debe cortar el envío de filas mientras tanto
+            cursor.execute("SET SESSION net_write_timeout = %s", (NOTIFY_BROADCAST_NET_TIMEOUT,))
+            sql = "SELECT id, usuario_id, nombre_usuario, fecha_inicio, fecha_fin, descripcion, estado FROM reservas" + where
+            cursor.execute(sql, params)
+            consultas['reservas'] += 1
+
+            while error is None:
+                reservas = cursor.fetchmany(NOTIFY_BROADCAST_CHUNK)
+                if not reservas:
+                    break
+
+                # Un lote de consultas por bloque para los usuarios distintos, no una conexión por reserva
+                emails, consultas_usuarios = lookup_user_emails(reserva[1] for reserva in reservas)
+                consultas['usuarios'] += consultas_usuarios
+
+                for reserva in reservas:
+                    id_reserva, usuario_id = reserva[:2]
+                    user_email = emails.get(usuario_id)
+                    if not user_email:
+                        cola.fail(job_id, id_reserva, 'Usuario sin email')
+                        continue
+                    if not cola.put_wait(job_id, id_reserva, user_email, dict(zip(RESERVATION_FIELDS, reserva[2:]))):
+                        error = 'Servicio detenido antes de encolar todas las reservas'
+                        break
+                cola.progress(job_id, len(reservas))
+    except Exception as e:
+        error = f'Error general: {str(e)}'
+    finally:
+        conn_reservation.close()
+    cola.finish_planning(job_id, error, consultas)
+
+
+def stream_job(job_id):
+    """Una línea NDJSON con el estado del trabajo cada vez que cambia, hasta que termina"""
+    ultimo = None
+    while True:
+        job = load_job(job_id)
+        if job is None:
+            return
+        if job['actualizado'] != ultimo:
+            ultimo = job['actualizado']
+            yield json.dumps(job, default=str) + '\n'
+        if job['estado'] in ('completado', 'con_errores', 'fallido'):
+            return
+        time.sleep(NOTIFY_STREAM_INTERVAL)
+
+
+start_workers()
+atexit.register(stop_workers)
+
+# ==========================================
+# 6. ENDPOINTS (RUTAS)
 # ==========================================
 
 @app.route('/health', methods=['GET'])
@@ -168,7 +1040,10 @@ def health_check():
         'status': 'healthy',
         'service': MICROSERVICE_NAME,
         'version': '1.0.0',
-        'timestamp': datetime.now().isoformat()
+        'timestamp': datetime.now().isoformat(),
+        'cola': notification_queue.stats() if notification_queue else None,
+        'cache_emails': email_cache.stats(),
+        'db_pools': {name: pool.stats() for name, pool in DB_POOLS.items()} if DB_POOL_ENABLED else None
     }), 200
 
 @app.route('/simulate_notification/<int:reservation_id>', methods=['GET'])
@@ -184,58 +1059,33 @@ def simulate_notification(reservation_id):
 @app.route('/send_reservation_notification', methods=['GET'])
 @validate_api_key  # <--- PROTEGIDO: Solo el Gateway puede llamar
 def send_all_reservation_notifications():
-    """Envía notificaciones de todas las reservas existentes."""
-    conn_reservation = get_db_connection('reservation')
-    if not conn_reservation:
-        return jsonify({'mensaje': 'Error al conectar con la base de datos de reservas'}), 500
-
-    enviados = []
-    errores = []
-
+    """
+    Encola las notificaciones de las reservas existentes.
+    Filtros opcionales: estado (lista separada por comas), desde/hasta (fecha_inicio)
+    y since (solo reservas con updated_at posterior). Con format=ndjson la respuesta
+    transmite el progreso del trabajo hasta que termina.
+    """
     try:
-        with conn_reservation.cursor() as cursor:
-            sql = "SELECT id, usuario_id, nombre_usuario, fecha_inicio, fecha_fin, descripcion, estado FROM reservas"
-            cursor.execute(sql)
-            reservas = cursor.fetchall()
+        filtros = broadcast_filters(request.args)
+    except ValueError:
+        return jsonify({'mensaje': 'Filtros inválidos: desde/hasta deben ser fechas ISO y since una fecha y hora ISO'}), 400
 
-            if not reservas:
-                return jsonify({'mensaje': 'No hay reservas registradas'}), 200
+    job = notification_queue.create_job('todas', filtros=filtros, leidas=0)
+    threading.Thread(target=plan_broadcast, args=(job['job_id'], filtros), name='notify-broadcast', daemon=True).start()
 
-            for reserva in reservas:
-                try:
-                    id_reserva, usuario_id, nombre_usuario, fecha_inicio, fecha_fin, descripcion, estado = reserva
-                    user_email = get_user_email(usuario_id)
-
-                    if not user_email:
-                        errores.append({'id_reserva': id_reserva, 'error': 'Usuario sin email'})
-                        continue
-
-                    asunto = f"Notificación de Reserva - Estado: {estado}"
-                    cuerpo_html = generar_cuerpo_html_por_estado(
-                        nombre_usuario, fecha_inicio, fecha_fin, descripcion, estado
-                    )
-
-                    msg = Message(subject=asunto, recipients=[user_email], html=cuerpo_html, charset='utf-8')
-                    mail.send(msg)
-                    enviados.append({'id_reserva': id_reserva, 'email': user_email, 'estado': estado})
-                except Exception as e:
-                    errores.append({'id_reserva': id_reserva, 'error': str(e)})
-
-        return jsonify({
-            'mensaje': f'Notificaciones enviadas: {len(enviados)}',
-            'exitosos': enviados,
-            'errores': errores
-        }), 200
-
-    except Exception as e:
-        return jsonify({'mensaje': f'Error general: {str(e)}'}), 500
-    finally:
-        conn_reservation.close()
+    if request.args.get('format') == 'ndjson':
+        return Response(stream_job(job['job_id']), mimetype='application/x-ndjson')
+    return jsonify({
+        'mensaje': 'Notificaciones de reservas encoladas',
+        'job_id': job['job_id'],
+        'estado': job['estado'],
+        'filtros': filtros
+    }), 202
 
 @app.route('/send_reservation_notification/<int:reservation_id>', methods=['POST'])
 @validate_api_key  # <--- PROTEGIDO: Solo el Gateway puede llamar
 def send_reservation_notification(reservation_id):
-    """Envía notificación de reserva basándose en el ID de reserva"""
+    """Encola la notificación de reserva basándose en el ID de reserva"""
     conn_reservation = get_db_connection('reservation')
     if not conn_reservation:
         return jsonify({'mensaje': 'Error al conectar con la base de datos de reservas'}), 500
@@ -249,7 +1099,8 @@ def send_reservation_notification(reservation_id):
             if not reserva:
                 return jsonify({'mensaje': 'Reserva no encontrada'}), 404
             
-            usuario_id, nombre_usuario, fecha_inicio, fecha_fin, descripcion, estado = reserva
+            usuario_id = reserva[0]
+            datos = dict(zip(RESERVATION_FIELDS, reserva[1:]))
             
     except Exception as e:
         return jsonify({'mensaje': f'Error al obtener información de la reserva: {str(e)}'}), 500
@@ -260,20 +1111,36 @@ def send_reservation_notification(reservation_id):
     if not user_email:
         return jsonify({'mensaje': 'No se pudo obtener el email del usuario'}), 404
     
-    try:
-        asunto = f"Notificación de Reserva - Estado: {estado}"
-        cuerpo_html = generar_cuerpo_html_por_estado(nombre_usuario, fecha_inicio, fecha_fin, descripcion, estado)
-        msg = Message(subject=asunto, recipients=[user_email], html=cuerpo_html, charset='utf-8')
-        mail.send(msg)
-        
-        return jsonify({
-            'mensaje': 'Notificación de reserva enviada exitosamente',
-            'destinatario': user_email,
-            'estado_reserva': estado
-        }), 200
-        
-    except Exception as e:
-        return jsonify({'mensaje': f'Error al enviar la notificación: {str(e)}'}), 500
+    job = notification_queue.create_job('reserva', total=1)
+    if not notification_queue.put(job['job_id'], reservation_id, user_email, datos):
+        notification_queue.fail(job['job_id'], reservation_id, 'Cola de notificaciones llena')
+        return jsonify({'mensaje': 'Cola de notificaciones llena, intente más tarde'}), 503, {'Retry-After': '1'}
+    
+    return jsonify({
+        'mensaje': 'Notificación de reserva encolada',
+        'job_id': job['job_id'],
+        'destinatario': user_email,
+        'estado_reserva': datos['estado']
+    }), 202
+
+@app.route('/jobs/dead_letter', methods=['GET'])
+@validate_api_key  # <--- PROTEGIDO
+def get_dead_letters():
+    """Últimos correos que agotaron sus reintentos"""
+    limit = min(max(request.args.get('limit', 100, type=int), 1), 1000)
+    fallidos = read_dead_letters(limit)
+    return jsonify({'total': len(fallidos), 'fallidos': fallidos}), 200
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@validate_api_key  # <--- PROTEGIDO
+def get_job(job_id):
+    """Estado de un trabajo de notificación encolado (format=ndjson lo sigue hasta que termina)"""
+    job = load_job(job_id)
+    if not job:
+        return jsonify({'mensaje': 'Trabajo no encontrado'}), 404
+    if request.args.get('format') == 'ndjson':
+        return Response(stream_job(job['job_id']), mimetype='application/x-ndjson')
+    return jsonify(job), 200
 
 @app.route('/get_user_email/<int:user_id>', methods=['GET'])
 @validate_api_key  # <--- PROTEGIDO
@@ -286,7 +1153,7 @@ def get_user_email_endpoint(user_id):
         return jsonify({'mensaje': 'Usuario no encontrado'}), 404
 
 # ==========================================
-# 6. EJECUCIÓN LOCAL
+# 7. EJECUCIÓN LOCAL
 # ==========================================
 if __name__ == '__main__':
     app.run(debug=True, host='0.0.0.0', port=5000)
\ No newline at end of file
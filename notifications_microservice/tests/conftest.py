@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Estado de trabajos y dead-letter en un directorio temporal; progreso NDJSON rápido
+os.environ.setdefault('NOTIFY_JOBS_DIR', tempfile.mkdtemp(prefix='notification_jobs_'))
+os.environ.setdefault('NOTIFY_STREAM_INTERVAL', '0.05')
+os.environ.setdefault('NOTIFY_WORKERS', '2')
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,21 @@
+import mail
+
+DATOS = dict.fromkeys(mail.RESERVATION_FIELDS, '')
+
+
+def test_dead_letter_before_finish_planning_completes_job():
+    cola = mail.NotificationQueue()  # Sin hilos: los pasos se ejecutan a mano
+    job_id = cola.create_job('todas', leidas=0)['job_id']
+    cola.put(job_id, 1, 'bueno@example.com', DATOS)
+    cola.put(job_id, 2, 'malo@example.com', DATOS)
+    cola.fail(job_id, 3, 'Usuario sin email')
+
+    primero, segundo = cola.queue.get_nowait(), cola.queue.get_nowait()
+    cola._dead_letter(segundo, 'rechazado')
+    cola._update(job_id, 'enviados')
+    cola.finish_planning(job_id)
+
+    job = mail.load_job(job_id)
+    assert (job['total'], job['encolados'], job['sin_encolar']) == (3, 2, 1)
+    assert (job['enviados'], job['fallidos'], job['estado']) == (1, 1, 'con_errores')
+    assert job_id not in cola.jobs
@@ -0,0 +1,25 @@
+import mail
+
+
+class FakeConnection:
+    open = True
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        self.open = False
+
+
+def test_first_acquire_opens_min_connections(monkeypatch):
+    monkeypatch.setattr(mail, 'DB_POOL_MIN', 3)
+    monkeypatch.setattr(mail.pymysql, 'connect', lambda **config: FakeConnection())
+    pool = mail.MySQLPool('prueba', {})
+
+    conn = pool.acquire()
+    stats = pool.stats()
+    assert (stats['abiertas'], stats['libres'], stats['creadas']) == (3, 2, 3)
+
+    conn.close()
+    pool.acquire()
+    assert pool.stats()['creadas'] == 3
@@ -0,0 +1,65 @@
+import json
+import smtplib
+import threading
+import time
+
+import pytest
+
+import mail
+
+DATOS = dict.fromkeys(mail.RESERVATION_FIELDS, '')
+
+
+class FakeSMTP:
+    """Envía todo salvo los correos a malo@example.com, que el servidor rechaza (error permanente)"""
+
+    def send(self, msg):
+        if 'malo@example.com' in msg.recipients:
+            raise smtplib.SMTPRecipientsRefused({'malo@example.com': (550, b'No existe')})
+
+    def close(self):
+        pass
+
+    def stats(self):
+        return {}
+
+
+@pytest.fixture
+def cola(monkeypatch):
+    cola = mail.notification_queue
+    monkeypatch.setattr(cola, 'smtp', FakeSMTP())
+    return cola
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, 'tiempo agotado'
+        time.sleep(0.01)
+
+
+def test_broadcast_stream_ends_when_a_send_fails(cola, monkeypatch):
+    def plan(job_id, filtros):
+        cola.put_wait(job_id, 1, 'malo@example.com', DATOS)
+        cola.put_wait(job_id, 2, 'bueno@example.com', DATOS)
+        # El dead-letter llega mientras la difusión sigue planificando
+        wait_for(lambda: cola.snapshot(job_id)['fallidos'] == 1 and cola.snapshot(job_id)['enviados'] == 1)
+        cola.progress(job_id, 2)
+        cola.finish_planning(job_id)
+    monkeypatch.setattr(mail, 'plan_broadcast', plan)
+
+    lines = []
+
+    def consume():
+        response = mail.app.test_client().get(
+            '/send_reservation_notification?format=ndjson', headers={'X-API-Key': mail.API_KEY}
+        )
+        lines.extend(json.loads(line) for line in response.get_data(as_text=True).splitlines())
+
+    reader = threading.Thread(target=consume, daemon=True)
+    reader.start()
+    reader.join(10)
+    assert not reader.is_alive(), 'el stream NDJSON no terminó'
+    final = lines[-1]
+    assert final['estado'] == 'con_errores'
+    assert (final['total'], final['enviados'], final['fallidos']) == (2, 1, 1)
@@ -0,0 +1,34 @@
+<?php
+
+use Illuminate\Database\Migrations\Migration;
+use Illuminate\Database\Schema\Blueprint;
+use Illuminate\Support\Facades\Schema;
+
+class AddUpdatedAtIndexToReservasTable extends Migration
+{
+    /**
+     * Run the migrations.
+     *
+     * @return void
+     */
+    public function up(): void
+    {
+        Schema::table('reservas', function (Blueprint $table) {
+            // Las difusiones de notificaciones filtran por updated_at > since
+            $table->index('updated_at');
+        });
+    }
+
+
+    /**
+     * Reverse the migrations.
+     *
+     * @return void
+     */
+    public function down(): void
+    {
+        Schema::table('reservas', function (Blueprint $table) {
+            $table->dropIndex(['updated_at']);
+        });
+    }
+}